@@ -0,0 +1,89 @@
+"""Synthetic data shared by the benchmarks.
+
+Run with `pytest benchmarks --benchmark-json=results.json`, the 100k feature cases are
+marked slow and only run with `-m ""`.
+"""
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from ml_dronebase_data_utils import s3
+from ml_dronebase_data_utils.box_utils import extract_rotated_vertices_batch
+from tests.conftest import TEST_BUCKET, make_ortho, make_panels, mock_aws
+
+BENCH_ORTHO_SIZE = 2048
+FEATURE_COUNTS = [1000, 10000, pytest.param(100000, marks=pytest.mark.slow)]
+
+
+@pytest.fixture(scope="session")
+def bench_dir(tmp_path_factory) -> str:
+    return str(tmp_path_factory.mktemp("benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def bench_ortho(bench_dir: str) -> str:
+    """A GeoTIFF with a real CRS and geotransform."""
+    return make_ortho(os.path.join(bench_dir, "ortho.tif"), size=BENCH_ORTHO_SIZE)
+
+
+@pytest.fixture(scope="session")
+def bench_gdfs():
+    """Synthetic panel GeoDataFrames by feature count, created on first use."""
+    cache = {}
+
+    def get(num_features: int) -> gpd.GeoDataFrame:
+        if num_features not in cache:
+            cache[num_features] = make_panels(num_features, size=BENCH_ORTHO_SIZE)
+        return cache[num_features]
+
+    return get
+
+
+@pytest.fixture(scope="session")
+def bench_geojsons(bench_dir: str, bench_gdfs):
+    """Synthetic GeoJSON files by feature count, written on first use."""
+    cache = {}
+
+    def get(num_features: int) -> str:
+        if num_features not in cache:
+            path = os.path.join(bench_dir, f"panels_{num_features}.geojson")
+            bench_gdfs(num_features).to_file(path, driver="GeoJSON")
+            cache[num_features] = path
+        return cache[num_features]
+
+    return get
+
+
+def make_vertices(num_boxes: int, size: int = BENCH_ORTHO_SIZE, seed: int = 0):
+    """Integer image vertices of rotated panels, as produced by `get_pixel_vertices`."""
+    rng = np.random.default_rng(seed)
+    boxes = np.stack(
+        (
+            rng.uniform(20, size - 20, num_boxes),
+            rng.uniform(20, size - 20, num_boxes),
+            rng.uniform(4, 8, num_boxes),
+            rng.uniform(10, 16, num_boxes),
+            rng.uniform(-90, 90, num_boxes),
+        ),
+        axis=1,
+    )
+    return np.round(extract_rotated_vertices_batch(boxes)).astype(np.int64)
+
+
+@pytest.fixture
+def bench_s3(monkeypatch):
+    """An in-process S3 stand-in, nothing goes over the network."""
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3._get_client.cache_clear()
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=TEST_BUCKET)
+        yield client
+    s3._get_client.cache_clear()
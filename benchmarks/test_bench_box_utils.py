@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ml_dronebase_data_utils.box_utils import (
+    BoxIndex,
+    box_iou_pairs,
+    extract_rotated_vertices_batch,
+    nms,
+    vertices_to_boxes,
+    vertices_to_rotated_boxes,
+)
+
+from .conftest import FEATURE_COUNTS, make_vertices
+
+
+@pytest.mark.benchmark(group="vertices_to_boxes")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_vertices_to_boxes(benchmark, num_boxes: int):
+    vertices = make_vertices(num_boxes)
+    boxes = benchmark(vertices_to_boxes, vertices)
+    assert boxes.shape == (num_boxes, 4)
+
+
+@pytest.mark.benchmark(group="vertices_to_rotated_boxes")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_vertices_to_rotated_boxes(benchmark, num_boxes: int):
+    vertices = make_vertices(num_boxes)
+    boxes = benchmark(vertices_to_rotated_boxes, vertices)
+    assert boxes.shape == (num_boxes, 5)
+
+
+@pytest.mark.benchmark(group="extract_rotated_vertices")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_extract_rotated_vertices_batch(benchmark, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    vertices = benchmark(extract_rotated_vertices_batch, boxes, "XYXYA_ABS")
+    assert vertices.shape == (num_boxes, 4, 2)
+
+
+@pytest.mark.benchmark(group="box_index")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_box_index_query_batch(benchmark, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    col, row = np.meshgrid(np.arange(0, 2048, 256), np.arange(0, 2048, 256))
+    windows = np.stack((col, row, col + 256, row + 256), axis=-1).reshape(-1, 4)
+
+    def build_and_query():
+        return BoxIndex(boxes).query_batch(windows)
+
+    window_ids, _ = benchmark(build_and_query)
+    assert len(window_ids) >= num_boxes
+
+
+@pytest.mark.benchmark(group="iou")
+@pytest.mark.parametrize("rotated", [False, True])
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_box_iou_pairs(benchmark, num_boxes: int, rotated: bool):
+    vertices = make_vertices(num_boxes)
+    boxes = (
+        vertices_to_rotated_boxes(vertices) if rotated else vertices_to_boxes(vertices)
+    )
+    benchmark.pedantic(box_iou_pairs, args=(boxes,), rounds=3)
+
+
+@pytest.mark.benchmark(group="nms")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_nms_rotated(benchmark, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    scores = np.random.default_rng(0).uniform(size=num_boxes)
+    keep = benchmark.pedantic(nms, args=(boxes, scores), rounds=3)
+    assert 0 < len(keep) <= num_boxes
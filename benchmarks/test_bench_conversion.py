@@ -0,0 +1,109 @@
+import os
+
+import geopandas as gpd
+import pytest
+import rasterio
+
+from ml_dronebase_data_utils.convert_geojson import (
+    geo_to_voc,
+    get_annotations,
+    get_array_pixel_vertices,
+    get_pixel_vertices,
+    read_geo_arrays,
+    resolve_classes,
+)
+
+from .conftest import FEATURE_COUNTS
+
+CLASS_MAPPING = {0: "Normal", 1: "Diode", 2: "Hot Cell"}
+
+
+@pytest.mark.benchmark(group="read_geojson")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_read_geojson(benchmark, bench_geojsons, num_features: int):
+    path = bench_geojsons(num_features)
+    gdf = benchmark.pedantic(gpd.read_file, args=(path,), rounds=3)
+    assert len(gdf) == num_features
+
+
+@pytest.mark.benchmark(group="read_geojson")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_read_geo_arrays(benchmark, bench_geojsons, num_features: int):
+    path = bench_geojsons(num_features)
+    arrays = benchmark.pedantic(read_geo_arrays, args=(path,), rounds=3)
+    assert len(arrays.parts) == num_features
+
+
+@pytest.mark.benchmark(group="get_pixel_vertices")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_get_pixel_vertices(benchmark, bench_ortho, bench_gdfs, num_features: int):
+    gdf = bench_gdfs(num_features)
+    with rasterio.open(bench_ortho) as ortho:
+        vertices = benchmark(get_pixel_vertices, ortho, gdf)
+    assert vertices.shape == (num_features, 4, 2)
+
+
+@pytest.mark.benchmark(group="get_pixel_vertices")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_get_array_pixel_vertices(
+    benchmark, bench_ortho, bench_geojsons, num_features: int
+):
+    arrays = read_geo_arrays(bench_geojsons(num_features))
+    with rasterio.open(bench_ortho) as ortho:
+        vertices = benchmark(get_array_pixel_vertices, ortho, arrays)
+    assert vertices.shape == (num_features, 4, 2)
+
+
+@pytest.mark.benchmark(group="resolve_classes")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_resolve_classes(benchmark, bench_gdfs, num_features: int):
+    values = bench_gdfs(num_features)["class_id"]
+    keep, _ = benchmark(resolve_classes, values, [3], CLASS_MAPPING)
+    assert 0 < keep.sum() < num_features
+
+
+@pytest.mark.benchmark(group="get_annotations")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_get_annotations_skip_classes(
+    benchmark, bench_ortho, bench_gdfs, num_features: int
+):
+    gdf = bench_gdfs(num_features)
+    with rasterio.open(bench_ortho) as ortho:
+        vertices, _ = benchmark(
+            get_annotations, ortho, gdf, "class_id", CLASS_MAPPING, "panel", [1, 2, 3]
+        )
+    assert 0 < len(vertices) < num_features
+
+
+@pytest.mark.benchmark(group="geo_to_voc")
+@pytest.mark.parametrize("rotated", [False, True])
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_geo_to_voc(
+    benchmark, tmp_path, bench_ortho, bench_geojsons, num_features: int, rotated: bool
+):
+    geo_path = bench_geojsons(num_features)
+    save_path = str(tmp_path / "ortho.xml")
+    benchmark.pedantic(
+        geo_to_voc,
+        args=(bench_ortho, geo_path, save_path),
+        kwargs=dict(
+            class_attribute="class_id", class_mapping=CLASS_MAPPING, rotated=rotated
+        ),
+        rounds=3,
+    )
+    assert os.path.getsize(save_path) > 0
+
+
+@pytest.mark.benchmark(group="geo_to_voc")
+@pytest.mark.parametrize("num_features", FEATURE_COUNTS)
+def test_geo_to_voc_chunked(
+    benchmark, tmp_path, bench_ortho, bench_geojsons, num_features: int
+):
+    geo_path = bench_geojsons(num_features)
+    save_path = str(tmp_path / "ortho.xml")
+    benchmark.pedantic(
+        geo_to_voc,
+        args=(bench_ortho, geo_path, save_path),
+        kwargs=dict(class_attribute="class_id", rotated=True, chunk_size=4096),
+        rounds=3,
+    )
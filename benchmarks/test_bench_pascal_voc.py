@@ -0,0 +1,43 @@
+import pytest
+
+from ml_dronebase_data_utils.box_utils import vertices_to_rotated_boxes
+from ml_dronebase_data_utils.pascal_voc import (
+    PascalVOCWriter,
+    read_voc,
+    read_voc_npz,
+    write_voc_npz,
+)
+
+from .conftest import FEATURE_COUNTS, make_vertices
+
+
+def _writer(num_boxes: int) -> PascalVOCWriter:
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    writer = PascalVOCWriter("ortho.tif", 2048, 2048)
+    writer.addObjects(["panel"] * num_boxes, boxes)
+    return writer
+
+
+@pytest.mark.benchmark(group="voc_save")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_pascal_voc_save(benchmark, tmp_path, num_boxes: int):
+    writer = _writer(num_boxes)
+    benchmark(writer.save, str(tmp_path / "ortho.xml"))
+
+
+@pytest.mark.benchmark(group="voc_read")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_read_voc(benchmark, tmp_path, num_boxes: int):
+    path = str(tmp_path / "ortho.xml")
+    _writer(num_boxes).save(path)
+    annotation = benchmark(read_voc, path)
+    assert len(annotation.boxes) == num_boxes
+
+
+@pytest.mark.benchmark(group="voc_read")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_read_voc_npz(benchmark, tmp_path, num_boxes: int):
+    path = str(tmp_path / "ortho.npz")
+    write_voc_npz(_writer(num_boxes).to_annotation(), path)
+    annotation = benchmark(read_voc_npz, path)
+    assert len(annotation.boxes) == num_boxes
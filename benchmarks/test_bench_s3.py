@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from ml_dronebase_data_utils.box_utils import vertices_to_rotated_boxes
+from ml_dronebase_data_utils.convert_geojson import geo_to_voc
+from ml_dronebase_data_utils.pascal_voc import PascalVOCWriter, read_voc, read_voc_dir
+from ml_dronebase_data_utils.s3 import list_prefix, open_url
+from tests.conftest import TEST_BUCKET
+
+from .conftest import make_vertices
+
+NUM_OBJECTS = 1000
+
+
+@pytest.fixture
+def annotations_url(bench_s3) -> str:
+    """A prefix of small annotations on the S3 stand-in."""
+    writer = PascalVOCWriter("ortho.tif", 2048, 2048)
+    writer.addObjects(["panel"] * 50, vertices_to_rotated_boxes(make_vertices(50)))
+    with open_url(f"s3://{TEST_BUCKET}/annotations/0.xml", "w") as file:
+        writer.save(file)
+    body = bench_s3.get_object(Bucket=TEST_BUCKET, Key="annotations/0.xml")["Body"]
+    data = body.read()
+    for idx in range(1, NUM_OBJECTS):
+        bench_s3.put_object(Bucket=TEST_BUCKET, Key=f"annotations/{idx}.xml", Body=data)
+    return f"s3://{TEST_BUCKET}/annotations/"
+
+
+@pytest.mark.benchmark(group="s3_list")
+@pytest.mark.parametrize("cache_ttl", [None, 3600])
+def test_list_prefix(benchmark, tmp_path, annotations_url: str, cache_ttl):
+    files = benchmark(
+        list_prefix,
+        annotations_url,
+        filter_files=True,
+        cache_ttl=cache_ttl,
+        cache_dir=str(tmp_path),
+    )
+    assert len(files) == NUM_OBJECTS
+
+
+@pytest.mark.benchmark(group="s3_read")
+def test_read_voc_s3(benchmark, annotations_url: str):
+    annotation = benchmark(read_voc, annotations_url + "0.xml")
+    assert len(annotation.boxes) == 50
+
+
+@pytest.mark.benchmark(group="s3_read")
+def test_read_voc_dir_s3(benchmark, annotations_url: str):
+    annotations = benchmark.pedantic(read_voc_dir, args=(annotations_url,), rounds=3)
+    assert len(annotations) == NUM_OBJECTS
+
+
+@pytest.mark.benchmark(group="s3_write")
+@pytest.mark.parametrize("size", [64 * 1024, 32 * 1024 * 1024])
+def test_open_url_write(benchmark, bench_s3, size: int):
+    data = os.urandom(size)
+
+    def write():
+        with open_url(f"s3://{TEST_BUCKET}/blob.bin", "wb") as file:
+            file.write(data)
+
+    benchmark.pedantic(write, rounds=3)
+
+
+@pytest.mark.benchmark(group="s3_write")
+def test_geo_to_voc_s3(benchmark, bench_s3, bench_ortho, bench_geojsons):
+    benchmark.pedantic(
+        geo_to_voc,
+        args=(bench_ortho, bench_geojsons(10000), f"s3://{TEST_BUCKET}/ortho.xml"),
+        kwargs=dict(rotated=True),
+        rounds=3,
+    )
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ml_dronebase_data_utils.box_utils import vertices_to_rotated_boxes
+from ml_dronebase_data_utils.visualize import (
+    draw_rotated_boxes,
+    draw_rotated_boxes_preview,
+    draw_rotated_boxes_tiled,
+)
+
+from .conftest import BENCH_ORTHO_SIZE, FEATURE_COUNTS, make_vertices
+
+
+@pytest.mark.benchmark(group="draw_rotated_boxes")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_draw_rotated_boxes(benchmark, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    image = Image.fromarray(
+        np.zeros((BENCH_ORTHO_SIZE, BENCH_ORTHO_SIZE, 3), dtype=np.uint8)
+    )
+    benchmark(draw_rotated_boxes, image, boxes, box_mode="XYXYA_ABS")
+
+
+@pytest.mark.benchmark(group="draw_rotated_boxes_tiled")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_draw_rotated_boxes_tiled(benchmark, tmp_path, bench_ortho, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    benchmark.pedantic(
+        draw_rotated_boxes_tiled,
+        args=(bench_ortho, boxes, str(tmp_path / "drawn.png")),
+        kwargs=dict(box_mode="XYXYA_ABS", tile_size=512, overview_size=1024),
+        rounds=3,
+    )
+
+
+@pytest.mark.benchmark(group="draw_rotated_boxes_preview")
+@pytest.mark.parametrize("num_boxes", FEATURE_COUNTS)
+def test_draw_rotated_boxes_preview(benchmark, bench_ortho, num_boxes: int):
+    boxes = vertices_to_rotated_boxes(make_vertices(num_boxes))
+    image = benchmark(
+        draw_rotated_boxes_preview, bench_ortho, boxes, box_mode="XYXYA_ABS"
+    )
+    assert max(image.size) == 1024
@@ -1,4 +1,19 @@
-from . import convert_geojson, pascal_voc, s3, visualize  # noqa: F401
+import importlib
+from typing import Any, List
+
+# Submodules are imported on first access, `import ml_dronebase_data_utils` stays cheap
+# and scripts only pay for the dependencies (geopandas, rasterio, boto3...) they use.
+_SUBMODULES = {"box_utils", "convert_geojson", "pascal_voc", "s3", "stats", "visualize"}
 
 __author__ = "Conor Wallace"
 __version__ = "0.0.6"
+
+
+def __getattr__(name: str) -> Any:
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + list(_SUBMODULES))
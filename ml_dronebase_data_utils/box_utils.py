@@ -1,9 +1,9 @@
 import logging
 import math
-from typing import List, Tuple, Union
+import os
+from typing import BinaryIO, List, Optional, Tuple, Union
 
 import numpy as np
-from shapely.geometry import Polygon
 
 
 def vertices_to_boxes(vertices: np.ndarray) -> np.ndarray:
@@ -15,12 +15,8 @@ def vertices_to_boxes(vertices: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: A Nx4 matrix containing the converted boxes.
     """
-    boxes = []
-    for v in vertices:
-        polygon = Polygon(v)
-        boxes.append(list(polygon.bounds))
-
-    return np.asarray(boxes)
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 4, 2)
+    return np.concatenate((vertices.min(axis=1), vertices.max(axis=1)), axis=1)
 
 
 def vertices_to_rotated_boxes(vertices: np.ndarray) -> np.ndarray:
@@ -46,34 +42,71 @@ def vertices_to_rotated_boxes(vertices: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: A Nx5 matrix containing the converted boxes.
     """
-    boxes = []
-    for v in vertices:
-        xc, yc = Polygon(v).centroid.xy
-        yc = yc[0]
-        xc = xc[0]
+    vertices = np.asarray(vertices).reshape(-1, 4, 2)
+    centroids = polygon_centroids(vertices)
+    xc = centroids[:, 0]
+    yc = centroids[:, 1]
+
+    pxl_points_sorted = sort_points_batch(vertices)
+
+    tl = pxl_points_sorted[:, 0]
+    tr = pxl_points_sorted[:, 1]
+    bl = pxl_points_sorted[:, 3]
+
+    angle, h, w = rotated_box_dims_batch(tl, tr, bl)
+
+    xmin = xc - w / 2
+    ymin = yc - h / 2
+    xmax = xc + w / 2
+    ymax = yc + h / 2
 
-        pxl_points_sorted = sort_points(v)
+    return np.stack((xmin, ymin, xmax, ymax, angle), axis=1)
 
-        tl = pxl_points_sorted[0]
-        tr = pxl_points_sorted[1]
-        bl = pxl_points_sorted[3]
 
-        angle, h, w = rotated_box_dims(tl, tr, bl)
+def polygon_centroids(vertices: np.ndarray) -> np.ndarray:
+    """Compute the centroids of a batch of quadrilaterals.
 
-        xmin = xc - w / 2
-        ymin = yc - h / 2
-        xmax = xc + w / 2
-        ymax = yc + h / 2
+    Follows the GEOS centroid algorithm used by `shapely.geometry.Polygon.centroid`: the
+    area weighted centroid of the triangle fan anchored at the first vertex, falling back
+    to the length weighted centroid of the ring and then to the mean vertex when the
+    polygon is degenerate.
 
-        logging.debug(f"After angle = {angle}")
-        logging.debug(f"xc, yc, w, h = [{xc}, {yc}, {w}, {h}]")
-        logging.debug(
-            f"xmin, ymin, xmax, ymax, angle = [{xmin}, {ymin}, {xmax}, {ymax}, {angle}]"
+    Args:
+        vertices (np.ndarray): A Nx4x2 matrix of polygon vertices in ring order.
+
+    Returns:
+        np.ndarray: A Nx2 matrix containing the centroids.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 4, 2)
+    p0 = vertices[:, 0]
+
+    cg3 = np.zeros_like(p0)
+    area2 = np.zeros(len(vertices))
+    for i in range(1, 3):
+        p1 = vertices[:, i]
+        p2 = vertices[:, i + 1]
+        a2 = (p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) - (p2[:, 0] - p0[:, 0]) * (
+            p1[:, 1] - p0[:, 1]
         )
+        cg3 += a2[:, None] * (p0 + p1 + p2)
+        area2 += a2
 
-        boxes.append([xmin, ymin, xmax, ymax, angle])
+    # Degenerate polygons fall back to the centroid of the ring segments.
+    ring = np.concatenate((vertices, vertices[:, :1]), axis=1)
+    seg_len = np.linalg.norm(ring[:, 1:] - ring[:, :-1], axis=2)
+    seg_mid = (ring[:, 1:] + ring[:, :-1]) / 2
+    total_len = seg_len.sum(axis=1)
+    line_cent = (seg_len[..., None] * seg_mid).sum(axis=1)
 
-    return np.asarray(boxes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        area_cent = cg3 / 3 / area2[:, None]
+        line_cent = line_cent / total_len[:, None]
+
+    return np.where(
+        (area2 != 0)[:, None],
+        area_cent,
+        np.where((total_len > 0)[:, None], line_cent, vertices.mean(axis=1)),
+    )
 
 
 def rotated_box_dims(tl: np.ndarray, tr: np.ndarray, bl: np.ndarray) -> Tuple[float]:
@@ -153,6 +186,35 @@ def rotated_box_dims(tl: np.ndarray, tr: np.ndarray, bl: np.ndarray) -> Tuple[fl
         return angle, v2, v1
 
 
+def rotated_box_dims_batch(
+    tl: np.ndarray, tr: np.ndarray, bl: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Batched version of `rotated_box_dims`.
+
+    Args:
+        tl (np.ndarray): A Nx2 matrix of top left vertices.
+        tr (np.ndarray): A Nx2 matrix of top right vertices.
+        bl (np.ndarray): A Nx2 matrix of bottom left vertices.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The angles, heights and widths of the boxes.
+    """
+    v1 = np.linalg.norm(tl - tr, axis=1)
+    v2 = np.linalg.norm(tl - bl, axis=1)
+
+    tr_origin = (v1 > v2) & (tl[:, 1] <= tr[:, 1])
+    tl_origin = (v1 > v2) & (tl[:, 1] > tr[:, 1])
+    bl_origin = ~(tr_origin | tl_origin)
+
+    point1 = np.where(tr_origin[:, None], tr, np.where(tl_origin[:, None], tl, bl))
+    point2 = np.where(tl_origin[:, None], tr, tl)
+    angle = calculate_angle_batch(point1, point2)
+
+    h = np.where(bl_origin, v2, v1)
+    w = np.where(bl_origin, v1, v2)
+    return angle, h, w
+
+
 def calculate_angle(point1: np.ndarray, point2: np.ndarray) -> float:
     """Compute the orientation angle of a rotated rectangle. `angle` is the
     angle required to rotate the box from an upright orientation to its true orientation.
@@ -186,17 +248,38 @@ def calculate_angle(point1: np.ndarray, point2: np.ndarray) -> float:
         return -(angle % 90)
 
 
-def boxes_to_vertices(boxes: Union[np.ndarray, List[List[float]]]) -> np.ndarray:
-    num_instances = len(boxes)
+def calculate_angle_batch(point1: np.ndarray, point2: np.ndarray) -> np.ndarray:
+    """Batched version of `calculate_angle`.
 
-    if not isinstance(boxes, np.ndarray):
-        boxes = np.asarray(boxes)
+    Args:
+        point1 (np.ndarray): A Nx2 matrix of origin rotation points
+        point2 (np.ndarray): A Nx2 matrix of reference rotation points
 
-    vertices = []
-    for i in range(num_instances):
-        v = extract_vertices(boxes[i])
-        vertices.append(v)
-    return np.asarray(vertices)
+    Returns:
+        np.ndarray: orientation angles in range (-90, 90] degrees
+    """
+    angle = np.degrees(
+        np.arctan2(point1[:, 0] - point2[:, 0], point1[:, 1] - point2[:, 1])
+    )
+    return np.where(
+        (-90 < angle) & (angle <= 90),
+        angle,
+        np.where(angle > 90, angle % 90, -(angle % 90)),
+    )
+
+
+def boxes_to_vertices(boxes: Union[np.ndarray, List[List[float]]]) -> np.ndarray:
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    xmin, ymin, xmax, ymax = boxes.T
+    return np.stack(
+        (
+            np.stack((xmin, ymin), axis=1),
+            np.stack((xmax, ymin), axis=1),
+            np.stack((xmax, ymax), axis=1),
+            np.stack((xmin, ymax), axis=1),
+        ),
+        axis=1,
+    )
 
 
 def rotated_boxes_to_vertices(
@@ -213,8 +296,6 @@ def rotated_boxes_to_vertices(
 
     :return: Returns the vertices. if classes is provided returns both vertices and classes
     """
-    num_instances = len(boxes)
-
     if not isinstance(boxes, np.ndarray):
         boxes = np.asarray(boxes)
 
@@ -230,14 +311,11 @@ def rotated_boxes_to_vertices(
         classes = classes[sorted_idxs]
         classes = classes.tolist()
 
-    vertices = []
-    for i in range(num_instances):
-        v = extract_rotated_vertices(boxes[i], box_mode)
-        vertices.append(v)
+    vertices = extract_rotated_vertices_batch(boxes, box_mode)
     if len(classes):
-        return np.asarray(vertices), classes
+        return vertices, classes
     else:
-        return np.asarray(vertices)
+        return vertices
 
 
 def extract_vertices(box: np.ndarray) -> List[List[float]]:
@@ -280,6 +358,46 @@ def extract_rotated_vertices(
     return vertices
 
 
+def extract_rotated_vertices_batch(
+    boxes: np.ndarray, box_mode: str = "XYWHA_ABS"
+) -> np.ndarray:
+    """Batched version of `extract_rotated_vertices`, the order of the boxes is preserved.
+
+    Args:
+        boxes (np.ndarray): A Nx5 matrix of rotated boxes.
+        box_mode (str, optional): The format used for the boxes, either `XYWHA_ABS` or `XYXYA_ABS`.
+            Defaults to "XYWHA_ABS".
+
+    Returns:
+        np.ndarray: A Nx4x2 matrix containing the vertices of the boxes.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    if box_mode == "XYWHA_ABS":
+        xc, yc, w, h, angle = boxes.T
+    elif box_mode == "XYXYA_ABS":
+        xmin, ymin, xmax, ymax, angle = boxes.T
+        w = xmax - xmin
+        h = ymax - ymin
+        xc = xmin + w / 2
+        yc = ymin + h / 2
+    else:
+        raise ValueError(
+            f"Box mode {box_mode} is not supported.\
+            Must either be `XYWHA_ABS` or `XYXYA_ABS`."
+        )
+
+    # angle is the number of degrees the box is rotated CCW w.r.t. the 0-degree box
+    theta = angle * math.pi / 180.0
+    c = np.cos(theta)[:, None]
+    s = np.sin(theta)[:, None]
+    x_delta = np.stack((-w / 2, -w / 2, w / 2, w / 2), axis=1)
+    y_delta = np.stack((h / 2, -h / 2, -h / 2, h / 2), axis=1)
+
+    x = y_delta * s + x_delta * c + xc[:, None]
+    y = y_delta * c - x_delta * s + yc[:, None]
+    return np.stack((x, y), axis=2)
+
+
 def sort_points(points: np.ndarray) -> np.ndarray:
     """Sort points into top left, top right, bottom right, and bottom left box
     coordinates.
@@ -323,3 +441,558 @@ def sort_points(points: np.ndarray) -> np.ndarray:
     logging.debug(f"bottom left = {bottom_left}")
 
     return np.stack((top_left, top_right, bottom_right, bottom_left))
+
+
+def sort_points_batch(points: np.ndarray) -> np.ndarray:
+    """Batched version of `sort_points`.
+
+    Args:
+        points (np.ndarray): A Nx4x2 matrix of arbitrarily ordered box coordinates.
+
+    Returns:
+        np.ndarray: A Nx4x2 matrix of sorted box coordinates
+            (top left, top right, bottom right, bottom left).
+    """
+    points = np.asarray(points).reshape(-1, 4, 2)
+    order = np.argsort(points[:, :, 0], axis=1, kind="stable")
+    points_x_sorted = np.take_along_axis(points, order[:, :, None], axis=1)
+
+    # When the two center points share the same x coordinate, the lower one is
+    # assigned to the left side and the higher one to the right side.
+    center_tie = points_x_sorted[:, 1, 0] == points_x_sorted[:, 2, 0]
+    c0 = points_x_sorted[:, 1]
+    c1 = points_x_sorted[:, 2]
+    bottom_center = np.where((c0[:, 1] >= c1[:, 1])[:, None], c0, c1)
+    top_center = np.where((c0[:, 1] <= c1[:, 1])[:, None], c0, c1)
+    points_x_sorted[:, 1] = np.where(center_tie[:, None], bottom_center, c0)
+    points_x_sorted[:, 2] = np.where(center_tie[:, None], top_center, c1)
+
+    def _split_pair(pair: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # argmax/argmin pick the first point on ties
+        p0 = pair[:, 0]
+        p1 = pair[:, 1]
+        bottom = np.where((p0[:, 1] >= p1[:, 1])[:, None], p0, p1)
+        top = np.where((p0[:, 1] <= p1[:, 1])[:, None], p0, p1)
+        return top, bottom
+
+    top_left, bottom_left = _split_pair(points_x_sorted[:, :2])
+    top_right, bottom_right = _split_pair(points_x_sorted[:, 2:])
+
+    return np.stack((top_left, top_right, bottom_right, bottom_left), axis=1)
+
+
+def assign_boxes_to_tiles(
+    boxes: np.ndarray, tile_size: Union[int, Tuple[int, int]], shape: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Index which boxes intersect every tile of a regular grid.
+
+    Tiles are numbered in row major order, tile `t` covers the rows
+    `[t // n_cols * tile_height, ...)` and the columns `[t % n_cols * tile_width, ...)`.
+    The boxes of tile `t` are `indices[offsets[t] : offsets[t + 1]]`, in ascending order.
+    Boxes outside of the grid are not indexed.
+
+    Args:
+        boxes (np.ndarray): A Nx4 matrix of [xmin, ymin, xmax, ymax] bounds.
+        tile_size (Union[int, Tuple[int, int]]): The (height, width) of the tiles.
+        shape (Tuple[int, int]): The (height, width) covered by the grid.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The offsets of every tile into the box indices,
+            and the box indices.
+    """
+    tile_h, tile_w = (tile_size, tile_size) if np.isscalar(tile_size) else tile_size
+    height, width = shape
+    n_rows = -(-height // tile_h)
+    n_cols = -(-width // tile_w)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+    inside = (
+        (boxes[:, 2] >= 0)
+        & (boxes[:, 3] >= 0)
+        & (boxes[:, 0] < width)
+        & (boxes[:, 1] < height)
+    )
+    box_ids = np.flatnonzero(inside)
+    bounds = boxes[box_ids]
+    c0 = np.clip(np.floor(bounds[:, 0] / tile_w), 0, n_cols - 1).astype(np.int64)
+    c1 = np.clip(np.floor(bounds[:, 2] / tile_w), 0, n_cols - 1).astype(np.int64)
+    r0 = np.clip(np.floor(bounds[:, 1] / tile_h), 0, n_rows - 1).astype(np.int64)
+    r1 = np.clip(np.floor(bounds[:, 3] / tile_h), 0, n_rows - 1).astype(np.int64)
+
+    # Expand every box into the tiles of its bounding range
+    span_w = c1 - c0 + 1
+    counts = span_w * (r1 - r0 + 1)
+    starts = np.cumsum(counts) - counts
+    entry_box = np.repeat(np.arange(len(box_ids)), counts)
+    k = np.arange(counts.sum()) - starts[entry_box]
+    rows = r0[entry_box] + k // span_w[entry_box]
+    cols = c0[entry_box] + k % span_w[entry_box]
+    tiles = rows * n_cols + cols
+
+    order = np.argsort(tiles, kind="stable")
+    offsets = np.zeros(n_rows * n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tiles, minlength=n_rows * n_cols), out=offsets[1:])
+    return offsets, box_ids[entry_box[order]]
+
+
+def polygon_areas(vertices: np.ndarray) -> np.ndarray:
+    """Compute the area of a batch of simple polygons with the shoelace formula.
+
+    Args:
+        vertices (np.ndarray): A NxKx2 matrix of polygon vertices. Polygons with fewer than
+            K vertices can be padded by repeating their last vertex.
+
+    Returns:
+        np.ndarray: The N polygon areas.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    x = vertices[..., 0]
+    y = vertices[..., 1]
+    x_next = np.roll(x, -1, axis=-1)
+    y_next = np.roll(y, -1, axis=-1)
+    return np.abs((x * y_next - x_next * y).sum(axis=-1)) / 2
+
+
+def clip_polygons(
+    subjects: np.ndarray, clips: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Clip a batch of polygons by convex polygons (Sutherland-Hodgman).
+
+    Args:
+        subjects (np.ndarray): A NxKx2 matrix of polygons to clip.
+        clips (np.ndarray): A NxMx2 matrix of convex clipping polygons, or a single Mx2
+            clipping polygon for all subjects. Either orientation is supported.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: A NxLx2 matrix of clipped polygons, padded by repeating
+            their last vertex, and the number of vertices of every clipped polygon.
+            Empty intersections have no vertices and are all zeros.
+    """
+    polygons = np.asarray(subjects, dtype=np.float64)
+    num_polygons, num_vertices = polygons.shape[:2]
+    clips = np.broadcast_to(
+        np.asarray(clips, dtype=np.float64), (num_polygons,) + np.shape(clips)[-2:]
+    )
+    counts = np.full(num_polygons, num_vertices, dtype=np.int64)
+    rows = np.arange(num_polygons)
+
+    # Points are inside when they are on the same side of every edge as the interior
+    cx = clips[..., 0]
+    cy = clips[..., 1]
+    signed_area = (cx * np.roll(cy, -1, axis=1) - np.roll(cx, -1, axis=1) * cy).sum(1)
+    orientation = np.where(signed_area < 0, -1.0, 1.0)
+
+    num_edges = clips.shape[1]
+    for j in range(num_edges):
+        a = clips[:, j, None]
+        edge = clips[:, (j + 1) % num_edges, None] - a
+        k = np.arange(polygons.shape[1])
+        valid = k < counts[:, None]
+        next_k = np.where(k + 1 < counts[:, None], k + 1, 0)
+        current = polygons
+        following = np.take_along_axis(polygons, next_k[..., None], axis=1)
+
+        def side(points: np.ndarray) -> np.ndarray:
+            cross = edge[..., 0] * (points[..., 1] - a[..., 1]) - edge[..., 1] * (
+                points[..., 0] - a[..., 0]
+            )
+            return orientation[:, None] * cross
+
+        d_current = side(current)
+        d_following = side(following)
+        inside_current = d_current >= 0
+        crossing = inside_current != (d_following >= 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(crossing, d_current / (d_current - d_following), 0)
+        intersection = current + t[..., None] * (following - current)
+
+        # Every edge emits its start point if inside and its crossing point if any
+        candidates = np.stack((current, intersection), axis=2).reshape(
+            num_polygons, -1, 2
+        )
+        keep = np.stack((valid & inside_current, valid & crossing), axis=2).reshape(
+            num_polygons, -1
+        )
+        counts = keep.sum(axis=1)
+        order = np.argsort(~keep, axis=1, kind="stable")[:, : max(counts.max(), 1)]
+        polygons = np.take_along_axis(candidates, order[..., None], axis=1)
+
+    k = np.arange(polygons.shape[1])
+    last = polygons[rows, np.maximum(counts - 1, 0)]
+    last[counts == 0] = 0
+    polygons = np.where((k < counts[:, None])[..., None], polygons, last[:, None])
+    return polygons, counts
+
+
+class BoxIndex:
+    """A spatial index over axis aligned or rotated boxes, to find the boxes
+    intersecting pixel windows without scanning all of them.
+
+    The bounds of the boxes are packed in a uniform grid, the boxes of every cell are
+    stored contiguously in one array, so queries are vectorized over batches of windows.
+    Boxes intersect a window when their bounds do, edges included.
+
+    e.g.,
+        index = BoxIndex(vertices_to_rotated_boxes(vertices))
+        window_ids, box_ids = index.query_batch(windows)
+        index.save("ortho.index.npz")
+    """
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        box_mode: str = "XYXYA_ABS",
+        cell_size: Optional[float] = None,
+    ) -> None:
+        """Build the index.
+
+        Args:
+            boxes (np.ndarray): A Nx4 matrix of [xmin, ymin, xmax, ymax] boxes or a Nx5
+                matrix of rotated boxes.
+            box_mode (str, optional): The format of rotated boxes, either `XYWHA_ABS` or
+                `XYXYA_ABS`. Defaults to "XYXYA_ABS", the format of `vertices_to_rotated_boxes`.
+            cell_size (Optional[float], optional): The size of the grid cells. By default
+                a few times the median box size, with about as many cells as boxes at most.
+        """
+        boxes = _as_boxes(boxes)
+        self._build(boxes, _box_bounds(boxes, box_mode), cell_size)
+
+    def _build(
+        self, boxes: np.ndarray, bounds: np.ndarray, cell_size: Optional[float]
+    ) -> None:
+        self.boxes = boxes
+        self.bounds = bounds
+        if len(bounds):
+            self.origin = bounds[:, :2].min(axis=0)
+            extent = np.maximum(bounds[:, 2:].max(axis=0) - self.origin, 1.0)
+        else:
+            self.origin = np.zeros(2)
+            extent = np.ones(2)
+        if cell_size is None:
+            sizes = (bounds[:, 2:] - bounds[:, :2]).max(axis=1)
+            median_size = float(np.median(sizes)) if len(sizes) else 1.0
+            cell_size = max(
+                4 * median_size, math.sqrt(extent[0] * extent[1] / max(len(bounds), 1))
+            )
+        self.cell_size = float(cell_size)
+        self.grid_shape = tuple(
+            int(n) for n in np.floor(extent[::-1] / self.cell_size).astype(int) + 1
+        )
+        self.offsets, self.indices = assign_boxes_to_tiles(
+            (bounds - np.tile(self.origin, 2)) / self.cell_size, 1, self.grid_shape
+        )
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def query(self, window: Union[np.ndarray, List[float]]) -> np.ndarray:
+        """Find the boxes intersecting a window.
+
+        Args:
+            window (Union[np.ndarray, List[float]]): The [xmin, ymin, xmax, ymax] window.
+
+        Returns:
+            np.ndarray: The sorted indices of the intersecting boxes.
+        """
+        return self.query_batch(np.asarray(window).reshape(1, 4))[1]
+
+    def query_batch(self, windows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the boxes intersecting every window of a batch.
+
+        Args:
+            windows (np.ndarray): A Mx4 matrix of [xmin, ymin, xmax, ymax] windows.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The window and box indices of every intersecting
+                pair, sorted by window then box.
+        """
+        windows = np.asarray(windows, dtype=np.float64).reshape(-1, 4)
+        n_rows, n_cols = self.grid_shape
+        local = (windows - np.tile(self.origin, 2)) / self.cell_size
+        overlaps = (
+            (local[:, 2] >= 0)
+            & (local[:, 3] >= 0)
+            & (local[:, 0] < n_cols)
+            & (local[:, 1] < n_rows)
+        )
+        window_ids = np.flatnonzero(overlaps)
+        local = local[window_ids]
+        c0 = np.clip(np.floor(local[:, 0]), 0, n_cols - 1).astype(np.int64)
+        c1 = np.clip(np.floor(local[:, 2]), 0, n_cols - 1).astype(np.int64)
+        r0 = np.clip(np.floor(local[:, 1]), 0, n_rows - 1).astype(np.int64)
+        r1 = np.clip(np.floor(local[:, 3]), 0, n_rows - 1).astype(np.int64)
+
+        # Expand every window into the cells it covers, then the cells into their boxes
+        span_w = c1 - c0 + 1
+        cell_counts = span_w * (r1 - r0 + 1)
+        pair_window = np.repeat(np.arange(len(window_ids)), cell_counts)
+        k = np.arange(cell_counts.sum()) - np.repeat(
+            np.cumsum(cell_counts) - cell_counts, cell_counts
+        )
+        cells = (r0[pair_window] + k // span_w[pair_window]) * n_cols + (
+            c0[pair_window] + k % span_w[pair_window]
+        )
+        starts = self.offsets[cells]
+        box_counts = self.offsets[cells + 1] - starts
+        entry_pair = np.repeat(np.arange(len(cells)), box_counts)
+        positions = (
+            np.arange(box_counts.sum())
+            - np.repeat(np.cumsum(box_counts) - box_counts, box_counts)
+            + starts[entry_pair]
+        )
+        candidate_windows = window_ids[pair_window[entry_pair]]
+        candidate_boxes = self.indices[positions]
+
+        # Boxes spanning several cells are found once per cell
+        keys = np.unique(candidate_windows * max(len(self), 1) + candidate_boxes)
+        candidate_windows = keys // max(len(self), 1)
+        candidate_boxes = keys % max(len(self), 1)
+        b = self.bounds[candidate_boxes]
+        w = windows[candidate_windows]
+        hit = (
+            (b[:, 0] <= w[:, 2])
+            & (b[:, 2] >= w[:, 0])
+            & (b[:, 1] <= w[:, 3])
+            & (b[:, 3] >= w[:, 1])
+        )
+        return candidate_windows[hit], candidate_boxes[hit]
+
+    def save(self, file: Union[str, os.PathLike, BinaryIO]) -> None:
+        """Serialize the index to a `.npz` file, e.g. to cache it next to an annotation.
+
+        Args:
+            file (Union[str, os.PathLike, BinaryIO]): The path or binary file to write to.
+        """
+        np.savez(
+            file,
+            boxes=self.boxes,
+            bounds=self.bounds,
+            origin=self.origin,
+            cell_size=self.cell_size,
+            grid_shape=np.asarray(self.grid_shape),
+            offsets=self.offsets,
+            indices=self.indices,
+        )
+
+    @classmethod
+    def load(cls, file: Union[str, os.PathLike, BinaryIO]) -> "BoxIndex":
+        """Load an index serialized with `BoxIndex.save`.
+
+        Args:
+            file (Union[str, os.PathLike, BinaryIO]): The path or binary file to read from.
+
+        Returns:
+            BoxIndex: The index.
+        """
+        with np.load(file) as data:
+            index = cls.__new__(cls)
+            index.boxes = data["boxes"]
+            index.bounds = data["bounds"]
+            index.origin = data["origin"]
+            index.cell_size = float(data["cell_size"])
+            index.grid_shape = tuple(int(n) for n in data["grid_shape"])
+            index.offsets = data["offsets"]
+            index.indices = data["indices"]
+        return index
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """Compute the pairwise IoU of two sets of axis aligned boxes.
+
+    Args:
+        boxes1 (np.ndarray): A Nx4 matrix of [xmin, ymin, xmax, ymax] boxes.
+        boxes2 (np.ndarray): A Mx4 matrix of [xmin, ymin, xmax, ymax] boxes.
+
+    Returns:
+        np.ndarray: A NxM matrix of IoUs.
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+    area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+    union = area1[:, None] + area2[None, :] - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+def rotated_box_iou(
+    boxes1: np.ndarray, boxes2: np.ndarray, box_mode: str = "XYXYA_ABS"
+) -> np.ndarray:
+    """Compute the pairwise IoU of two sets of rotated boxes.
+
+    Only the pairs whose bounds intersect are clipped, see `box_iou_pairs`.
+
+    Args:
+        boxes1 (np.ndarray): A Nx5 matrix of rotated boxes.
+        boxes2 (np.ndarray): A Mx5 matrix of rotated boxes.
+        box_mode (str, optional): The format of the boxes, either `XYWHA_ABS` or
+            `XYXYA_ABS`. Defaults to "XYXYA_ABS", the format of `vertices_to_rotated_boxes`.
+
+    Returns:
+        np.ndarray: A NxM matrix of IoUs.
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 5)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 5)
+    i, j, iou = box_iou_pairs(boxes1, boxes2, box_mode=box_mode)
+    result = np.zeros((len(boxes1), len(boxes2)))
+    result[i, j] = iou
+    return result
+
+
+def box_iou_pairs(
+    boxes1: np.ndarray,
+    boxes2: Optional[np.ndarray] = None,
+    box_mode: str = "XYXYA_ABS",
+    min_iou: float = 0.0,
+    chunk_size: int = 100000,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the IoU of the overlapping pairs of boxes, for sets too large for a dense
+    IoU matrix.
+
+    Candidate pairs are found with a `BoxIndex` over the bounds of the boxes, only those
+    are compared. Rotated boxes are compared by clipping their polygons.
+
+    Args:
+        boxes1 (np.ndarray): A Nx4 matrix of boxes or a Nx5 matrix of rotated boxes.
+        boxes2 (Optional[np.ndarray], optional): The boxes to compare to, in the same format.
+            Defaults to None, to compare the boxes of `boxes1` with each other.
+        box_mode (str, optional): The format of rotated boxes, either `XYWHA_ABS` or
+            `XYXYA_ABS`. Defaults to "XYXYA_ABS".
+        min_iou (float, optional): Only return the pairs with an IoU above this value.
+            Defaults to 0.0.
+        chunk_size (int, optional): The number of rotated pairs clipped at once.
+            Defaults to 100000.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The indices in `boxes1` and `boxes2` of
+            every pair and its IoU, sorted by the first then the second index. When comparing
+            `boxes1` with itself, every pair is returned once, with i < j.
+    """
+    self_pairs = boxes2 is None
+    boxes1 = _as_boxes(boxes1)
+    boxes2 = boxes1 if self_pairs else _as_boxes(boxes2, boxes1.shape[1])
+    rotated = boxes1.shape[1] == 5
+
+    index2 = BoxIndex(boxes2, box_mode=box_mode)
+    bounds1 = index2.bounds if self_pairs else _box_bounds(boxes1, box_mode)
+    i, j = index2.query_batch(bounds1)
+    if self_pairs:
+        i, j = i[i < j], j[i < j]
+
+    if rotated:
+        polygons1 = extract_rotated_vertices_batch(boxes1, box_mode)
+        polygons2 = (
+            polygons1
+            if self_pairs
+            else extract_rotated_vertices_batch(boxes2, box_mode)
+        )
+        area1 = polygon_areas(polygons1)
+        area2 = area1 if self_pairs else polygon_areas(polygons2)
+        intersection = np.zeros(len(i))
+        for start in range(0, len(i), chunk_size):
+            pairs = slice(start, start + chunk_size)
+            clipped, _ = clip_polygons(polygons1[i[pairs]], polygons2[j[pairs]])
+            intersection[pairs] = polygon_areas(clipped)
+    else:
+        b1 = boxes1[i]
+        b2 = boxes2[j]
+        size = np.clip(
+            np.minimum(b1[:, 2:], b2[:, 2:]) - np.maximum(b1[:, :2], b2[:, :2]), 0, None
+        )
+        intersection = size.prod(axis=1)
+        area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+        area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+
+    union = area1[i] + area2[j] - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(union > 0, intersection / union, 0.0)
+    keep = iou > min_iou
+    return i[keep], j[keep], iou[keep]
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: Optional[np.ndarray] = None,
+    iou_threshold: float = 0.5,
+    box_mode: str = "XYXYA_ABS",
+) -> np.ndarray:
+    """Greedy non-maximum suppression of axis aligned or rotated boxes.
+
+    Boxes are visited by decreasing score, a box is kept unless its IoU with an already
+    kept box is above the threshold. Only overlapping pairs are compared, see
+    `box_iou_pairs`, so it scales to large sets of boxes.
+
+    Args:
+        boxes (np.ndarray): A Nx4 matrix of boxes or a Nx5 matrix of rotated boxes.
+        scores (Optional[np.ndarray], optional): The score of every box. Defaults to None,
+            to visit the boxes in order.
+        iou_threshold (float, optional): The IoU above which boxes are suppressed.
+            Defaults to 0.5.
+        box_mode (str, optional): The format of rotated boxes, either `XYWHA_ABS` or
+            `XYXYA_ABS`. Defaults to "XYXYA_ABS".
+
+    Returns:
+        np.ndarray: The indices of the kept boxes, by decreasing score.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    num_boxes = len(boxes)
+    if scores is None:
+        order = np.arange(num_boxes)
+    else:
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    rank = np.empty(num_boxes, dtype=np.int64)
+    rank[order] = np.arange(num_boxes)
+
+    i, j, _ = box_iou_pairs(boxes, box_mode=box_mode, min_iou=iou_threshold)
+    # Orient every overlapping pair from the higher ranked box to the lower ranked one
+    higher = np.where(rank[i] < rank[j], i, j)
+    lower = np.where(rank[i] < rank[j], j, i)
+    sort = np.argsort(higher, kind="stable")
+    higher, lower = higher[sort], lower[sort]
+    offsets = np.searchsorted(higher, np.arange(num_boxes + 1))
+
+    suppressed = np.zeros(num_boxes, dtype=bool)
+    keep = []
+    for idx in order.tolist():
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        suppressed[lower[offsets[idx] : offsets[idx + 1]]] = True
+    return np.asarray(keep, dtype=np.int64)
+
+
+def deduplicate_boxes(
+    boxes: np.ndarray, iou_threshold: float = 0.7, box_mode: str = "XYXYA_ABS"
+) -> np.ndarray:
+    """Remove duplicated boxes, e.g. panels digitized twice, keeping the first of every
+    group of boxes overlapping by more than the IoU threshold.
+
+    Args:
+        boxes (np.ndarray): A Nx4 matrix of boxes or a Nx5 matrix of rotated boxes.
+        iou_threshold (float, optional): The IoU above which boxes are duplicates.
+            Defaults to 0.7.
+        box_mode (str, optional): The format of rotated boxes, either `XYWHA_ABS` or
+            `XYXYA_ABS`. Defaults to "XYXYA_ABS".
+
+    Returns:
+        np.ndarray: The sorted indices of the boxes to keep.
+    """
+    return np.sort(nms(boxes, iou_threshold=iou_threshold, box_mode=box_mode))
+
+
+def _as_boxes(boxes: np.ndarray, num_columns: int = 4) -> np.ndarray:
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if boxes.size == 0:
+        boxes = boxes.reshape(0, num_columns)
+    if boxes.ndim != 2 or boxes.shape[1] not in (4, 5):
+        raise ValueError(f"Expected a Nx4 or Nx5 matrix of boxes, got {boxes.shape}.")
+    return boxes
+
+
+def _box_bounds(boxes: np.ndarray, box_mode: str = "XYXYA_ABS") -> np.ndarray:
+    if boxes.shape[1] == 5:
+        return vertices_to_boxes(extract_rotated_vertices_batch(boxes, box_mode))
+    return boxes.copy()
@@ -1,17 +1,40 @@
+import logging
 import os
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import geopandas as gpd
 import numpy as np
+import pandas as pd
 import rasterio
-from geopandas import GeoDataFrame
+import shapely
+from affine import Affine
+from geopandas import GeoDataFrame, GeoSeries
 from rasterio.io import DatasetReader
-from tqdm import tqdm
 
 from .box_utils import vertices_to_boxes, vertices_to_rotated_boxes
-from .pascal_voc import PascalVOCWriter
-from .s3 import upload_file
+from .pascal_voc import (
+    NPZ_SUFFIX,
+    PascalVOCStreamWriter,
+    PascalVOCWriter,
+    write_voc_npz,
+)
+from .s3 import _parse_url, gdal_path, open_url, upload_key
+from .stats import count, stage
+
+DEFAULT_CHUNK_SIZE = 65536
+ANNOTATION_FORMATS = ("voc", "npz")
 
 
 def geo_to_voc(
@@ -24,6 +47,8 @@ def geo_to_voc(
     skip_classes: List[int] = [],
     rotated: bool = False,
     prefix: str = "",
+    chunk_size: Optional[int] = None,
+    annotation_format: str = "voc",
 ):
     """
     Convert data on geojson format to pascal voc data.
@@ -37,55 +62,91 @@ def geo_to_voc(
     :param skip_classes: The classes to be skipped while the conversion. This should be values from the class_attribute field in the geojson.
     :param rotated: Specify if to use rotated bounding boxes, defaults to false.
     :param prefix: Specify a prefix to use for path while writing the xml file. Useful for local conversion for final path is s3.
+    :param chunk_size: Convert the geojson in chunks of this many features with `geo_to_voc_chunked` instead of all at once.
+    :param annotation_format: "voc" to write a pascal voc xml file or "npz" to write the annotation with
+        `pascal_voc.write_voc_npz`, which loads faster. npz annotations are saved with the `.npz` suffix.
+
+    Run it in a `stats.collect_stats` block to record the time spent in every stage.
     """
-    ortho = rasterio.open(ortho_path)
-    gdf = gpd.read_file(geo_path)
+    if chunk_size is not None:
+        geo_to_voc_chunked(
+            ortho_path,
+            geo_path,
+            save_path,
+            class_attribute,
+            class_mapping,
+            default_class,
+            skip_classes,
+            rotated=rotated,
+            prefix=prefix,
+            chunk_size=chunk_size,
+            annotation_format=annotation_format,
+        )
+        return
+    count("files")
+    with stage("geo_to_voc"), GeoConverter(ortho_path, geo_path) as converter:
+        converter.to_voc(
+            save_path,
+            class_attribute,
+            class_mapping,
+            default_class,
+            skip_classes,
+            rotated=rotated,
+            prefix=prefix,
+            annotation_format=annotation_format,
+        )
 
-    writer = PascalVOCWriter(ortho_path, ortho.width, ortho.height, prefix=prefix)
 
-    boxes = []
-    names = []
-    if not gdf.empty:
-        vertices = get_pixel_vertices(ortho, gdf)
-        if rotated:
-            boxes = vertices_to_rotated_boxes(vertices)
-        else:
-            boxes = vertices_to_boxes(vertices)
+def geo_to_voc_chunked(
+    ortho_path: str,
+    geo_path: str,
+    save_path: str,
+    class_attribute: Optional[str] = None,
+    class_mapping: Optional[Dict[int, str]] = None,
+    default_class: str = "panel",
+    skip_classes: List[int] = [],
+    rotated: bool = False,
+    prefix: str = "",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    annotation_format: str = "voc",
+):
+    """Convert a geojson to a pascal voc annotation in chunks of `chunk_size` features.
 
-        if class_attribute is not None:
-            names = gdf[class_attribute]
-        else:
-            names = [default_class] * len(boxes)
-    for box, name in zip(boxes, names):
-        # Skip boxes with None or empty/no information, assumption is that they don't have any information
-        if name is None or (isinstance(name, str) and len(name) == 0):
-            continue
-        # Dumb Logic
-        try:
-            # int(name) might be too restrictive in some scenarios, adapt if required
-            name = int(name)
-        except ValueError:
-            pass
-        if name in skip_classes:
-            continue
-        if class_mapping is not None:
-            # If mapping is found, use the default name instead of default.
-            name = class_mapping.get(name, name)
-        if rotated:
-            xmin, ymin, xmax, ymax, angle = box
-            writer.addObject(name, xmin, ymin, xmax, ymax, angle)
-        else:
-            xmin, ymin, xmax, ymax = box
-            writer.addObject(name, xmin, ymin, xmax, ymax)
+    Every chunk is read, projected to image coordinates and written to the annotation
+    before the next one is read, so memory is bounded by the chunk size rather than the
+    number of features. The annotation is the same as the one written by `geo_to_voc`,
+    see it for the other arguments. The boxes of npz annotations are kept in memory until
+    they're written, only the features are read in chunks.
 
-    if "s3://" in save_path:
-        anno_path = os.path.basename(save_path)
-        anno_path = str(Path(anno_path).with_suffix(".xml"))
-        writer.save(anno_path)
-        upload_file(anno_path, save_path, exist_ok=False)
-        os.remove(anno_path)
-    else:
-        writer.save(save_path)
+    Args:
+        chunk_size (int, optional): The number of features read at once, see
+            `iter_geo_arrays`. Defaults to DEFAULT_CHUNK_SIZE.
+    """
+    _check_annotation_format(annotation_format)
+    count("files")
+    columns = [class_attribute] if class_attribute is not None else []
+    with stage("geo_to_voc"), rasterio.open(gdal_path(ortho_path)) as ortho:
+        chunks = iter_geo_arrays(geo_path, columns, chunk_size)
+        annotations = iter_annotations(
+            ortho, chunks, class_attribute, class_mapping, default_class, skip_classes
+        )
+        if annotation_format == "npz":
+            writer = PascalVOCWriter(
+                ortho_path, ortho.width, ortho.height, prefix=prefix
+            )
+            for vertices, names in annotations:
+                writer.addObjects(names, _fit_boxes(vertices, rotated))
+            _save_annotation(writer, save_path, annotation_format)
+            return
+        with PascalVOCStreamWriter(
+            _voc_save_path(save_path),
+            ortho_path,
+            ortho.width,
+            ortho.height,
+            prefix=prefix,
+        ) as writer:
+            for vertices, names in annotations:
+                writer.addObjects(names, _fit_boxes(vertices, rotated))
 
 
 def geo_to_rotated_voc(
@@ -112,37 +173,715 @@ def geo_to_rotated_voc(
     )
 
 
-def get_pixel_vertices(ortho: DatasetReader, gdf: GeoDataFrame) -> np.ndarray:
+class GeoConverter:
+    """Convert one ortho/geojson pair to several annotations, e.g. rotated and
+    axis-aligned or with different class mappings, from a single open and parse.
+
+    The ortho is opened and the geojson read on first use, and reused by every conversion.
+    The geojson is read with `read_geo_arrays`, only the polygon exterior rings and
+    attribute columns are kept. Every conversion resolves the classes first and only
+    projects the polygons it keeps to image coordinates. The ortho handle stays open until
+    `close` is called, use the converter as a context manager to release it.
+
+    Example:
+        >>> with GeoConverter(ortho_path, geo_path) as converter:
+        ...     converter.to_voc("labels/ortho.xml", rotated=True)
+        ...     converter.to_voc("labels/ortho_aligned.xml", skip_classes=[0])
+    """
+
+    def __init__(self, ortho_path: str, geo_path: str):
+        """
+        Args:
+            ortho_path (str): Path to the ortho. Can be a local/s3 location.
+            geo_path (str): Path to the geojson. Can be a local/s3 location.
+        """
+        self.ortho_path = ortho_path
+        self.geo_path = geo_path
+        self._ortho: Optional[DatasetReader] = None
+        self._arrays: Optional[GeoArrays] = None
+
+    @property
+    def ortho(self) -> DatasetReader:
+        """The opened ortho, opened on first access."""
+        if self._ortho is None or self._ortho.closed:
+            with stage("ortho.open"):
+                self._ortho = rasterio.open(gdal_path(self.ortho_path))
+        return self._ortho
+
+    @property
+    def arrays(self) -> "GeoArrays":
+        """The polygon rings and attribute columns of the geojson, read on first access."""
+        if self._arrays is None:
+            self._arrays = read_geo_arrays(self.geo_path)
+        return self._arrays
+
+    def annotations(
+        self,
+        class_attribute: Optional[str] = None,
+        class_mapping: Optional[Dict[int, str]] = None,
+        default_class: str = "panel",
+        skip_classes: List[int] = [],
+    ) -> Tuple[np.ndarray, List]:
+        """Get the image vertices and class names of the polygons to annotate, see
+        `get_annotations`.
+        """
+        return get_annotations(
+            self.ortho,
+            self.arrays,
+            class_attribute,
+            class_mapping,
+            default_class,
+            skip_classes,
+        )
+
+    def to_voc(
+        self,
+        save_path: str,
+        class_attribute: Optional[str] = None,
+        class_mapping: Optional[Dict[int, str]] = None,
+        default_class: str = "panel",
+        skip_classes: List[int] = [],
+        rotated: bool = False,
+        prefix: str = "",
+        annotation_format: str = "voc",
+    ):
+        """Write a pascal voc annotation, see `geo_to_voc` for the arguments."""
+        _check_annotation_format(annotation_format)
+        writer = PascalVOCWriter(
+            self.ortho_path, self.ortho.width, self.ortho.height, prefix=prefix
+        )
+
+        vertices, names = self.annotations(
+            class_attribute, class_mapping, default_class, skip_classes
+        )
+        writer.addObjects(names, _fit_boxes(vertices, rotated))
+        _save_annotation(writer, save_path, annotation_format)
+
+    def close(self):
+        """Close the ortho handle and drop the cached geojson."""
+        if self._ortho is not None:
+            self._ortho.close()
+        self._ortho = None
+        self._arrays = None
+
+    def __enter__(self) -> "GeoConverter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _fit_boxes(vertices: np.ndarray, rotated: bool) -> np.ndarray:
+    with stage("boxes.fit"):
+        if rotated:
+            boxes = vertices_to_rotated_boxes(vertices)
+        else:
+            boxes = vertices_to_boxes(vertices)
+    count("boxes", len(boxes))
+    return boxes
+
+
+def _check_annotation_format(annotation_format: str) -> None:
+    if annotation_format not in ANNOTATION_FORMATS:
+        raise ValueError(
+            f"annotation_format must be one of {ANNOTATION_FORMATS}, got {annotation_format!r}."
+        )
+
+
+def _save_annotation(
+    writer: PascalVOCWriter, save_path: str, annotation_format: str
+) -> None:
+    with stage("voc.save"):
+        if annotation_format == "npz":
+            write_voc_npz(writer.to_annotation(), _voc_save_path(save_path, NPZ_SUFFIX))
+        else:
+            with open_url(_voc_save_path(save_path), "w") as file:
+                writer.save(file)
+
+
+def _voc_save_path(save_path: str, suffix: Optional[str] = None) -> str:
+    """Get where to save an annotation, local paths are kept as is unless a suffix is
+    given.
+    """
+    if "s3://" in save_path:
+        # Saved where uploading a local `<stem><suffix>` copy would put it
+        bucket_name, key = _parse_url(save_path)
+        filename = Path(os.path.basename(save_path)).with_suffix(suffix or ".xml")
+        save_path = f"s3://{bucket_name}/{upload_key(key, str(filename))}"
+    elif suffix is not None:
+        save_path = str(Path(save_path).with_suffix(suffix))
+    return save_path
+
+
+def iter_annotations(
+    ortho: DatasetReader,
+    chunks: Iterable["GeoArrays"],
+    class_attribute: Optional[str] = None,
+    class_mapping: Optional[Dict[int, str]] = None,
+    default_class: str = "panel",
+    skip_classes: List[int] = [],
+) -> Iterator[Tuple[np.ndarray, List]]:
+    """Get the image vertices and class names of the polygons to annotate, chunk by chunk,
+    see `get_annotations`.
+
+    As with a whole file, class attribute values are paired with the exploded polygons in
+    order. Polygons of multipolygons shift the pairing, polygons or values waiting for
+    their pair are carried over to the next chunk.
+
+    Args:
+        ortho (DatasetReader): The orthomosaic the polygons are annotated on.
+        chunks (Iterable[GeoArrays]): The polygons, e.g. from `iter_geo_arrays`.
+        class_attribute (Optional[str], optional): The attribute to use as the class.
+            Defaults to None.
+        class_mapping (Optional[Dict[int, str]], optional): The mapping of class attribute
+            values to class names. Defaults to None.
+        default_class (str, optional): The class of all polygons when no class attribute is
+            specified. Defaults to "panel".
+        skip_classes (List[int], optional): The class attribute values to skip. Defaults to [].
+
+    Yields:
+        Iterator[Tuple[np.ndarray, List]]: The Nx4x2 image vertices and the class names of
+            the polygons of every chunk.
+    """
+    polygons: Optional[GeoArrays] = None
+    values = np.zeros(0, dtype=object)
+    for chunk in chunks:
+        polygons = chunk if polygons is None else _concat_polygons(polygons, chunk)
+        if class_attribute is None:
+            yield get_annotations(
+                ortho, polygons, None, class_mapping, default_class, skip_classes
+            )
+            polygons = None
+            continue
+        chunk_values = np.asarray(chunk.columns[class_attribute], dtype=object)
+        values = np.concatenate((values, chunk_values))
+        num_polygons = len(polygons.offsets) - 1
+        num_pairs = min(num_polygons, len(values))
+        paired = _select_polygons(polygons, np.arange(num_pairs))._replace(
+            columns={class_attribute: values[:num_pairs]}
+        )
+        yield get_annotations(
+            ortho, paired, class_attribute, class_mapping, default_class, skip_classes
+        )
+        polygons = _select_polygons(polygons, np.arange(num_pairs, num_polygons))
+        values = values[num_pairs:]
+
+
+def get_annotations(
+    ortho: DatasetReader,
+    polygons: Union["GeoArrays", GeoDataFrame],
+    class_attribute: Optional[str] = None,
+    class_mapping: Optional[Dict[int, str]] = None,
+    default_class: str = "panel",
+    skip_classes: List[int] = [],
+) -> Tuple[np.ndarray, List]:
+    """Get the image vertices and class names of the polygons to annotate.
+
+    The class attribute values of the rows are paired with the exploded polygons in order,
+    extra rows or polygons are dropped. Classes are resolved first so only the polygons
+    that are kept get projected to image coordinates.
+
+    Args:
+        ortho (DatasetReader): The orthomosaic the polygons are annotated on.
+        polygons (Union[GeoArrays, GeoDataFrame]): The polygons, e.g. from
+            `read_geo_arrays`, or a dataframe containing them.
+        class_attribute (Optional[str], optional): The attribute to use as the class.
+            Defaults to None.
+        class_mapping (Optional[Dict[int, str]], optional): The mapping of class attribute
+            values to class names. Defaults to None.
+        default_class (str, optional): The class of all polygons when no class attribute is
+            specified. Defaults to "panel".
+        skip_classes (List[int], optional): The class attribute values to skip. Defaults to [].
+
+    Returns:
+        Tuple[np.ndarray, List]: A Nx4x2 matrix of vertices in image coordinates and the
+            class name of every polygon.
+    """
+    columns = [class_attribute] if class_attribute is not None else []
+    if isinstance(polygons, GeoDataFrame):
+        if polygons.empty:
+            # Features without properties don't have any attribute column
+            return np.zeros((0, 4, 2), dtype=np.int64), []
+        polygons = _gdf_to_arrays(polygons, columns)
+    if len(polygons.offsets) == 1:
+        return np.zeros((0, 4, 2), dtype=np.int64), []
+    values = polygons.columns[class_attribute] if columns else None
+    keep, names = _resolve_rows(
+        values, len(polygons.offsets) - 1, class_mapping, default_class, skip_classes
+    )
+    kept = np.flatnonzero(keep)
+    vertices = get_array_pixel_vertices(ortho, _select_polygons(polygons, kept))
+    return vertices, names[kept].tolist()
+
+
+def _select_polygons(arrays: "GeoArrays", polygons: np.ndarray) -> "GeoArrays":
+    """Get the exterior rings of the exploded polygons `polygons`, as single polygon
+    features without attribute columns.
+    """
+    starts = arrays.offsets[polygons]
+    counts = arrays.offsets[polygons + 1] - starts
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    idx = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+    return GeoArrays(
+        arrays.coords[idx], offsets, np.ones(len(polygons), np.int64), arrays.crs, {}
+    )
+
+
+def _concat_polygons(first: "GeoArrays", second: "GeoArrays") -> "GeoArrays":
+    """Append the exterior rings of `second` to `first`, without attribute columns."""
+    return GeoArrays(
+        np.concatenate((first.coords, second.coords)),
+        np.concatenate((first.offsets, second.offsets[1:] + first.offsets[-1])),
+        np.concatenate((first.parts, second.parts)),
+        second.crs,
+        {},
+    )
+
+
+def _resolve_rows(
+    values: Optional[Sequence],
+    num_polygons: int,
+    class_mapping: Optional[Dict[int, str]],
+    default_class: str,
+    skip_classes: List[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Resolve the class of every exploded polygon from the class attribute values of the
+    rows, or `default_class` when there is no class attribute, see `resolve_classes`.
+    """
+    with stage("classes.resolve"):
+        if values is not None:
+            # Rows are paired with the exploded polygons in order, extra rows or
+            # polygons are dropped
+            num_boxes = min(num_polygons, len(values))
+            return resolve_classes(
+                np.asarray(values, dtype=object)[:num_boxes],
+                skip_classes,
+                class_mapping,
+            )
+        name = _resolve_class(default_class, skip_classes, class_mapping)
+    keep = np.full(num_polygons, name is not None)
+    return keep, np.full(num_polygons, name, dtype=object)
+
+
+def resolve_classes(
+    values: Iterable,
+    skip_classes: List[int] = [],
+    class_mapping: Optional[Dict[int, str]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Map a column of class attribute values to class names.
+
+    Every distinct value is resolved once and the result is broadcast back to the rows,
+    so the cost depends on the number of classes rather than the number of features.
+    Values are coerced with `int` when possible, None and empty strings are skipped as
+    well as the values in `skip_classes`, and the remaining values are mapped with
+    `class_mapping` when they have a mapping.
+
+    Args:
+        values (Iterable): The class attribute value of every feature.
+        skip_classes (List[int], optional): The class attribute values to skip.
+            Defaults to [].
+        class_mapping (Optional[Dict[int, str]], optional): The mapping of class attribute
+            values to class names. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: A boolean mask of the features to keep and the class
+            name of every feature, None for skipped features.
+    """
+    values = np.asarray(values, dtype=object).reshape(-1)
+    # Missing values (None, NaN) share the -1 code
+    codes, uniques = pd.factorize(values)
+    resolved = np.empty(len(uniques) + 1, dtype=object)
+    resolved[:-1] = [_resolve_class(u, skip_classes, class_mapping) for u in uniques]
+    names = resolved[codes]
+
+    missing = np.flatnonzero(codes < 0)
+    if len(missing):
+        # None is skipped while NaN is resolved like any other value
+        names[missing] = [
+            _resolve_class(value, skip_classes, class_mapping)
+            for value in values[missing]
+        ]
+    return np.not_equal(names, None), names
+
+
+def _resolve_class(
+    name: Any, skip_classes: List[int], class_mapping: Optional[Dict[int, str]]
+) -> Any:
+    """Map a class attribute value to a class name, None if the polygon is skipped."""
+    # Skip boxes with None or empty/no information, assumption is that they don't have any information
+    if name is None or (isinstance(name, str) and len(name) == 0):
+        return None
+    # Dumb Logic
+    try:
+        # int(name) might be too restrictive in some scenarios, adapt if required
+        name = int(name)
+    except ValueError:
+        pass
+    if name in skip_classes:
+        return None
+    if class_mapping is not None:
+        # If mapping is found, use the default name instead of default.
+        name = class_mapping.get(name, name)
+    return name
+
+
+class GeoArrays(NamedTuple):
+    """The polygons of a vector file as flat arrays, see `read_geo_arrays`.
+
+    Attributes:
+        coords (np.ndarray): A Mx2 matrix of the (x, y) exterior ring coordinates of every
+            exploded polygon.
+        offsets (np.ndarray): The P+1 offsets of each ring into `coords`.
+        parts (np.ndarray): The number of polygons of every one of the N features.
+        crs (Optional[str]): The CRS of the coordinates.
+        columns (Dict[str, np.ndarray]): The N attribute values of every column read.
+    """
+
+    coords: np.ndarray
+    offsets: np.ndarray
+    parts: np.ndarray
+    crs: Optional[str]
+    columns: Dict[str, np.ndarray]
+
+
+def read_geo_arrays(
+    geo_path: str, columns: Optional[Sequence[str]] = None
+) -> GeoArrays:
+    """Read the polygon exterior rings and attribute columns of a vector file into flat
+    arrays, without building a GeoDataFrame.
+
+    With pyogrio and shapely 2 the features are read from GDAL as WKB and only the exterior
+    ring coordinates are extracted, in bulk. Otherwise the file is read with
+    `gpd.read_file` and converted.
+
+    Args:
+        geo_path (str): Path to the geojson, or any vector file GDAL reads. Can be a
+            local/s3 location.
+        columns (Optional[Sequence[str]], optional): The attribute columns to read, all
+            columns by default. Defaults to None.
+
+    Returns:
+        GeoArrays: The exterior rings of the exploded polygons and the attribute columns.
+    """
+    with stage("geojson.read"):
+        pyogrio = _import_pyogrio()
+        if pyogrio is None:
+            arrays = _gdf_to_arrays(gpd.read_file(geo_path), columns)
+        else:
+            meta, _, wkb, values = pyogrio.raw.read(
+                gdal_path(geo_path), columns=columns
+            )
+            arrays = _wkb_to_arrays(geo_path, columns, meta, wkb, values)
+    count("features", len(arrays.parts))
+    return arrays
+
+
+def iter_geo_arrays(
+    geo_path: str,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[GeoArrays]:
+    """Read a vector file in chunks of `chunk_size` features, see `read_geo_arrays`.
+
+    Only one chunk is held in memory at a time. With pyarrow installed the features are
+    streamed from GDAL in a single pass. Otherwise every chunk is a separate read that
+    skips the previous features, which some drivers, e.g. GeoJSON, do by reading the file
+    again.
+
+    Args:
+        geo_path (str): Path to the geojson, or any vector file GDAL reads. Can be a
+            local/s3 location.
+        columns (Optional[Sequence[str]], optional): The attribute columns to read, all
+            columns by default. Defaults to None.
+        chunk_size (int, optional): The number of features of every chunk.
+            Defaults to DEFAULT_CHUNK_SIZE.
+
+    Returns:
+        Iterator[GeoArrays]: The polygons and attribute columns of every chunk, in order.
+    """
+    # Checked before the first chunk is requested
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}.")
+    return _iter_geo_chunks(geo_path, columns, chunk_size)
+
+
+def _iter_geo_chunks(
+    geo_path: str, columns: Optional[Sequence[str]], chunk_size: int
+) -> Iterator[GeoArrays]:
+    pyogrio = _import_pyogrio()
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pyarrow = None
+
+    if pyogrio is not None and pyarrow is not None:
+        chunks = _iter_arrow_chunks(pyogrio, geo_path, columns, chunk_size)
+    else:
+        chunks = _iter_read_chunks(pyogrio, geo_path, columns, chunk_size)
+    while True:
+        with stage("geojson.read"):
+            arrays = next(chunks, None)
+        if arrays is None:
+            return
+        count("features", len(arrays.parts))
+        yield arrays
+
+
+def _iter_arrow_chunks(
+    pyogrio: Any, geo_path: str, columns: Optional[Sequence[str]], chunk_size: int
+) -> Iterator[GeoArrays]:
+    with pyogrio.raw.open_arrow(
+        gdal_path(geo_path), columns=columns, batch_size=chunk_size, use_pyarrow=True
+    ) as (meta, reader):
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        for batch in reader:
+            values = [
+                batch.column(str(f)).to_numpy(zero_copy_only=False)
+                for f in meta["fields"]
+            ]
+            wkb = batch.column(geometry_name).to_numpy(zero_copy_only=False)
+            yield _wkb_to_arrays(geo_path, columns, meta, wkb, values)
+
+
+def _iter_read_chunks(
+    pyogrio: Any, geo_path: str, columns: Optional[Sequence[str]], chunk_size: int
+) -> Iterator[GeoArrays]:
+    start = 0
+    while True:
+        if pyogrio is None:
+            rows = slice(start, start + chunk_size)
+            arrays = _gdf_to_arrays(gpd.read_file(geo_path, rows=rows), columns)
+        else:
+            meta, _, wkb, values = pyogrio.raw.read(
+                gdal_path(geo_path),
+                columns=columns,
+                skip_features=start,
+                max_features=chunk_size,
+            )
+            arrays = _wkb_to_arrays(geo_path, columns, meta, wkb, values)
+        if len(arrays.parts):
+            yield arrays
+        if len(arrays.parts) < chunk_size:
+            return
+        start += chunk_size
+
+
+def _import_pyogrio() -> Any:
+    """Get pyogrio if it is installed along with shapely 2, None otherwise."""
+    try:
+        import pyogrio
+    except ImportError:
+        return None
+    return pyogrio if hasattr(shapely, "from_wkb") else None
+
+
+def _wkb_to_arrays(
+    geo_path: str,
+    columns: Optional[Sequence[str]],
+    meta: Dict[str, Any],
+    wkb: np.ndarray,
+    values: List[np.ndarray],
+) -> GeoArrays:
+    fields = [str(f) for f in meta["fields"]]
+    missing = set(columns or []) - set(fields)
+    if missing:
+        raise KeyError(f"Columns {sorted(missing)} not found in {geo_path}")
+    geometries = shapely.from_wkb(wkb)
+    coords, offsets = get_exterior_coords(shapely.get_parts(geometries))
+    return GeoArrays(
+        coords,
+        offsets,
+        get_num_parts(geometries),
+        meta["crs"],
+        dict(zip(fields, values)),
+    )
+
+
+def _gdf_to_arrays(gdf: GeoDataFrame, columns: Optional[Sequence[str]]) -> GeoArrays:
+    if columns is None:
+        columns = [c for c in gdf.columns if c != gdf.geometry.name]
+    coords, offsets = get_exterior_coords(gdf.geometry.explode())
+    crs = gdf.crs.to_string() if gdf.crs is not None else None
+    return GeoArrays(
+        coords,
+        offsets,
+        get_num_parts(gdf.geometry),
+        crs,
+        {c: gdf[c].to_numpy() for c in columns},
+    )
+
+
+def get_array_pixel_vertices(
+    ortho: DatasetReader, arrays: GeoArrays, strict: bool = False
+) -> np.ndarray:
+    """Convert the polygons read with `read_geo_arrays` to image vertices, see
+    `get_pixel_vertices`.
+
+    Args:
+        ortho (DatasetReader): The orthomosaic file used to index geographical coordinates
+            to image coordinates.
+        arrays (GeoArrays): The polygons.
+        strict (bool, optional): If true, raise a ValueError for polygons that don't have
+            exactly four vertices. Defaults to False.
+
+    Returns:
+        np.ndarray: A matrix of vertices in image coordinates with shape Nx4x2.
+    """
+    if len(arrays.offsets) == 1:
+        return np.zeros((0, 4, 2), dtype=np.int64)
+    with stage("geojson.to_crs"):
+        coords = transform_coords(arrays.coords, arrays.crs, ortho.crs)
+    with stage("geojson.pixel_index"):
+        pxl_coords = geo_to_pixel(ortho.transform, coords)
+        vertices = _ring_quads(pxl_coords, arrays.offsets, strict=strict)
+    count("polygons", len(vertices))
+    return vertices
+
+
+def transform_coords(coords: np.ndarray, src_crs: Any, dst_crs: Any) -> np.ndarray:
+    """Transform a Mx2 matrix of (x, y) coordinates between two CRS, the same way as
+    `GeoDataFrame.to_crs`.
+
+    Args:
+        coords (np.ndarray): The (x, y) coordinates.
+        src_crs (Any): The CRS of the coordinates, anything pyproj accepts.
+        dst_crs (Any): The CRS to transform to.
+
+    Returns:
+        np.ndarray: The transformed Mx2 coordinates.
+    """
+    from pyproj import CRS, Transformer
+
+    if src_crs is None:
+        raise ValueError(
+            "Cannot transform naive geometries. Please set a crs on the geojson first."
+        )
+    src_crs = CRS.from_user_input(src_crs)
+    dst_crs = CRS.from_user_input(dst_crs)
+    if src_crs.is_exact_same(dst_crs):
+        return coords
+    transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    x, y = transformer.transform(coords[:, 0], coords[:, 1])
+    return np.stack((x, y), axis=1)
+
+
+def get_pixel_vertices(
+    ortho: DatasetReader, gdf: GeoDataFrame, strict: bool = False
+) -> np.ndarray:
     """Convert the set of geographical vertices to image vertices.
 
+    The exterior coordinates of every exploded polygon are packed into a single array and
+    transformed to image coordinates in one step. Each polygon is described by the first
+    four vertices of its exterior ring.
+
     Args:
         ortho (DatasetReader): The orthomosaic file used to index geographical coordinates
             to image coordinates.
         gdf (GeoDataFrame): The dataframe containing the set of geographical vertices.
             The `geometry` field is assumed to contain Multipolygons.
+        strict (bool, optional): If true, raise a ValueError for polygons that don't have
+            exactly four vertices instead of keeping their first four ring coordinates.
+            Defaults to False.
 
     Returns:
         np.ndarray: A matrix of vertices in image coordinates with shape Nx4x2.
     """
-    gdf = gdf.to_crs(ortho.crs)
-    polys = gdf.geometry.explode().tolist()
-    geo_vertices = [p.exterior.coords for p in polys]
+    with stage("geojson.to_crs"):
+        gdf = gdf.to_crs(ortho.crs)
+    with stage("geojson.pixel_index"):
+        polys = gdf.geometry.explode()
+        coords, offsets = get_exterior_coords(polys)
+        pxl_coords = geo_to_pixel(ortho.transform, coords)
+        vertices = _ring_quads(pxl_coords, offsets, strict=strict)
+    count("polygons", len(vertices))
+    return vertices
 
-    import logging
 
-    pxl_vertices = []
-    for geo_v in tqdm(
-        geo_vertices, total=len(geo_vertices), desc="Extracting Pixel Vertices"
-    ):
-        geo_v_ = [[c[0], c[1]] for c in geo_v]
-        geo_v_ = np.asarray(geo_v_)
-        geo_v_[:, [1, 0]] = geo_v_[:, [0, 1]]
-        logging.info(f"get_pixel_vertices:: geo vertices = {geo_v_}")
-        pxl_v = [ortho.index(c[0], c[1]) for c in geo_v]
-        pxl_v = np.asarray(pxl_v)
-        # swap axes (y, x) -> (x, y)
-        pxl_v[:, [1, 0]] = pxl_v[:, [0, 1]]
-        logging.info(f"get_pixel_vertices:: pixel vertices = {pxl_v}")
-        pxl_vertices.append(pxl_v[:4])
-
-    return np.asarray(pxl_vertices)
+def get_num_parts(geometries: GeoSeries) -> np.ndarray:
+    """Count the polygons every geometry explodes to, 0 for missing geometries.
+
+    Args:
+        geometries (GeoSeries): The (multi)polygons to count.
+
+    Returns:
+        np.ndarray: The number of polygons of every geometry.
+    """
+    geoms = np.asarray(geometries, dtype=object)
+    if hasattr(shapely, "get_num_geometries"):
+        return np.asarray(shapely.get_num_geometries(geoms), dtype=np.int64)
+    return np.asarray(
+        [0 if g is None else len(getattr(g, "geoms", [g])) for g in geoms],
+        dtype=np.int64,
+    )
+
+
+def get_exterior_coords(polygons: GeoSeries) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack the exterior ring coordinates of a set of polygons into one array.
+
+    Args:
+        polygons (GeoSeries): The polygons to extract the exterior rings from.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: A Mx2 matrix of (x, y) coordinates and the N+1
+            offsets of each ring into the coordinate matrix.
+    """
+    geoms = np.asarray(polygons, dtype=object)
+    if hasattr(shapely, "get_exterior_ring"):
+        # Shapely 2.x exposes vectorized accessors
+        rings = shapely.get_exterior_ring(geoms)
+        counts = shapely.get_num_coordinates(rings)
+        coords = shapely.get_coordinates(rings)
+    else:
+        ring_coords = [np.asarray(p.exterior.coords).reshape(-1, 2) for p in geoms]
+        counts = np.asarray([len(c) for c in ring_coords], dtype=np.int64)
+        coords = np.concatenate(ring_coords) if len(ring_coords) else np.zeros((0, 2))
+    offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return coords[:, :2], offsets
+
+
+def geo_to_pixel(transform: Affine, coords: np.ndarray) -> np.ndarray:
+    """Convert geographical coordinates to image coordinates using the inverse of the
+    geotransform, equivalent to calling `DatasetReader.index` on every coordinate.
+
+    Args:
+        transform (Affine): The geotransform of the orthomosaic.
+        coords (np.ndarray): A Mx2 matrix of (x, y) geographical coordinates in the CRS
+            of the orthomosaic.
+
+    Returns:
+        np.ndarray: A Mx2 matrix of (x, y) image coordinates, i.e. (col, row).
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    inv = ~transform
+    x = coords[:, 0]
+    y = coords[:, 1]
+    cols = np.floor(inv.a * x + inv.b * y + inv.c)
+    rows = np.floor(inv.d * x + inv.e * y + inv.f)
+    return np.stack((cols, rows), axis=1).astype(np.int64)
+
+
+def _ring_quads(
+    coords: np.ndarray, offsets: np.ndarray, strict: bool = False
+) -> np.ndarray:
+    counts = np.diff(offsets)
+    # Exterior rings are closed, a box has 4 vertices and 5 ring coordinates
+    too_short = np.flatnonzero(counts < 4)
+    if len(too_short):
+        raise ValueError(
+            f"{len(too_short)} polygon(s) have less than 3 vertices "
+            f"and can't be converted to boxes, e.g. polygon index {too_short[0]}"
+        )
+    irregular = np.flatnonzero(counts != 5)
+    if len(irregular):
+        message = (
+            f"{len(irregular)} polygon(s) don't have exactly 4 vertices "
+            f"(e.g. polygon index {irregular[0]} has {counts[irregular[0]] - 1})"
+        )
+        if strict:
+            raise ValueError(message)
+        logging.warning(f"{message}, using the first 4 ring coordinates.")
+
+    idx = offsets[:-1, None] + np.arange(4)
+    return coords[idx]
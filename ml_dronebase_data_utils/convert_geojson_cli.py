@@ -1,7 +1,16 @@
+import json
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
 
 from ml_dronebase_data_utils.convert_geojson import geo_to_voc
-from ml_dronebase_data_utils.s3 import list_prefix
+from ml_dronebase_data_utils.pascal_voc import NPZ_SUFFIX
+from ml_dronebase_data_utils.s3 import list_prefix, open_url
+from ml_dronebase_data_utils.stats import Stats, collect_stats
 
 
 def run_geojson_conversion(**kwargs):
@@ -17,7 +26,15 @@ def run_geojson_conversion(**kwargs):
     class_mapping -> A plain txt file containing class mappings
     skip_classes -> Classes to skip, specify multiple
     rotated -> Use rotated bounding box, defaults to false
+    workers -> Number of worker processes used to convert orthos in parallel, defaults to 1
+    chunk_size -> Convert the geojsons in chunks of this many features to bound memory
+    annotation_format -> voc to write xml annotations or npz to write npz annotations,
+        defaults to voc
+    list_cache_ttl -> Reuse S3 listings of batch inputs cached for at most this many seconds
+    stats -> Write the stage timings and counters of every file and of the whole run to this
+        local/s3 json file
 
+    Returns 0 on success, 3 if any of the conversions failed.
     """
 
     ortho_path = kwargs.get("ortho_path", None)
@@ -29,23 +46,30 @@ def run_geojson_conversion(**kwargs):
         return 1
 
     batch = kwargs.get("batch", False)
+    annotation_format = kwargs.get("annotation_format", None) or "voc"
+    suffix = NPZ_SUFFIX if annotation_format == "npz" else ".xml"
+    list_cache_ttl = kwargs.get("list_cache_ttl", None)
 
     orthos = []
     geojsons = []
     save_paths = []
     if batch:
         if "s3://" in ortho_path:
-            for prefix in list_prefix(ortho_path, filter_files=True):
+            for prefix in list_prefix(
+                ortho_path, filter_files=True, cache_ttl=list_cache_ttl
+            ):
                 orthos.append(prefix)
         else:
-            for path in Path(ortho_path).iterdir():
+            for path in sorted(Path(ortho_path).iterdir()):
                 if path.is_file():
                     orthos.append(str(path))
         if "s3://" in geojson:
-            for prefix in list_prefix(geojson, filter_files=True):
+            for prefix in list_prefix(
+                geojson, filter_files=True, cache_ttl=list_cache_ttl
+            ):
                 geojsons.append(prefix)
         else:
-            for path in Path(geojson).iterdir():
+            for path in sorted(Path(geojson).iterdir()):
                 if path.is_file():
                     geojsons.append(str(path))
         if len(orthos) != len(geojsons):
@@ -53,7 +77,7 @@ def run_geojson_conversion(**kwargs):
             return 2
         for g in geojsons:
             save_paths.append(
-                str(Path(save_path).joinpath(f"{Path(g).stem}.xml")).replace(
+                str(Path(save_path).joinpath(f"{Path(g).stem}{suffix}")).replace(
                     "s3:/", "s3://"
                 )
             )
@@ -65,25 +89,127 @@ def run_geojson_conversion(**kwargs):
     class_attribute = kwargs.get("class_attribute", None)
     class_mapping = kwargs.get("class_mapping", None)
     default_class = kwargs.get("default_class", "panel")
-    skip_classes = kwargs.get("skip_classes", [])
+    skip_classes = kwargs.get("skip_classes", None) or []
     rotated = kwargs.get("rotated", False)
     prefix = kwargs.get("prefix", "")
+    chunk_size = kwargs.get("chunk_size", None)
+
+    workers = kwargs.get("workers", 1) or 1
+
+    items = list(zip(orthos, geojsons, save_paths))
+    options = (
+        class_attribute,
+        class_mapping,
+        default_class,
+        skip_classes,
+        rotated,
+        prefix,
+        chunk_size,
+        annotation_format,
+    )
+    stats_path = kwargs.get("stats", None)
+    file_stats = {} if stats_path is not None else None
+    failures = _run_conversions(items, options, workers, file_stats)
+    if stats_path is not None:
+        write_stats_report(stats_path, file_stats)
+
+    if failures:
+        print(f"Failed to convert {len(failures)}/{len(items)} files:")
+        for op, error in failures:
+            print(f"  {op}: {type(error).__name__}: {error}")
+        return 3
+    return 0
+
+
+def _run_conversions(
+    items: List[Tuple[str, str, str]],
+    options: tuple,
+    workers: int = 1,
+    file_stats: Optional[Dict[str, Stats]] = None,
+) -> List[Tuple[str, BaseException]]:
+    """Run `geo_to_voc` for every (ortho, geojson, save_path) item, either in process
+    or fanned out over a process pool. A failing item doesn't stop the others.
+
+    When `file_stats` is given, the stats of every converted item are added to it by
+    ortho path.
+
+    Returns:
+        List[Tuple[str, BaseException]]: The ortho path and error of every failed item.
+    """
+    failures = []
+    convert = geo_to_voc if file_stats is None else _geo_to_voc_with_stats
+    progress = tqdm(total=len(items), desc="Converting geojsons", unit="file")
+
+    def report(op: str, error: Optional[BaseException] = None, result=None):
+        if error is None:
+            if file_stats is not None:
+                file_stats[op] = result
+            progress.write(f"Converted {op}")
+        else:
+            failures.append((op, error))
+            details = "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )
+            progress.write(f"Failed to convert {op}\n{details}")
+        progress.update()
+
+    if workers <= 1:
+        for op, gjson, sp in items:
+            try:
+                result = convert(op, gjson, sp, *options)
+            except Exception as e:
+                report(op, e)
+            else:
+                report(op, result=result)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(convert, op, gjson, sp, *options): op
+                for op, gjson, sp in items
+            }
+            for future in as_completed(futures):
+                error = future.exception()
+                result = future.result() if error is None else None
+                report(futures[future], error, result)
+
+    progress.close()
+    return failures
 
-    total_count = len(orthos)
-    for idx, (op, gjson, sp) in enumerate(zip(orthos, geojsons, save_paths)):
-        print(f"Processing file {idx+1}/{total_count}, {op}", end="\r")
-        # Call the function
-        geo_to_voc(
-            op,
-            gjson,
-            sp,
-            class_attribute,
-            class_mapping,
-            default_class,
-            skip_classes,
-            rotated,
-            prefix,
-        )
+
+def _geo_to_voc_with_stats(*args) -> Stats:
+    # Module level so it can be sent to worker processes, which return their stats
+    with collect_stats() as stats:
+        geo_to_voc(*args)
+    return stats
+
+
+def write_stats_report(path: str, file_stats: Dict[str, Stats]) -> None:
+    """Write the stats of a batch as json, with the stats of every file and their total."""
+    total = Stats()
+    for stats in file_stats.values():
+        total.merge(stats)
+    report = {
+        "total": total.as_dict(),
+        "files": {op: stats.as_dict() for op, stats in sorted(file_stats.items())},
+    }
+    with open_url(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def read_class_mapping(path: str) -> Dict[int, str]:
+    """Read a plain txt class mapping file, with one `0 = Normal` mapping per line."""
+    mapping = {}
+    with open(path) as cm:
+        for line in cm:
+            line = line.strip("\n")
+            if len(line) < 1:
+                continue
+            key, value = line.split("=", maxsplit=1)
+            # Currently only supports int, tweak this if required
+            key = int(key.strip())
+            value = value.strip()
+            mapping[key] = value
+    return mapping
 
 
 def convert_geojson_cli():
@@ -119,26 +245,44 @@ def convert_geojson_cli():
     parser.add_argument(
         "--prefix", default="", help="The prefix to use when saving the annotation"
     )
+    parser.add_argument(
+        "--list-cache-ttl",
+        type=float,
+        default=None,
+        help="Reuse S3 listings of batch inputs cached for at most this many seconds",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Convert the geojsons in chunks of this many features to bound memory",
+    )
+    parser.add_argument(
+        "--annotation-format",
+        choices=["voc", "npz"],
+        default="voc",
+        help="Write pascal voc xml or npz annotations, npz annotations load faster",
+    )
+    parser.add_argument(
+        "--stats",
+        default=None,
+        help="Write the stage timings and counters of every file to this json file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to convert orthos in parallel",
+    )
 
     args = vars(parser.parse_args())
 
     # Read class mapping if provided
     class_mapping = args.get("class_mapping", None)
     if class_mapping is not None:
-        mapping = {}
-        with open(class_mapping) as cm:
-            for line in cm:
-                line = line.strip("\n")
-                if len(line) < 1:
-                    continue
-                key, value = line.split("=", maxsplit=1)
-                # Currently only supports int, tweak this if required
-                key = int(key.strip())
-                value = value.strip()
-                mapping[key] = value
-        args["class_mapping"] = mapping
-
-    run_geojson_conversion(**args)
+        args["class_mapping"] = read_class_mapping(class_mapping)
+
+    sys.exit(run_geojson_conversion(**args))
 
 
 if __name__ == "__main__":
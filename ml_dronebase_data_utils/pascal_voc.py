@@ -1,9 +1,95 @@
 """
 Modified from https://github.com/AndrewCarterUK/pascal-voc-writer
 """
+
+import functools
+import io
+import json
 import os
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+from xml.etree import ElementTree
+
+import numpy as np
+
+from .s3 import DEFAULT_MAX_WORKERS, list_prefix, open_url
+from .stats import count, current_stats, stage
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+_OBJECT_FIELDS = (
+    "name",
+    "pose",
+    "truncated",
+    "difficult",
+    "xmin",
+    "ymin",
+    "xmax",
+    "ymax",
+    "angle",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_template() -> "Template":
+    """Load and compile the annotation template once per process."""
+    from jinja2 import Environment, PackageLoader
+
+    environment = Environment(
+        loader=PackageLoader("ml_dronebase_data_utils", "templates"),
+        keep_trailing_newline=True,
+    )
+    return environment.get_template("annotation.xml")
+
 
-from jinja2 import Environment, PackageLoader
+def _render_block(name: str, context: Dict[str, Any]) -> str:
+    template = _get_template()
+    return "".join(template.blocks[name](template.new_context(context)))
+
+
+@functools.lru_cache(maxsize=None)
+def _object_format() -> Optional[str]:
+    """Derive a `str.format` pattern from the `object` block of the template.
+
+    Rendering every object through Jinja dominates the time spent writing large annotation
+    files, the object block only substitutes values so it is rendered once with sentinel values
+    which are then replaced by format fields. Returns None if the pattern doesn't reproduce the
+    template, in which case objects are rendered with Jinja.
+    """
+    sentinels = {field: f"\x00{field}\x00" for field in _OBJECT_FIELDS}
+    rendered = _render_block("object", {"object": sentinels})
+    pattern = rendered.replace("{", "{{").replace("}", "}}")
+    for field, sentinel in sentinels.items():
+        pattern = pattern.replace(sentinel, "{" + field + "!s}")
+
+    probe = {field: f"<{field}>" for field in _OBJECT_FIELDS}
+    probe.update(xmin=0.5, ymin=np.float64(1.25), xmax=3, ymax=np.int64(4))
+    if pattern.format(**probe) != _render_block("object", {"object": probe}):
+        return None
+    return pattern
+
+
+class _ObjectBatch(NamedTuple):
+    names: List[Any]
+    boxes: np.ndarray
+    pose: Any
+    truncated: Any
+    difficult: Any
 
 
 class PascalVOCWriter:
@@ -17,11 +103,7 @@ class PascalVOCWriter:
         segmented: int = 0,
         prefix: str = "",
     ) -> None:
-        environment = Environment(
-            loader=PackageLoader("ml_dronebase_data_utils", "templates"),
-            keep_trailing_newline=True,
-        )
-        self.annotation_template = environment.get_template("annotation.xml")
+        self.annotation_template = _get_template()
         abspath = os.path.abspath(path)
         if "s3" in path:
             file_path = path
@@ -67,7 +149,665 @@ class PascalVOCWriter:
             }
         )
 
-    def save(self, annotation_path: str) -> None:
-        with open(annotation_path, "w") as file:
-            content = self.annotation_template.render(**self.template_parameters)
-            file.write(content)
+    def addObjects(
+        self,
+        names: Union[str, Iterable[str]],
+        boxes: np.ndarray,
+        pose: Union[str, Iterable[str]] = "Unspecified",
+        truncated: Union[int, Iterable[int]] = 0,
+        difficult: Union[int, Iterable[int]] = 0,
+    ) -> None:
+        """Add a batch of objects at once.
+
+        The batch is kept as columns and only expanded into objects while the annotation is
+        written.
+
+        Args:
+            names (Union[str, Iterable[str]]): The class name of every box, or one name for all boxes.
+            boxes (np.ndarray): A Nx4 matrix of [xmin, ymin, xmax, ymax] boxes or a Nx5 matrix of
+                [xmin, ymin, xmax, ymax, angle] rotated boxes.
+            pose (Union[str, Iterable[str]], optional): The pose of every box or of all boxes.
+                Defaults to "Unspecified".
+            truncated (Union[int, Iterable[int]], optional): The truncated flag of every box or of
+                all boxes. Defaults to 0.
+            difficult (Union[int, Iterable[int]], optional): The difficult flag of every box or of
+                all boxes. Defaults to 0.
+        """
+        self.template_parameters["objects"].append(
+            _make_batch(names, boxes, pose, truncated, difficult)
+        )
+
+    def save(self, annotation_path: Union[str, IO[str]]) -> None:
+        """Write the annotation.
+
+        Args:
+            annotation_path (Union[str, IO[str]]): The path of the annotation file, or a text
+                file-like object to write it to.
+        """
+        if isinstance(annotation_path, str):
+            with open(annotation_path, "w") as file:
+                self._write(file)
+        else:
+            self._write(annotation_path)
+
+    def to_annotation(self) -> "VOCAnnotation":
+        """Get the added objects as a `VOCAnnotation`, e.g. to save them with `write_voc_npz`.
+
+        The class vocabulary is the class names in order of appearance. Boxes are Nx5
+        rotated boxes if any object has a numeric angle, objects without an angle get an
+        angle of 0. Poses aren't kept.
+
+        Returns:
+            VOCAnnotation: The header and objects of the annotation.
+        """
+        vocabulary: Dict[str, int] = {}
+        boxes, class_ids, truncated, difficult = [], [], [], []
+        for obj in self.template_parameters["objects"]:
+            if isinstance(obj, _ObjectBatch):
+                num_boxes = len(obj.boxes)
+                names, flags = obj.names, (obj.truncated, obj.difficult)
+                boxes.append(obj.boxes)
+            else:
+                num_boxes = 1
+                names, flags = [obj["name"]], (obj["truncated"], obj["difficult"])
+                box = [obj[field] for field in ("xmin", "ymin", "xmax", "ymax")]
+                angle = _to_float(obj["angle"])
+                if angle is not None:
+                    box.append(angle)
+                boxes.append(np.asarray([box]))
+            if not isinstance(names, list):
+                names = [names] * num_boxes
+            class_ids.append(
+                [vocabulary.setdefault(str(name), len(vocabulary)) for name in names]
+            )
+            truncated.append(np.broadcast_to(flags[0], num_boxes))
+            difficult.append(np.broadcast_to(flags[1], num_boxes))
+
+        if any(b.shape[1] == 5 for b in boxes):
+            boxes = [
+                b if b.shape[1] == 5 else np.pad(b, ((0, 0), (0, 1))) for b in boxes
+            ]
+        return VOCAnnotation(
+            {field: self.template_parameters[field] for field in _HEADER_FIELDS},
+            np.concatenate(boxes) if boxes else np.zeros((0, 4)),
+            _concat(class_ids, np.int64),
+            list(vocabulary),
+            _concat(truncated, np.int64),
+            _concat(difficult, np.int64),
+        )
+
+    def _write(self, file: IO[str]) -> None:
+        with stage("voc.write"):
+            file.write(_render_block("header", self.template_parameters))
+            _write_objects(file, _iter_objects(self.template_parameters["objects"]))
+            file.write(_render_block("footer", {}))
+        if current_stats() is not None:
+            count(
+                "voc.objects_written", _num_objects(self.template_parameters["objects"])
+            )
+
+
+class PascalVOCStreamWriter(PascalVOCWriter):
+    """A Pascal VOC writer that writes objects to the annotation file as they are added.
+
+    The header is written when the writer is created and the footer when it is closed, so the
+    objects are never held in memory. The output is the same as `PascalVOCWriter.save`.
+
+    Leaving the `with` block with an exception aborts the writer, the footer isn't written so a
+    partial annotation can't be mistaken for a complete one.
+
+    e.g.,
+        with PascalVOCStreamWriter(annotation_path, ortho_path, width, height) as writer:
+            writer.addObjects(names, boxes)
+    """
+
+    def __init__(
+        self,
+        annotation_path: Union[str, IO[str]],
+        path: str,
+        width: int,
+        height: int,
+        depth: int = 3,
+        database: str = "Unknown",
+        segmented: int = 0,
+        prefix: str = "",
+    ) -> None:
+        """
+        Args:
+            annotation_path (Union[str, IO[str]]): A local path or an S3 url of the annotation
+                file, or a text file-like object to write it to.
+        """
+        super().__init__(path, width, height, depth, database, segmented, prefix)
+        if isinstance(annotation_path, str):
+            self._file = open_url(annotation_path, "w")
+            self._annotation_path: Optional[str] = annotation_path
+        else:
+            self._file = annotation_path
+            self._annotation_path = None
+        self._file.write(_render_block("header", self.template_parameters))
+        self.closed = False
+
+    def addObject(self, *args, **kwargs) -> None:
+        super().addObject(*args, **kwargs)
+        self._flush_objects()
+
+    def addObjects(self, *args, **kwargs) -> None:
+        super().addObjects(*args, **kwargs)
+        self._flush_objects()
+
+    def save(self, annotation_path: Union[str, IO[str], None] = None) -> None:
+        """Close the writer, the annotation is written to the file it was created with."""
+        self.close()
+
+    def close(self) -> None:
+        """Write the footer and close the annotation file if the writer opened it."""
+        if self.closed:
+            return
+        self._file.write(_render_block("footer", {}))
+        if self._annotation_path is not None:
+            self._file.close()
+        self.closed = True
+
+    def abort(self) -> None:
+        """Stop writing without the footer.
+
+        An annotation file opened by the writer is removed, or its S3 upload aborted. File-like
+        objects are left to their owner, e.g. leaving an `open_url` block with an exception
+        aborts the upload.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self._annotation_path is None:
+            return
+        abort_upload = getattr(getattr(self._file, "buffer", None), "abort", None)
+        if abort_upload is not None:
+            abort_upload()
+        self._file.close()
+        if "s3://" not in self._annotation_path and os.path.exists(
+            self._annotation_path
+        ):
+            os.remove(self._annotation_path)
+
+    def __enter__(self) -> "PascalVOCStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def _flush_objects(self) -> None:
+        if self.closed:
+            raise ValueError("Can't add objects to a closed writer.")
+        objects = self.template_parameters["objects"]
+        with stage("voc.write"):
+            _write_objects(self._file, _iter_objects(objects))
+        if current_stats() is not None:
+            count("voc.objects_written", _num_objects(objects))
+        self.template_parameters["objects"] = []
+
+
+def _make_batch(
+    names: Union[str, Iterable[str]],
+    boxes: np.ndarray,
+    pose: Union[str, Iterable[str]],
+    truncated: Union[int, Iterable[int]],
+    difficult: Union[int, Iterable[int]],
+) -> _ObjectBatch:
+    boxes = np.asarray(boxes)
+    if boxes.ndim != 2 or boxes.shape[1] not in (4, 5):
+        raise ValueError(f"Expected a Nx4 or Nx5 matrix of boxes, got {boxes.shape}.")
+    num_boxes = len(boxes)
+
+    def column(values: Any, name: str) -> Any:
+        if isinstance(values, (str, int, np.integer)):
+            return values
+        # Lists aren't converted to an array, mixed types, e.g. ints and a NaN class
+        # name, would be cast to a common type
+        values = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        if len(values) != num_boxes:
+            raise ValueError(f"Expected {num_boxes} {name}, got {len(values)}.")
+        return values
+
+    return _ObjectBatch(
+        column(names, "names"),
+        # Copied so changing the caller's array doesn't change the added objects
+        boxes.copy(),
+        column(pose, "poses"),
+        column(truncated, "truncated flags"),
+        column(difficult, "difficult flags"),
+    )
+
+
+def _iter_objects(
+    objects: Iterable[Union[Dict[str, Any], _ObjectBatch]]
+) -> Iterator[Dict[str, Any]]:
+    """Expand the added objects and object batches into object dicts, in order."""
+    for obj in objects:
+        if not isinstance(obj, _ObjectBatch):
+            yield obj
+            continue
+        columns = {
+            key: getattr(obj, key)
+            for key in ("names", "pose", "truncated", "difficult")
+        }
+        for idx, box in enumerate(obj.boxes.tolist()):
+            values = {
+                key: value if not isinstance(value, list) else value[idx]
+                for key, value in columns.items()
+            }
+            yield {
+                "name": values["names"],
+                "xmin": box[0],
+                "ymin": box[1],
+                "xmax": box[2],
+                "ymax": box[3],
+                "angle": box[4] if len(box) == 5 else "Unspecified",
+                "pose": values["pose"],
+                "truncated": values["truncated"],
+                "difficult": values["difficult"],
+            }
+
+
+def _concat(parts: List[Any], dtype: Any) -> np.ndarray:
+    if not parts:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate([np.asarray(p, dtype=dtype) for p in parts])
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _num_objects(objects: Iterable[Union[Dict[str, Any], _ObjectBatch]]) -> int:
+    return sum(
+        len(obj.boxes) if isinstance(obj, _ObjectBatch) else 1 for obj in objects
+    )
+
+
+def _write_objects(file: IO[str], objects: Iterable[Dict[str, Any]]) -> None:
+    pattern = _object_format()
+    if pattern is None:
+        for obj in objects:
+            file.write(_render_block("object", {"object": obj}))
+        return
+
+    chunk = []
+    for obj in objects:
+        chunk.append(pattern.format(**obj))
+        if len(chunk) >= 4096:
+            file.write("".join(chunk))
+            chunk = []
+    file.write("".join(chunk))
+
+
+class VOCAnnotation(NamedTuple):
+    """A Pascal VOC annotation read into columnar arrays.
+
+    Attributes:
+        header (Dict[str, Any]): folder, filename, path, database, width, height, depth and segmented.
+        boxes (np.ndarray): A Nx4 matrix of [xmin, ymin, xmax, ymax] boxes or a Nx5 matrix of
+            [xmin, ymin, xmax, ymax, angle] rotated boxes.
+        class_ids (np.ndarray): The index of the class of every box in `classes`.
+        classes (List[str]): The class vocabulary.
+        truncated (np.ndarray): The truncated flag of every box.
+        difficult (np.ndarray): The difficult flag of every box.
+    """
+
+    header: Dict[str, Any]
+    boxes: np.ndarray
+    class_ids: np.ndarray
+    classes: List[str]
+    truncated: np.ndarray
+    difficult: np.ndarray
+
+    @property
+    def names(self) -> List[str]:
+        return [self.classes[idx] for idx in self.class_ids]
+
+
+_HEADER_FIELDS = {
+    "folder": str,
+    "filename": str,
+    "path": str,
+    "database": str,
+    "width": int,
+    "height": int,
+    "depth": int,
+    "segmented": int,
+}
+
+
+def read_voc(
+    source: Union[str, IO],
+    rotated: Optional[bool] = None,
+    classes: Optional[List[str]] = None,
+) -> VOCAnnotation:
+    """Read a Pascal VOC annotation into columnar arrays.
+
+    The file is parsed incrementally and every object is discarded once it has been read, so
+    memory only grows with the output arrays.
+
+    Args:
+        source (Union[str, IO]): A local path, an S3 url or a file-like object.
+        rotated (Optional[bool], optional): Whether to return Nx5 rotated boxes. By default rotated
+            boxes are returned if any object has a numeric angle. Objects without an angle get an
+            angle of 0. Defaults to None.
+        classes (Optional[List[str]], optional): A class vocabulary to index the class names with,
+            names missing from it are appended. Defaults to None.
+
+    Returns:
+        VOCAnnotation: The header, boxes, class ids and class vocabulary of the annotation.
+    """
+    vocabulary = {name: idx for idx, name in enumerate(classes or [])}
+    header: Dict[str, Any] = {}
+    coords: List[float] = []
+    angles: List[float] = []
+    class_ids: List[int] = []
+    truncated: List[int] = []
+    difficult: List[int] = []
+    has_angle = False
+
+    with stage("voc.read"), _open_source(source) as file:
+        root = None
+        depth = 0
+        for event, elem in ElementTree.iterparse(file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if elem.tag == "object" and depth == 1:
+                name = _find_text(elem, "name", "")
+                class_ids.append(vocabulary.setdefault(name, len(vocabulary)))
+                truncated.append(int(_find_text(elem, "truncated", 0)))
+                difficult.append(int(_find_text(elem, "difficult", 0)))
+                box = elem.find("bndbox")
+                for field in ("xmin", "ymin", "xmax", "ymax"):
+                    coords.append(float(_find_text(box, field, "nan")))
+                try:
+                    angles.append(float(_find_text(box, "angle", "")))
+                    has_angle = True
+                except ValueError:
+                    angles.append(0.0)
+                root.clear()
+            elif elem.tag in _HEADER_FIELDS and depth <= 2 and elem.text is not None:
+                header[elem.tag] = _HEADER_FIELDS[elem.tag](elem.text.strip())
+
+    count("voc.objects_read", len(class_ids))
+    boxes = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+    if rotated or (rotated is None and has_angle):
+        boxes = np.concatenate(
+            (boxes, np.asarray(angles, dtype=np.float64)[:, None]), axis=1
+        )
+    return VOCAnnotation(
+        header,
+        boxes,
+        np.asarray(class_ids, dtype=np.int64),
+        list(vocabulary),
+        np.asarray(truncated, dtype=np.int64),
+        np.asarray(difficult, dtype=np.int64),
+    )
+
+
+def read_voc_dir(
+    url: str,
+    rotated: Optional[bool] = None,
+    classes: Optional[List[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Dict[str, VOCAnnotation]:
+    """Read every `.xml` annotation of a local directory or S3 prefix in parallel.
+
+    All annotations share the same class vocabulary.
+
+    Args:
+        url (str): A local directory or an S3 url.
+        rotated (Optional[bool], optional): See `read_voc`. Defaults to None.
+        classes (Optional[List[str]], optional): See `read_voc`. Defaults to None.
+        max_workers (int, optional): Number of annotations read concurrently. Defaults to
+            DEFAULT_MAX_WORKERS.
+
+    Returns:
+        Dict[str, VOCAnnotation]: The annotations by path, sorted by path.
+    """
+    if "s3://" in url:
+        paths = list_prefix(url, filter_files=True)
+    else:
+        paths = [os.path.join(url, f) for f in os.listdir(url)]
+    paths = sorted(p for p in paths if p.lower().endswith(".xml"))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        annotations = list(
+            executor.map(lambda p: read_voc(p, rotated=rotated, classes=classes), paths)
+        )
+
+    # Re-index every annotation on one shared vocabulary
+    vocabulary = {name: idx for idx, name in enumerate(classes or [])}
+    for annotation in annotations:
+        for name in annotation.classes:
+            vocabulary.setdefault(name, len(vocabulary))
+    shared_classes = list(vocabulary)
+    result = {}
+    for path, annotation in zip(paths, annotations):
+        mapping = np.asarray(
+            [vocabulary[name] for name in annotation.classes], dtype=np.int64
+        )
+        result[path] = annotation._replace(
+            class_ids=(
+                mapping[annotation.class_ids] if len(mapping) else annotation.class_ids
+            ),
+            classes=shared_classes,
+        )
+    return result
+
+
+NPZ_SUFFIX = ".npz"
+_NPZ_VERSION = 1
+_NPZ_ARRAYS = {
+    "boxes": None,
+    "class_ids": np.int32,
+    "truncated": np.uint8,
+    "difficult": np.uint8,
+}
+
+
+def write_voc_npz(annotation: VOCAnnotation, dest: Union[str, IO[bytes]]) -> None:
+    """Write an annotation as an uncompressed NumPy `.npz` archive.
+
+    The archive holds the header and class vocabulary as JSON and unicode arrays, and the
+    boxes, class ids, truncated and difficult flags as columns. Class ids are stored as
+    int32 and the flags as uint8. Members aren't compressed so `read_voc_npz` can memory
+    map them, the archive can also be read with `np.load`.
+
+    Args:
+        annotation (VOCAnnotation): The annotation, e.g. from `read_voc` or
+            `PascalVOCWriter.to_annotation`.
+        dest (Union[str, IO[bytes]]): A local path, an S3 url or a binary file-like object.
+    """
+    header = {
+        field: _HEADER_FIELDS[field](value) if field in _HEADER_FIELDS else value
+        for field, value in annotation.header.items()
+    }
+    arrays = {
+        "header": np.asarray(
+            json.dumps({"version": _NPZ_VERSION, **header}, sort_keys=True)
+        ),
+        "classes": np.asarray(annotation.classes, dtype=str),
+    }
+    for name, dtype in _NPZ_ARRAYS.items():
+        values = np.asarray(getattr(annotation, name))
+        if dtype is not None:
+            values = _narrow(values, dtype, name)
+        arrays[name] = np.ascontiguousarray(values)
+
+    with stage("voc.write_npz"):
+        if hasattr(dest, "write"):
+            np.savez(dest, **arrays)
+        elif "s3://" in dest:
+            # The zip members are written with seeks, the archive is built in memory
+            buffer = io.BytesIO()
+            np.savez(buffer, **arrays)
+            with open_url(dest, "wb") as file:
+                file.write(buffer.getbuffer())
+        else:
+            with open(dest, "wb") as file:
+                np.savez(file, **arrays)
+    count("voc.objects_written", len(arrays["boxes"]))
+
+
+def read_voc_npz(source: Union[str, IO[bytes]], mmap: bool = True) -> VOCAnnotation:
+    """Read an annotation written by `write_voc_npz`.
+
+    Local archives are memory mapped by default, the columns are read-only views of the
+    file and only the pages which are accessed are read. S3 objects and file-like objects
+    are read into memory.
+
+    Args:
+        source (Union[str, IO[bytes]]): A local path, an S3 url or a binary file-like object.
+        mmap (bool, optional): Whether to memory map local archives. Defaults to True.
+
+    Returns:
+        VOCAnnotation: The annotation, with int32 class ids and uint8 flags.
+    """
+    with stage("voc.read_npz"):
+        if mmap and isinstance(source, str) and "s3://" not in source:
+            arrays = _mmap_npz(source)
+        else:
+            with _open_source(source) as file:
+                buffer = io.BytesIO(file.read())
+            with np.load(buffer) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+
+    header = json.loads(arrays["header"].item())
+    version = header.pop("version", None)
+    if version != _NPZ_VERSION:
+        raise ValueError(f"Unsupported npz annotation version {version}.")
+    count("voc.objects_read", len(arrays["boxes"]))
+    return VOCAnnotation(
+        header,
+        arrays["boxes"],
+        arrays["class_ids"],
+        arrays["classes"].tolist(),
+        arrays["truncated"],
+        arrays["difficult"],
+    )
+
+
+def voc_to_npz(source: Union[str, IO], dest: Optional[str] = None) -> str:
+    """Convert a Pascal VOC annotation to the `.npz` format of `write_voc_npz`.
+
+    Args:
+        source (Union[str, IO]): A local path, an S3 url or a file-like object of the
+            annotation.
+        dest (Optional[str], optional): Where to write the archive. Defaults to the source
+            path with the `.npz` suffix.
+
+    Returns:
+        str: The path of the archive.
+    """
+    dest = dest or _with_suffix(source, NPZ_SUFFIX)
+    write_voc_npz(read_voc(source), dest)
+    return dest
+
+
+def npz_to_voc(source: Union[str, IO[bytes]], dest: Optional[str] = None) -> str:
+    """Convert an annotation written by `write_voc_npz` back to Pascal VOC.
+
+    Poses are written as "Unspecified" since they aren't kept in the archive.
+
+    Args:
+        source (Union[str, IO[bytes]]): A local path, an S3 url or a binary file-like
+            object of the archive.
+        dest (Optional[str], optional): Where to write the annotation. Defaults to the
+            source path with the `.xml` suffix.
+
+    Returns:
+        str: The path of the annotation.
+    """
+    dest = dest or _with_suffix(source, ".xml")
+    annotation = read_voc_npz(source)
+    header = annotation.header
+    writer = PascalVOCWriter(header.get("path", ""), header["width"], header["height"])
+    writer.template_parameters.update(header)
+    classes = np.asarray(annotation.classes, dtype=object)
+    writer.addObjects(
+        classes[annotation.class_ids],
+        annotation.boxes,
+        truncated=annotation.truncated,
+        difficult=annotation.difficult,
+    )
+    with open_url(dest, "w") as file:
+        writer.save(file)
+    return dest
+
+
+def _narrow(values: np.ndarray, dtype: Any, name: str) -> np.ndarray:
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"The {name} don't fit in {np.dtype(dtype)}.")
+    return values.astype(dtype, copy=False)
+
+
+def _with_suffix(path: Union[str, IO], suffix: str) -> str:
+    if not isinstance(path, str):
+        raise ValueError("A destination is required when converting a file object.")
+    return os.path.splitext(path)[0] + suffix
+
+
+def _mmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """Memory map the members of an uncompressed `.npz` archive.
+
+    Every member is a `.npy` file stored as is in the zip archive, its data starts after
+    the zip local file header and the `.npy` header.
+    """
+    arrays = {}
+    with open(path, "rb") as file, zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(name_length + extra_length, os.SEEK_CUR)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            if dtype.hasobject or 0 in shape:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            arrays[name] = np.memmap(
+                path,
+                dtype=dtype,
+                mode="r",
+                offset=file.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+@contextmanager
+def _open_source(source: Union[str, IO]) -> Iterator[IO]:
+    if hasattr(source, "read"):
+        yield source
+    else:
+        with open_url(source, "rb") as file:
+            yield file
+
+
+def _find_text(elem: Optional[ElementTree.Element], tag: str, default: Any) -> Any:
+    child = elem.find(tag) if elem is not None else None
+    if child is None or child.text is None:
+        return default
+    return child.text.strip()
@@ -1,16 +1,143 @@
+import contextlib
+import functools
+import hashlib
+import io
 import json
 import logging
+import math
 import os
 import pathlib
+import random
+import re
+import threading
+import time
 import warnings
-from typing import List, Optional, Tuple
-from urllib.parse import urlparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import quote, unquote, urlparse
 
-import boto3
-from botocore.exceptions import ClientError
-from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 
+from .stats import count
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+    from botocore.client import BaseClient
+
+# boto3 and sklearn are imported where they are used, they take most of the import time
+# of this package and most scripts only need a few of these functions.
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_POOL_CONNECTIONS = 64
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+# Larger objects can't be copied with a single CopyObject request
+_MAX_COPY_OBJECT_SIZE = 5 * 1024**3
+DEFAULT_LISTING_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "ml_dronebase_data_utils", "listings"
+)
+# The listing cache directories used by this process, writes invalidate all of them
+_LISTING_CACHE_DIRS = {DEFAULT_LISTING_CACHE_DIR}
+
+
+def get_client(
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+) -> "BaseClient":
+    """Get the S3 client shared by all functions in this module.
+
+    The client, and its connection pool, is created once per process and reused.
+    boto3 clients are thread safe so it can be used from the transfer threads.
+
+    Args:
+        max_pool_connections (int, optional): The size of the connection pool.
+            Defaults to DEFAULT_MAX_POOL_CONNECTIONS.
+
+    Returns:
+        BaseClient: The S3 client.
+    """
+    return _get_client(os.getpid(), max_pool_connections)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_client(pid: int, max_pool_connections: int) -> "BaseClient":
+    import boto3
+    from botocore.config import Config
+
+    # Keyed on the pid so forked worker processes don't share connections with their parent
+    config = Config(
+        max_pool_connections=max_pool_connections, retries={"mode": "standard"}
+    )
+    client = boto3.client("s3", config=config)
+    client.meta.events.register("before-call.s3", _count_request)
+    return client
+
+
+def _count_request(model, **kwargs) -> None:
+    """Count the API calls, including retried and paginated calls, of `stats` blocks."""
+    count("s3.requests")
+    count(f"s3.requests.{model.name}")
+
+
+def _transfer_config(
+    multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+    multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+) -> "TransferConfig":
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize
+    )
+
+
+def _run_concurrently(
+    fn: Callable[..., Any],
+    items: Iterable[Tuple],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    total: Optional[int] = None,
+    desc: Optional[str] = None,
+) -> None:
+    """Call `fn(*item)` for every item on a thread pool.
+
+    At most `2 * max_workers` items are in flight at any time so that large listings
+    aren't turned into millions of pending futures. The first error stops the submission
+    of new items and is raised once the in-flight items are done.
+    """
+    max_in_flight = 2 * max_workers
+    in_flight = set()
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(
+        total=total, desc=desc
+    ) as progress:
+        for item in items:
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                progress.update(len(done))
+                error = next((f.exception() for f in done if f.exception()), None)
+                if error is not None:
+                    break
+            in_flight.add(executor.submit(fn, *item))
+
+        for future in in_flight:
+            if future.exception() is not None and error is None:
+                error = future.exception()
+        progress.update(len(in_flight))
+
+    if error is not None:
+        raise error
+
 
 def is_json(myjson: str) -> bool:
     """Checks if the string is a json file.
@@ -30,35 +157,19 @@ def is_json(myjson: str) -> bool:
 
 
 def list_prefixes(bucket_name, prefix):
-    client = boto3.client("s3")
-    paginator = client.get_paginator("list_objects")
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter="/")
-
-    objects = []
-    for page in page_iterator:
-        for key in page["CommonPrefixes"]:
-            keyString = key["Prefix"]
-            objects.append(keyString)
-    return objects
+    return list(_iter_common_prefixes(get_client(), bucket_name, prefix))
 
 
 def list_files(bucket_name, prefix):
-    client = boto3.client("s3")
-    paginator = client.get_paginator("list_objects")
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-
-    objects = []
-    for page in page_iterator:
-        for key in page["Contents"]:
-            keyString = key["Key"]
-            objects.append(keyString)
-    return objects
+    return [obj["Key"] for obj in _iter_objects(get_client(), bucket_name, prefix)]
 
 
 def list_prefix(
     s3_url: str,
     filter_files: Optional[bool] = False,
     filter_prefixes: Optional[bool] = False,
+    cache_ttl: Optional[float] = None,
+    cache_dir: str = DEFAULT_LISTING_CACHE_DIR,
 ) -> List[str]:
     """List urls to all files and prefixes within the path of the given url.
 
@@ -68,6 +179,10 @@ def list_prefix(
         to the files within the given url. Defaults to False.
         filter_prefixes (Optional[bool]): If true, output will only contain urls
         to the prefixes within the given url. Defaults to False.
+        cache_ttl (Optional[float]): Reuse a listing cached on disk for this many
+        seconds, see `iter_objects`. Defaults to None, always list.
+        cache_dir (str): The directory of the listing cache.
+        Defaults to DEFAULT_LISTING_CACHE_DIR.
 
     Returns:
         List[str]: The files and/or prefixes within the given url.
@@ -76,20 +191,238 @@ def list_prefix(
     assert not (filter_files and filter_prefixes), "Can't filter files and prefixes"
 
     bucket_name, prefix = _parse_url(s3_url)
-    if filter_files:
-        objects = list_files(bucket_name, prefix)
-    elif filter_prefixes:
-        objects = list_prefixes(bucket_name, prefix)
+    keys: List[str] = []
+    if not filter_prefixes:
+        if cache_ttl is None:
+            files = (
+                obj["Key"] for obj in _iter_objects(get_client(), bucket_name, prefix)
+            )
+        else:
+            files = _cached_listing(
+                bucket_name, prefix, "", cache_ttl, cache_dir, keys_only=True
+            ).keys
+        keys.extend(key for key in files if key[-1] != "/")
+    if not filter_files:
+        if cache_ttl is None:
+            prefixes = _iter_common_prefixes(get_client(), bucket_name, prefix)
+        else:
+            prefixes = _cached_listing(
+                bucket_name, prefix, "/", cache_ttl, cache_dir, keys_only=True
+            ).keys
+        keys.extend(prefixes)
 
-    files = [
-        os.path.join("s3://", bucket_name, obj) for obj in objects if obj != prefix
-    ]
+    base_url = f"s3://{bucket_name}/"
+    return [base_url + key for key in keys if key != prefix]
+
+
+class S3Object(NamedTuple):
+    """An object of an S3 listing."""
+
+    key: str
+    size: int
+    etag: str
+    # POSIX timestamp
+    last_modified: float
+
+
+def iter_objects(
+    s3_url: str,
+    cache_ttl: Optional[float] = None,
+    cache_dir: str = DEFAULT_LISTING_CACHE_DIR,
+) -> Iterator[S3Object]:
+    """Iterate over every object under an S3 url, one ListObjectsV2 page at a time.
+
+    With `cache_ttl` the listing is saved in `cache_dir` and reused by later calls, e.g.
+    repeated runs of a batch script, until it is `cache_ttl` seconds old. Writes made with
+    this module (`open_url`, `upload_file`, `upload_dir`, `sync_dir`, `move_files`)
+    invalidate the cached listings they affect, changes made by other tools are only
+    picked up once the cache expires.
 
-    if filter_files:
-        files = [f for f in files if f[-1] != "/"]
-    elif filter_prefixes:
-        files = [f for f in files if f[-1] == "/"]
-    return files
+    Args:
+        s3_url (str): The S3 url to list, every key starting with its path is listed.
+        cache_ttl (Optional[float], optional): The maximum age in seconds of a cached
+            listing. Defaults to None, always list.
+        cache_dir (str, optional): The directory of the listing cache.
+            Defaults to DEFAULT_LISTING_CACHE_DIR.
+
+    Yields:
+        S3Object: The key, size, ETag and modification time of every object.
+    """
+    bucket_name, prefix = _parse_url(s3_url)
+    if cache_ttl is None:
+        for obj in _iter_objects(get_client(), bucket_name, prefix):
+            yield _to_s3_object(obj)
+    else:
+        listing = _cached_listing(bucket_name, prefix, "", cache_ttl, cache_dir)
+        yield from map(S3Object, *listing)
+
+
+def iter_prefixes(
+    s3_url: str,
+    cache_ttl: Optional[float] = None,
+    cache_dir: str = DEFAULT_LISTING_CACHE_DIR,
+) -> Iterator[str]:
+    """Iterate over the prefixes right under an S3 url, i.e. its "sub-directories".
+
+    Args:
+        s3_url (str): The S3 url to list.
+        cache_ttl (Optional[float], optional): See `iter_objects`. Defaults to None.
+        cache_dir (str, optional): See `iter_objects`.
+            Defaults to DEFAULT_LISTING_CACHE_DIR.
+
+    Yields:
+        str: The keys of the prefixes, ending with "/".
+    """
+    bucket_name, prefix = _parse_url(s3_url)
+    if cache_ttl is None:
+        yield from _iter_common_prefixes(get_client(), bucket_name, prefix)
+    else:
+        yield from _cached_listing(
+            bucket_name, prefix, "/", cache_ttl, cache_dir, keys_only=True
+        ).keys
+
+
+def invalidate_listings(s3_url: str, cache_dir: Optional[str] = None) -> None:
+    """Remove the cached listings that contain, or are inside, the path of an S3 url.
+
+    Args:
+        s3_url (str): The S3 url that changed.
+        cache_dir (Optional[str], optional): The directory of the listing cache. Defaults
+            to every cache directory listings were cached in by this process, and
+            DEFAULT_LISTING_CACHE_DIR.
+    """
+    bucket_name, key = _parse_url(s3_url)
+    cache_dirs = [cache_dir] if cache_dir is not None else list(_LISTING_CACHE_DIRS)
+    for directory in cache_dirs:
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            try:
+                cached_bucket, cached_prefix = _listing_location(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if cached_bucket == bucket_name and (
+                key.startswith(cached_prefix) or cached_prefix.startswith(key)
+            ):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+
+class _Listing(NamedTuple):
+    """The columns of a listing, only the keys are loaded for `keys_only` listings."""
+
+    keys: List[str]
+    sizes: List[int]
+    etags: List[str]
+    last_modified: List[float]
+
+
+def _to_s3_object(obj: Dict[str, Any]) -> S3Object:
+    return S3Object(
+        obj["Key"], obj["Size"], obj["ETag"], obj["LastModified"].timestamp()
+    )
+
+
+def _cached_listing(
+    bucket_name: str,
+    prefix: str,
+    delimiter: str,
+    cache_ttl: float,
+    cache_dir: str,
+    keys_only: bool = False,
+) -> _Listing:
+    """List a prefix, or load its listing from the cache if it is recent enough."""
+    _LISTING_CACHE_DIRS.add(cache_dir)
+    path = os.path.join(cache_dir, _listing_filename(bucket_name, prefix, delimiter))
+    try:
+        if time.time() - os.path.getmtime(path) < cache_ttl:
+            return _load_listing(path, keys_only)
+    except (OSError, ValueError, KeyError):
+        # Missing or unreadable, list again
+        pass
+
+    client = get_client()
+    if delimiter:
+        keys = list(_iter_common_prefixes(client, bucket_name, prefix))
+        listing = _Listing(keys, [0] * len(keys), [""] * len(keys), [0.0] * len(keys))
+    else:
+        objects = [
+            _to_s3_object(obj) for obj in _iter_objects(client, bucket_name, prefix)
+        ]
+        listing = (
+            _Listing(*map(list, zip(*objects))) if objects else _Listing([], [], [], [])
+        )
+    _save_listing(path, bucket_name, prefix, listing)
+    return listing
+
+
+def _listing_filename(bucket_name: str, prefix: str, delimiter: str) -> str:
+    suffix = ".prefixes.npz" if delimiter else ".objects.npz"
+    name = quote(f"{bucket_name}/{prefix}", safe="")
+    if len(name) + len(suffix) > 200:
+        name = "sha1-" + hashlib.sha1(name.encode()).hexdigest()
+    return name + suffix
+
+
+def _listing_location(path: str) -> Tuple[str, str]:
+    """Get the bucket and prefix of a cached listing."""
+    name = os.path.basename(path)
+    for suffix in (".objects.npz", ".prefixes.npz"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+            break
+    else:
+        raise ValueError(f"{path} isn't a cached listing")
+    if name.startswith("sha1-"):
+        import numpy as np
+
+        with np.load(path) as data:
+            return str(data["bucket"]), str(data["prefix"])
+    bucket_name, _, prefix = unquote(name).partition("/")
+    return bucket_name, prefix
+
+
+def _save_listing(path: str, bucket_name: str, prefix: str, listing: _Listing) -> None:
+    import numpy as np
+
+    # Keys and ETags are stored as newline separated blobs, which load much faster than
+    # arrays of strings. S3 keys can contain newlines, such listings aren't cached.
+    if any("\n" in key for key in listing.keys):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(
+            file,
+            bucket=np.asarray(bucket_name),
+            prefix=np.asarray(prefix),
+            count=np.asarray(len(listing.keys)),
+            keys=np.frombuffer("\n".join(listing.keys).encode(), dtype=np.uint8),
+            sizes=np.asarray(listing.sizes, dtype=np.int64),
+            etags=np.frombuffer("\n".join(listing.etags).encode(), dtype=np.uint8),
+            last_modified=np.asarray(listing.last_modified, dtype=np.float64),
+        )
+    # Atomic, concurrent readers see either the previous or the new listing
+    os.replace(tmp_path, path)
+
+
+def _load_listing(path: str, keys_only: bool = False) -> _Listing:
+    import numpy as np
+
+    with np.load(path) as data:
+        count = int(data["count"])
+        if count == 0:
+            return _Listing([], [], [], [])
+        keys = data["keys"].tobytes().decode().split("\n")
+        if keys_only:
+            return _Listing(keys, [], [], [])
+        return _Listing(
+            keys,
+            data["sizes"].tolist(),
+            data["etags"].tobytes().decode().split("\n"),
+            data["last_modified"].tolist(),
+        )
 
 
 def upload_file(local_path: str, s3_url: str, exist_ok: bool = True):
@@ -100,55 +433,95 @@ def upload_file(local_path: str, s3_url: str, exist_ok: bool = True):
         s3_url (str): s3 url to upload file to.
         exist_ok (bool, optional): Decides whether or not to ignore existing file. Defaults to True.
     """
+    from botocore.exceptions import ClientError
+
     bucket_name, prefix = _parse_url(s3_url)
-    client = boto3.client("s3")
+    client = get_client()
 
-    filename = os.path.basename(local_path)
-
-    if not pathlib.Path(prefix).suffix:
-        new_prefix = os.path.join(prefix, filename)
-    else:
-        if pathlib.Path(prefix).suffix == pathlib.Path(filename).suffix:
-            new_prefix = prefix
-        else:
-            new_prefix = os.path.join(os.path.dirname(prefix), filename)
-            warnings.warn(
-                "Mismatched file extensions, converting prefix to local file format."
-            )
+    new_prefix = upload_key(prefix, os.path.basename(local_path))
 
     if exist_ok:
         try:
             client.head_object(Bucket=bucket_name, Key=new_prefix)
         except ClientError:
             client.upload_file(local_path, bucket_name, new_prefix)
+            count("s3.bytes_written", os.path.getsize(local_path))
     else:
         client.upload_file(local_path, bucket_name, new_prefix)
+        count("s3.bytes_written", os.path.getsize(local_path))
+    invalidate_listings(f"s3://{bucket_name}/{new_prefix}")
+
+
+def upload_key(prefix: str, filename: str) -> str:
+    """Get the key `upload_file` writes a file named `filename` to.
+
+    The file is written in `prefix` if it has no extension, to `prefix` itself if it has
+    the extension of the file, and next to `prefix` with the file name otherwise.
+
+    Args:
+        prefix (str): The key or prefix of the destination.
+        filename (str): The name of the uploaded file.
+
+    Returns:
+        str: The key of the uploaded file.
+    """
+    if not pathlib.Path(prefix).suffix:
+        return os.path.join(prefix, filename)
+    if pathlib.Path(prefix).suffix == pathlib.Path(filename).suffix:
+        return prefix
+    warnings.warn("Mismatched file extensions, converting prefix to local file format.")
+    return os.path.join(os.path.dirname(prefix), filename)
 
 
-def upload_dir(local_path: str, s3_url: str, exist_ok: bool = True):
+def upload_dir(
+    local_path: str,
+    s3_url: str,
+    exist_ok: bool = True,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+    multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
+):
     """Upload data from a local directory to an S3 bucket.
 
     Args:
         local_path (str): Local directory to upload from.
         s3_url (str): S3 url to upload files in directory to.
         exist_ok (bool): Decides whether or not to ignore existing files. Default True.
+        max_workers (int, optional): Number of files transferred concurrently.
+            Defaults to DEFAULT_MAX_WORKERS.
+        multipart_threshold (int, optional): Files larger than this many bytes are
+            uploaded in parts. Defaults to DEFAULT_MULTIPART_THRESHOLD.
+        multipart_chunksize (int, optional): The size in bytes of each part.
+            Defaults to DEFAULT_MULTIPART_CHUNKSIZE.
     """
     bucket_name, prefix = _parse_url(s3_url)
-    client = boto3.client("s3")
+    client = get_client()
+    config = _transfer_config(multipart_threshold, multipart_chunksize)
 
-    files = os.listdir(local_path)
-    num_files = len(files)
-    for _, filename in enumerate(tqdm(files, total=num_files)):
-        file_path = os.path.join(local_path, filename)
-        s3_path = os.path.join(prefix, filename)
+    files = [
+        f for f in os.listdir(local_path) if os.path.isfile(os.path.join(local_path, f))
+    ]
+    items = [
+        (os.path.join(local_path, filename), os.path.join(prefix, filename))
+        for filename in files
+    ]
+    if exist_ok:
+        # A single listing of the destination instead of a HEAD request per file
+        existing = set(
+            obj["Key"]
+            for obj in _iter_objects(client, bucket_name, os.path.join(prefix, ""))
+        )
+        items = [item for item in items if item[1] not in existing]
 
-        if exist_ok:
-            try:
-                client.head_object(Bucket=bucket_name, Key=s3_path)
-            except ClientError:
-                client.upload_file(file_path, bucket_name, s3_path)
-        else:
-            client.upload_file(file_path, bucket_name, s3_path)
+    def upload(file_path: str, key: str):
+        client.upload_file(file_path, bucket_name, key, Config=config)
+
+    try:
+        _run_concurrently(
+            upload, items, max_workers, total=len(items), desc="Uploading"
+        )
+    finally:
+        invalidate_listings(f"s3://{bucket_name}/{os.path.join(prefix, '')}")
 
 
 def download_file(s3_url: str, local_path: str, size_limit: Optional[int] = None):
@@ -161,7 +534,7 @@ def download_file(s3_url: str, local_path: str, size_limit: Optional[int] = None
         Default None.
     """
     bucket_name, prefix = _parse_url(s3_url)
-    s3 = boto3.client("s3")
+    s3 = get_client()
     if size_limit is not None:
         response = s3.head_object(Bucket=bucket_name, Key=prefix)
         file_size = int(response["ContentLength"])
@@ -171,10 +544,244 @@ def download_file(s3_url: str, local_path: str, size_limit: Optional[int] = None
             )
 
     s3.download_file(bucket_name, prefix, local_path)
+    count("s3.bytes_read", os.path.getsize(local_path))
+
+
+def open_url(
+    url: str,
+    mode: str = "rb",
+    encoding: Optional[str] = None,
+    part_size: int = DEFAULT_MULTIPART_CHUNKSIZE,
+) -> IO:
+    """Open a local path or an S3 url as a file object.
+
+    S3 objects are streamed without touching the local disk. Reads are served from the
+    GET response as the file is read, seeking issues a ranged GET. Writes are buffered in
+    memory and uploaded in parts of `part_size` bytes as they fill up, objects smaller than
+    a part are sent with a single PUT when the file is closed. The object only exists once
+    the file is closed, leaving a `with` block with an exception aborts the upload.
+
+    e.g.,
+        with open_url("s3://bucket/labels/ortho.xml", "w") as file:
+            writer.save(file)
+
+    Args:
+        url (str): A local path or an S3 url.
+        mode (str, optional): "rb", "wb", or "r" and "w" for text. Local paths accept any
+            mode of `open`. Defaults to "rb".
+        encoding (Optional[str], optional): The encoding of text modes, S3 objects default
+            to utf-8. Defaults to None.
+        part_size (int, optional): The size of the uploaded parts.
+            Defaults to DEFAULT_MULTIPART_CHUNKSIZE.
+
+    Returns:
+        IO: A binary or text file object.
+    """
+    if "s3://" not in url:
+        return open(url, mode, encoding=encoding)
+
+    kind = mode.replace("b", "").replace("t", "")
+    if kind not in ("r", "w"):
+        raise ValueError(f"Unsupported mode {mode} for an S3 url, use r or w.")
+    bucket_name, key = _parse_url(url)
+    client = get_client()
+    if kind == "r":
+        file = io.BufferedReader(
+            _S3Reader(client, bucket_name, key), buffer_size=_READ_BUFFER_SIZE
+        )
+    else:
+        file = _S3Writer(client, bucket_name, key, part_size)
+    if "b" in mode:
+        return file
+    return _TextIOWrapper(file, encoding=encoding or "utf-8")
+
+
+def gdal_path(url: str) -> str:
+    """Get the GDAL path of a local path or S3 url, e.g. to read an ortho in place with
+    rasterio. S3 urls map to `/vsis3/` paths that GDAL reads with ranged requests.
+    """
+    if "s3://" not in url:
+        return url
+    bucket_name, key = _parse_url(url)
+    return f"/vsis3/{bucket_name}/{key}"
+
+
+_READ_BUFFER_SIZE = 1024 * 1024
+# Forward seeks shorter than this read through the current response instead of
+# starting a new request
+_MAX_SEEK_READ = 1024 * 1024
+
+
+class _S3Reader(io.RawIOBase):
+    """A seekable read-only stream over an S3 object."""
+
+    def __init__(self, client: "BaseClient", bucket_name: str, key: str):
+        self._client = client
+        self._bucket_name = bucket_name
+        self._key = key
+        response = client.get_object(Bucket=bucket_name, Key=key)
+        self._size = response["ContentLength"]
+        self._body = response["Body"]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self._size:
+            return 0
+        if self._body is None:
+            self._body = self._client.get_object(
+                Bucket=self._bucket_name,
+                Key=self._key,
+                Range=f"bytes={self._position}-",
+            )["Body"]
+        data = self._body.read(len(buffer))
+        buffer[: len(data)] = data
+        self._position += len(data)
+        count("s3.bytes_read", len(data))
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+
+        skip = offset - self._position
+        if self._body is not None and 0 < skip <= _MAX_SEEK_READ:
+            while skip > 0:
+                data = self._body.read(skip)
+                if not data:
+                    break
+                skip -= len(data)
+                self._position += len(data)
+        if offset != self._position:
+            self._close_body()
+            self._position = offset
+        return self._position
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+class _S3Writer(io.BufferedIOBase):
+    """A write-only stream uploading to an S3 object in parts as it is written."""
+
+    def __init__(
+        self, client: "BaseClient", bucket_name: str, key: str, part_size: int
+    ):
+        self._client = client
+        self._bucket_name = bucket_name
+        self._key = key
+        self._part_size = part_size
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        data = memoryview(data).cast("B")
+        self._buffer += data
+        while len(self._buffer) >= self._part_size:
+            self._upload_part(bytes(self._buffer[: self._part_size]))
+            del self._buffer[: self._part_size]
+        return len(data)
+
+    def _upload_part(self, data: bytes):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket_name, Key=self._key
+            )["UploadId"]
+        number = len(self._parts) + 1
+        response = self._client.upload_part(
+            Bucket=self._bucket_name,
+            Key=self._key,
+            PartNumber=number,
+            UploadId=self._upload_id,
+            Body=data,
+        )
+        count("s3.bytes_written", len(data))
+        self._parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    def close(self):
+        """Upload the remaining data and create the object."""
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._client.put_object(
+                    Bucket=self._bucket_name, Key=self._key, Body=bytes(self._buffer)
+                )
+                count("s3.bytes_written", len(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part(bytes(self._buffer))
+                self._client.complete_multipart_upload(
+                    Bucket=self._bucket_name,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts},
+                )
+        except BaseException:
+            self.abort()
+            raise
+        self._buffer = bytearray()
+        super().close()
+        invalidate_listings(f"s3://{self._bucket_name}/{self._key}")
+
+    def abort(self):
+        """Discard the written data without creating the object."""
+        if self.closed:
+            return
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id
+            )
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class _TextIOWrapper(io.TextIOWrapper):
+    """A text wrapper that aborts S3 uploads left with an exception."""
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None and isinstance(self.buffer, _S3Writer):
+            self.buffer.abort()
+        super().__exit__(exc_type, *args)
 
 
 def download_dir(
-    s3_url: str, local_path: Optional[str] = None, size_limit: Optional[int] = None
+    s3_url: str,
+    local_path: Optional[str] = None,
+    size_limit: Optional[int] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+    multipart_chunksize: int = DEFAULT_MULTIPART_CHUNKSIZE,
 ):
     """Download the contents of a folder directory.
 
@@ -183,42 +790,191 @@ def download_dir(
         local_path (str, optional): Local directory to store files in.
         size_limit (int, optional): Limits the file size accepted to size_limit bytes.
         Default None.
+        max_workers (int, optional): Number of files transferred concurrently.
+            Defaults to DEFAULT_MAX_WORKERS.
+        multipart_threshold (int, optional): Files larger than this many bytes are
+            downloaded in parts. Defaults to DEFAULT_MULTIPART_THRESHOLD.
+        multipart_chunksize (int, optional): The size in bytes of each part.
+            Defaults to DEFAULT_MULTIPART_CHUNKSIZE.
     """
     bucket_name, prefix = _parse_url(s3_url)
-    s3 = boto3.resource("s3")
-    bucket = s3.Bucket(bucket_name)
-    objects = bucket.objects.filter(Prefix=prefix)
-    num_objects = sum(1 for _ in objects.all())
-    for _, obj in enumerate(tqdm(objects, total=num_objects)):
+    client = get_client()
+    config = _transfer_config(multipart_threshold, multipart_chunksize)
+
+    items = []
+    for obj in _iter_objects(client, bucket_name, prefix):
+        key = obj["Key"]
         target = (
-            obj.key
+            key
             if local_path is None
-            else os.path.join(local_path, os.path.relpath(obj.key, prefix))
+            else os.path.join(local_path, os.path.relpath(key, prefix))
         )
-        if not os.path.exists(os.path.dirname(target)):
-            os.makedirs(os.path.dirname(target))
-        if obj.key[-1] == "/":
+        if os.path.dirname(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        if key[-1] == "/":
             continue
         if size_limit is not None:
-            if obj.size > size_limit:
+            if obj["Size"] > size_limit:
                 continue
-        bucket.download_file(obj.key, target)
+        items.append((key, target))
 
+    def download(key: str, target: str):
+        client.download_file(bucket_name, key, target, Config=config)
 
-def sync_dir(from_dir: str, to_dir: str, exist_ok: Optional[bool] = True) -> None:
-    """Download the contents of a directory in parallel using aws s3 sync.
+    _run_concurrently(
+        download, items, max_workers, total=len(items), desc="Downloading"
+    )
+
+
+class _ManifestEntry(NamedTuple):
+    size: int
+    mtime: float
+    etag: Optional[str] = None
+
+
+@dataclass
+class SyncResult:
+    """Summary of a `sync_dir` run."""
+
+    transferred: List[str] = field(default_factory=list)
+    skipped: int = 0
+    bytes_transferred: int = 0
+    dry_run: bool = False
+
+    @property
+    def files_transferred(self) -> int:
+        return len(self.transferred)
+
+
+def sync_dir(
+    from_dir: str,
+    to_dir: str,
+    exist_ok: Optional[bool] = True,
+    dry_run: bool = False,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> SyncResult:
+    """Sync the contents of a directory, local to S3, S3 to local or S3 to S3.
+
+    Like `aws s3 sync`, a file is transferred when it is missing from to_dir, when the sizes
+    differ or when the source is newer than the destination. S3 to S3 syncs compare ETags
+    first, objects are copied with a single request so the copy keeps the ETag of a source
+    uploaded in one part. Multipart ETags aren't content hashes, such objects are compared
+    by modification time. Downloaded files get the modification time of their S3 object so
+    they are skipped on the next sync.
 
     Args:
         from_dir (str): S3 url or local path that is the master dir.
         to_dir (str): S3 url or local path that will be synced to from_dir (master dir).
         exist_ok (Optional[bool], optional): whether to override existing to_dir. Defaults to True.
+        dry_run (bool, optional): Only compute the files that would be transferred. Defaults to False.
+        max_workers (int, optional): Number of files transferred concurrently.
+            Defaults to DEFAULT_MAX_WORKERS.
+
+    Returns:
+        SyncResult: The transferred files and the number of skipped files and transferred bytes.
     """
-    if "s3://" not in to_dir:
+    from_s3 = "s3://" in from_dir
+    to_s3 = "s3://" in to_dir
+    if not (from_s3 or to_s3):
+        raise ValueError("Either from_dir or to_dir must be an S3 url.")
+    if not to_s3 and not dry_run:
         os.makedirs(to_dir, exist_ok=exist_ok)
     logging.debug(f"Sync from URL: {from_dir}")
     logging.debug(f"Sync to dir: {to_dir}")
-    os.system("aws s3 sync {} {}".format(from_dir, to_dir))
-    logging.debug("Just ran the system command...")
+
+    client = get_client()
+    source = _manifest(client, from_dir)
+    destination = _manifest(client, to_dir)
+
+    result = SyncResult(dry_run=dry_run)
+    items = []
+    for name, entry in sorted(source.items()):
+        if _is_up_to_date(entry, destination.get(name)):
+            result.skipped += 1
+            continue
+        result.transferred.append(name)
+        result.bytes_transferred += entry.size
+        items.append((name, entry))
+
+    if not dry_run:
+        from_bucket, from_prefix = _parse_dir_url(from_dir) if from_s3 else ("", "")
+        to_bucket, to_prefix = _parse_dir_url(to_dir) if to_s3 else ("", "")
+
+        def transfer(name: str, entry: _ManifestEntry):
+            if from_s3 and to_s3:
+                copy_source = {"Bucket": from_bucket, "Key": from_prefix + name}
+                if entry.size <= _MAX_COPY_OBJECT_SIZE:
+                    client.copy_object(
+                        CopySource=copy_source, Bucket=to_bucket, Key=to_prefix + name
+                    )
+                else:
+                    client.copy(copy_source, to_bucket, to_prefix + name)
+            elif to_s3:
+                client.upload_file(
+                    os.path.join(from_dir, name), to_bucket, to_prefix + name
+                )
+            else:
+                target = os.path.join(to_dir, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                client.download_file(from_bucket, from_prefix + name, target)
+                os.utime(target, (entry.mtime, entry.mtime))
+
+        try:
+            _run_concurrently(
+                transfer, items, max_workers, total=len(items), desc="Syncing"
+            )
+        finally:
+            if to_s3:
+                invalidate_listings(f"s3://{to_bucket}/{to_prefix}")
+
+    logging.info(
+        f"Synced {result.files_transferred} files ({result.bytes_transferred} bytes) "
+        f"from {from_dir} to {to_dir}, {result.skipped} files up to date"
+    )
+    return result
+
+
+def _manifest(client: "BaseClient", url: str) -> Dict[str, _ManifestEntry]:
+    """Index the files of a local directory or S3 prefix by their relative path."""
+    manifest = {}
+    if "s3://" in url:
+        bucket_name, prefix = _parse_dir_url(url)
+        for obj in _iter_objects(client, bucket_name, prefix):
+            if obj["Key"][-1] == "/":
+                continue
+            manifest[obj["Key"][len(prefix) :]] = _ManifestEntry(
+                obj["Size"], obj["LastModified"].timestamp(), obj["ETag"]
+            )
+    elif os.path.isdir(url):
+        for root, _, files in os.walk(url):
+            for filename in files:
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                name = pathlib.Path(os.path.relpath(path, url)).as_posix()
+                manifest[name] = _ManifestEntry(stat.st_size, stat.st_mtime)
+    return manifest
+
+
+def _is_up_to_date(
+    source: _ManifestEntry, destination: Optional[_ManifestEntry]
+) -> bool:
+    if destination is None or source.size != destination.size:
+        return False
+    if source.etag is not None and destination.etag is not None:
+        if source.etag == destination.etag:
+            return True
+        # ETags of multipart uploads and copies ("<md5>-<parts>") differ for the same data
+        if "-" not in source.etag and "-" not in destination.etag:
+            return False
+    # S3 modification times have a resolution of one second
+    return math.floor(source.mtime) <= math.floor(destination.mtime)
+
+
+def _parse_dir_url(url: str) -> Tuple[str, str]:
+    bucket_name, prefix = _parse_url(url)
+    if prefix and prefix[-1] != "/":
+        prefix += "/"
+    return bucket_name, prefix
 
 
 def split_dataset(
@@ -226,35 +982,263 @@ def split_dataset(
     train_split: Optional[float] = 0.8,
     labels_url: Optional[str] = None,
     val_split: Optional[float] = None,
+    journal_path: Optional[str] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
 ):
     """train_test_split for files hosted in s3
 
+    The files are moved server side into the split prefixes. When a journal_path is given the
+    planned moves and their progress are recorded in it, running the split again with the same
+    journal resumes an interrupted split with the same assignment of files to splits.
+
     Args:
         data_url (str): s3 url location of data to be split
         train_split (Optional[float], optional): percentage of the dataset reserved for training. Defaults to 0.8.
         labels_url (Optional[str], optional): s3 url location of data labels to be split. Defaults to None.
         val_split (Optional[float], optional): percentage of remaining dataset split into val and test (e.g., if
         train_split = 0.6, val_split = 0.5, the splits will be 60% train, 20% val, and 20% test). Defaults to None.
+        journal_path (Optional[str], optional): local path of the journal file used to resume
+        an interrupted split. Defaults to None.
+        max_workers (int, optional): Number of concurrent copy requests. Defaults to DEFAULT_MAX_WORKERS.
     """
-    if labels_url is not None:
-        _split_labeled_dataset(data_url, labels_url, train_split, val_split)
-    else:
-        _split_unlabeled_dataset(data_url, train_split, val_split)
-
-
-def move_files(bucket: str, prefix: str, files: List[str]):
+    journal = _MoveJournal(journal_path) if journal_path is not None else None
+    moves = journal.planned() if journal is not None else []
+    if not moves:
+        if labels_url is not None:
+            moves = _split_labeled_dataset(data_url, labels_url, train_split, val_split)
+        else:
+            moves = _split_unlabeled_dataset(data_url, train_split, val_split)
+        if journal is not None:
+            journal.plan(moves)
+    _move_objects(moves, journal, max_workers)
+
+
+def move_files(
+    bucket: str,
+    prefix: str,
+    files: List[str],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    journal_path: Optional[str] = None,
+):
     """Move files from within s3.
 
+    The files are copied server side concurrently, the sources are then deleted in batches.
+
     Args:
         bucket (str): bucket name from within which to move files.
         prefix (str): prefix to move the files to.
         files (List[str]): list of files being moved.
+        max_workers (int, optional): Number of concurrent copy requests. Defaults to DEFAULT_MAX_WORKERS.
+        journal_path (Optional[str], optional): local path of a journal file recording the
+        progress of the move, an interrupted move is resumed from it. Defaults to None.
+
+    Raises:
+        ValueError: If the journal records a different move than the one requested.
+    """
+    journal = _MoveJournal(journal_path) if journal_path is not None else None
+    moves = _plan_moves(bucket, prefix, files)
+    if journal is not None:
+        planned = journal.planned()
+        if planned and set(planned) != set(moves):
+            raise ValueError(
+                f"The journal {journal_path} records a different move, "
+                "remove it to start a new move."
+            )
+        journal.plan(moves)
+    _move_objects(moves, journal, max_workers)
+
+
+class _Move(NamedTuple):
+    bucket: str
+    source: str
+    destination: str
+
+
+class _MoveJournal:
+    """Append only JSON lines journal of the planned, copied and deleted objects of a move."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._planned: List[_Move] = []
+        self.copied = set()
+        self.deleted = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        # A partially written last line of an interrupted run
+                        continue
+                    entry = json.loads(line)
+                    move = _Move(entry["bucket"], entry["source"], entry["destination"])
+                    if entry["event"] == "planned":
+                        self._planned.append(move)
+                    elif entry["event"] == "copied":
+                        self.copied.add(move)
+                    elif entry["event"] == "deleted":
+                        self.deleted.add(move)
+
+    def planned(self) -> List[_Move]:
+        return list(self._planned)
+
+    def plan(self, moves: List[_Move]) -> None:
+        if self._planned:
+            return
+        self._planned = list(moves)
+        self._write("planned", moves)
+
+    def record(self, event: str, moves: List[_Move]) -> None:
+        getattr(self, event).update(moves)
+        self._write(event, moves)
+
+    def _write(self, event: str, moves: List[_Move]) -> None:
+        lines = "".join(
+            json.dumps({"event": event, **move._asdict()}) + "\n" for move in moves
+        )
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _plan_moves(bucket: str, prefix: str, files: List[str]) -> List[_Move]:
+    """Plan the moves of `files` to `prefix`, keeping their basename.
+
+    Raises:
+        ValueError: If several files would be moved to the same key, the sources are
+            deleted once copied so all but one of them would be lost.
     """
-    s3 = boto3.resource("s3")
-    for file in files:
-        copy_source = {"Bucket": bucket, "Key": file}
-        new_prefix = os.path.join(prefix, os.path.basename(file))
-        s3.meta.client.copy(copy_source, bucket, new_prefix)
+    moves = [
+        _Move(bucket, file, os.path.join(prefix, os.path.basename(file)))
+        for file in files
+    ]
+    sources: Dict[str, str] = {}
+    for move in moves:
+        other = sources.setdefault(move.destination, move.source)
+        if other != move.source:
+            raise ValueError(
+                f"{other} and {move.source} would both be moved to "
+                f"s3://{bucket}/{move.destination}."
+            )
+    return moves
+
+
+def _move_objects(
+    moves: List[_Move],
+    journal: Optional[_MoveJournal] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> None:
+    """Copy every object to its destination, then delete the sources in batches of 1000."""
+    from botocore.exceptions import ClientError
+
+    client = get_client()
+    moves = [m for m in moves if m.source != m.destination]
+    copied = journal.copied if journal is not None else set()
+    deleted = journal.deleted if journal is not None else set()
+
+    def copy(move: _Move):
+        copy_source = {"Bucket": move.bucket, "Key": move.source}
+        try:
+            _with_retries(
+                client.copy_object,
+                CopySource=copy_source,
+                Bucket=move.bucket,
+                Key=move.destination,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in (
+                "InvalidRequest",
+                "EntityTooLarge",
+            ):
+                raise
+            # Objects larger than 5GB need a multipart copy
+            _with_retries(client.copy, copy_source, move.bucket, move.destination)
+        if journal is not None:
+            journal.record("copied", [move])
+
+    # The listings of the source and destination "directories" are out of date
+    for bucket, directory in set(
+        (m.bucket, os.path.dirname(key))
+        for m in moves
+        for key in (m.source, m.destination)
+    ):
+        invalidate_listings(f"s3://{bucket}/{os.path.join(directory, '')}")
+
+    to_copy = [(m,) for m in moves if m not in copied and m not in deleted]
+    _run_concurrently(copy, to_copy, max_workers, total=len(to_copy), desc="Copying")
+
+    to_delete: Dict[str, List[_Move]] = {}
+    for move in moves:
+        if move not in deleted:
+            to_delete.setdefault(move.bucket, []).append(move)
+    for bucket, bucket_moves in to_delete.items():
+        for i in range(0, len(bucket_moves), 1000):
+            batch = bucket_moves[i : i + 1000]
+            response = _with_retries(
+                client.delete_objects,
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": m.source} for m in batch], "Quiet": True},
+            )
+            errors = response.get("Errors", [])
+            if errors:
+                raise RuntimeError(
+                    f"Failed to delete {len(errors)} objects from {bucket}, "
+                    f"e.g. {errors[0]['Key']}: {errors[0].get('Message')}"
+                )
+            if journal is not None:
+                journal.record("deleted", batch)
+
+
+def _with_retries(
+    fn: Callable[..., Any], *args, attempts: int = 5, base_delay: float = 0.5, **kwargs
+) -> Any:
+    """Call fn, retrying throttling and server errors with exponential backoff and jitter."""
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except (ClientError, BotoCoreError) as e:
+            code = (
+                e.response.get("Error", {}).get("Code", "")
+                if isinstance(e, ClientError)
+                else ""
+            )
+            retryable = not isinstance(e, ClientError) or code in _RETRYABLE_ERRORS
+            if not retryable or attempt == attempts - 1:
+                raise
+            delay = base_delay * 2**attempt
+            time.sleep(delay + random.uniform(0, delay))
+
+
+_RETRYABLE_ERRORS = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestTimeout",
+    "InternalError",
+    "ServiceUnavailable",
+    "503",
+    "500",
+}
+
+
+def _iter_objects(
+    client: "BaseClient", bucket_name: str, prefix: str
+) -> Iterator[Dict[str, Any]]:
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        # Empty pages have no Contents
+        yield from page.get("Contents", [])
+
+
+def _iter_common_prefixes(
+    client: "BaseClient", bucket_name: str, prefix: str
+) -> Iterator[str]:
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            yield common_prefix["Prefix"]
 
 
 def _parse_url(url: str) -> Tuple[str, str]:
@@ -273,25 +1257,109 @@ def _make_split_prefix(prefix: str, split: str) -> str:
     return split_prefix
 
 
-def delete_missing_pairs(input_data, pair_data):
+class PairingResult(NamedTuple):
+    """Result of `pair_files`."""
+
+    pairs: List[Tuple[str, str]]
+    input_orphans: List[str]
+    pair_orphans: List[str]
+
+
+def pair_files(
+    input_data: List[str],
+    pair_data: List[str],
+    key: Optional[Callable[[str], str]] = None,
+    key_pattern: Optional[str] = None,
+) -> PairingResult:
+    """Pair files from two lists, e.g. images and labels, that share the same key.
+
+    By default the key of a file is its filename without extension. Pairing is done with a
+    hash index of the keys in linear time, every file is used in at most one pair.
+
+    Args:
+        input_data (List[str]): list of file paths to pair, e.g. images.
+        pair_data (List[str]): list of file paths to pair with, e.g. labels.
+        key (Optional[Callable[[str], str]], optional): function computing the key of a file path.
+            Defaults to the filename without extension.
+        key_pattern (Optional[str], optional): regex removed from the keys before matching,
+            e.g. `r"_label$"` to pair `0001.png` with `0001_label.xml`. Defaults to None.
+
+    Returns:
+        PairingResult: The (input, pair) pairs in input order, and the unpaired files of both lists.
+    """
+    key = _pairing_key(key, key_pattern)
+
+    pair_keys = [key(path) for path in pair_data]
+    index = dict(zip(reversed(pair_keys), range(len(pair_keys) - 1, -1, -1)))
+    # Files sharing a key are paired in order
+    duplicates: Dict[str, List[int]] = {}
+    if len(index) < len(pair_keys):
+        for idx, k in enumerate(pair_keys):
+            if index[k] != idx:
+                duplicates.setdefault(k, []).append(idx)
+        for indices in duplicates.values():
+            indices.reverse()
+
+    pairs = []
+    input_orphans = []
+    for path in input_data:
+        k = key(path)
+        idx = index.pop(k, None)
+        if idx is None and k in duplicates and duplicates[k]:
+            idx = duplicates[k].pop()
+        if idx is None:
+            input_orphans.append(path)
+        else:
+            pairs.append((path, pair_data[idx]))
+    unpaired = sorted(
+        list(index.values()) + [i for v in duplicates.values() for i in v]
+    )
+    pair_orphans = [pair_data[idx] for idx in unpaired]
+    return PairingResult(pairs, input_orphans, pair_orphans)
+
+
+def _pairing_key(
+    key: Optional[Callable[[str], str]] = None, key_pattern: Optional[str] = None
+) -> Callable[[str], str]:
+    key = key or _stem
+    if key_pattern is None:
+        return key
+    regex = re.compile(key_pattern)
+    return lambda path: regex.sub("", key(path))
+
+
+def _stem(path: str) -> str:
+    # Same as pathlib.PurePosixPath(path).stem without the cost of building a path object
+    path = path.rstrip("/")
+    name = path[path.rfind("/") + 1 :]
+    i = name.rfind(".")
+    return name[:i] if 0 < i < len(name) - 1 else name
+
+
+def delete_missing_pairs(
+    input_data: List[str],
+    pair_data: List[str],
+    key: Optional[Callable[[str], str]] = None,
+    key_pattern: Optional[str] = None,
+) -> List[str]:
     """Delete items from input data that does not have a corresponding item in pair data
        This assumes that the filenames without extensions to be the same in both input lists
 
     Args:
         input_data (list): list of file paths to check
         pair_data (list): list of file paths to find a match
+        key (Optional[Callable[[str], str]], optional): function computing the key of a file path,
+            see `pair_files`. Defaults to the filename without extension.
+        key_pattern (Optional[str], optional): regex removed from the keys before matching,
+            see `pair_files`. Defaults to None.
 
     Returns:
         list: list of files with missing pairs deleted
     """
-    to_del = []
-    for idx, pth in enumerate(input_data):
-        name = pathlib.Path(pth).stem
-        combined = "\t".join(pair_data)
-        if name not in combined:
-            to_del.append(idx)
-    for index in sorted(to_del, reverse=True):
-        del input_data[index]
+    key = _pairing_key(key, key_pattern)
+
+    pair_keys = set(key(path) for path in pair_data)
+    input_data[:] = [path for path in input_data if key(path) in pair_keys]
     return input_data
 
 
@@ -303,83 +1371,86 @@ def _split_labeled_dataset(
     delete_missing_pairs: Optional[
         bool
     ] = False,  # Assumes filenames without extension to be the same
-):
+) -> List[_Move]:
+    from sklearn.model_selection import train_test_split
+
     data_bucket_name, data_prefix = _parse_url(data_url)
     labels_bucket_name, labels_prefix = _parse_url(labels_url)
 
-    s3 = boto3.resource("s3")
-    data_bucket = s3.Bucket(data_bucket_name)
-    labels_bucket = s3.Bucket(labels_bucket_name)
+    client = get_client()
     data = [
-        x.key
-        for x in data_bucket.objects.filter(Prefix=data_prefix)
-        if x.key[-1] != "/"
+        x["Key"]
+        for x in _iter_objects(client, data_bucket_name, data_prefix)
+        if x["Key"][-1] != "/"
     ]
     labels = [
-        x.key
-        for x in labels_bucket.objects.filter(Prefix=labels_prefix)
-        if x.key[-1] != "/"
+        x["Key"]
+        for x in _iter_objects(client, labels_bucket_name, labels_prefix)
+        if x["Key"][-1] != "/"
     ]
 
     if delete_missing_pairs:
-        # Delete images without labels
-        data = delete_missing_pairs(data, labels)
-
-        # Delete labels without images
-        labels = delete_missing_pairs(labels, data)
+        # Drop images without labels and labels without images, keeping the pairs aligned
+        pairs = pair_files(data, labels).pairs
+        data = [image for image, _ in pairs]
+        labels = [label for _, label in pairs]
 
+    moves = []
     x_train, x_val, y_train, y_val = train_test_split(
         data, labels, train_size=train_split
     )
     split_prefix = _make_split_prefix(data_prefix, "train")
-    move_files(data_bucket_name, split_prefix, x_train)
+    moves += _plan_moves(data_bucket_name, split_prefix, x_train)
     split_prefix = _make_split_prefix(labels_prefix, "train")
-    move_files(labels_bucket_name, split_prefix, y_train)
+    moves += _plan_moves(labels_bucket_name, split_prefix, y_train)
 
     if val_split is not None:
         x_val, x_test, y_val, y_test = train_test_split(
             x_val, y_val, train_size=val_split
         )
         split_prefix = _make_split_prefix(data_prefix, "val")
-        move_files(data_bucket_name, split_prefix, x_val)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_val)
         split_prefix = _make_split_prefix(labels_prefix, "val")
-        move_files(labels_bucket_name, split_prefix, y_val)
+        moves += _plan_moves(labels_bucket_name, split_prefix, y_val)
 
         split_prefix = _make_split_prefix(data_prefix, "test")
-        move_files(data_bucket_name, split_prefix, x_test)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_test)
         split_prefix = _make_split_prefix(labels_prefix, "test")
-        move_files(labels_bucket_name, split_prefix, y_test)
+        moves += _plan_moves(labels_bucket_name, split_prefix, y_test)
     else:
         split_prefix = _make_split_prefix(data_prefix, "val")
-        move_files(data_bucket_name, split_prefix, x_val)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_val)
         split_prefix = _make_split_prefix(labels_prefix, "val")
-        move_files(labels_bucket_name, split_prefix, y_val)
+        moves += _plan_moves(labels_bucket_name, split_prefix, y_val)
+    return moves
 
 
 def _split_unlabeled_dataset(
     data_url: str, train_split: int = 0.8, val_split: Optional[float] = None
-):
+) -> List[_Move]:
+    from sklearn.model_selection import train_test_split
+
     data_bucket_name, data_prefix = _parse_url(data_url)
 
-    s3 = boto3.resource("s3")
-    data_bucket = s3.Bucket(data_bucket_name)
     data = [
-        x.key
-        for x in data_bucket.objects.filter(Prefix=data_prefix)
-        if x.key[-1] != "/"
+        x["Key"]
+        for x in _iter_objects(get_client(), data_bucket_name, data_prefix)
+        if x["Key"][-1] != "/"
     ]
 
+    moves = []
     x_train, x_val = train_test_split(data, train_size=train_split)
     split_prefix = _make_split_prefix(data_prefix, "train")
-    move_files(data_bucket_name, split_prefix, x_train)
+    moves += _plan_moves(data_bucket_name, split_prefix, x_train)
 
     if val_split is not None:
         x_val, x_test = train_test_split(x_val, train_size=val_split)
         split_prefix = _make_split_prefix(data_prefix, "val")
-        move_files(data_bucket_name, split_prefix, x_val)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_val)
 
         split_prefix = _make_split_prefix(data_prefix, "test")
-        move_files(data_bucket_name, split_prefix, x_test)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_test)
     else:
         split_prefix = _make_split_prefix(data_prefix, "val")
-        move_files(data_bucket_name, split_prefix, x_val)
+        moves += _plan_moves(data_bucket_name, split_prefix, x_val)
+    return moves
@@ -0,0 +1,131 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+# Collectors are process wide rather than per context so the S3 transfer threads report
+# to the collector that started them. Nested collectors are merged into their parent.
+_ACTIVE: List["Stats"] = []
+_LOCK = threading.Lock()
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Stats:
+    """Stage timings and counters recorded while a `collect_stats` block runs.
+
+    Timings are the total seconds spent in every stage, e.g. `geojson.read`, and counts
+    are totals of features, boxes, bytes and S3 requests, e.g. `s3.requests.GetObject`.
+    Stages can be nested, a stage's time includes the stages it runs.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with _LOCK:
+            self.timings[name] += seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        with _LOCK:
+            self.counts[name] += value
+
+    def merge(self, other: "Stats") -> "Stats":
+        """Add the timings and counts of another `Stats`, e.g. of another file of a batch.
+
+        Returns:
+            Stats: This instance.
+        """
+        with _LOCK:
+            for name, seconds in other.timings.items():
+                self.timings[name] += seconds
+            for name, value in other.counts.items():
+                self.counts[name] += value
+        return self
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "timings": dict(sorted(self.timings.items())),
+            "counts": dict(sorted(self.counts.items())),
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __repr__(self) -> str:
+        return f"Stats({self.as_dict()})"
+
+
+@contextlib.contextmanager
+def collect_stats(hook: Optional[Callable[[Stats], None]] = None) -> Iterator[Stats]:
+    """Record stage timings and counters of the conversions run in the block.
+
+    Nothing is recorded outside of a `collect_stats` block. Blocks can be nested, e.g. one
+    per file of a batch, the stats of an inner block are added to the outer block when it
+    exits.
+
+    e.g.,
+        with collect_stats() as stats:
+            geo_to_voc(ortho_path, geo_path, save_path)
+        print(stats.timings["geojson.read"], stats.counts["s3.requests"])
+
+    Args:
+        hook (Optional[Callable[[Stats], None]], optional): Called with the stats when the
+            block exits, e.g. `log_stats`. Defaults to None.
+
+    Yields:
+        Iterator[Stats]: The stats, filled in as the block runs.
+    """
+    stats = Stats()
+    with _LOCK:
+        _ACTIVE.append(stats)
+    try:
+        yield stats
+    finally:
+        with _LOCK:
+            _ACTIVE.remove(stats)
+            parent = _ACTIVE[-1] if _ACTIVE else None
+        if parent is not None:
+            parent.merge(stats)
+        if hook is not None:
+            hook(stats)
+
+
+def current_stats() -> Optional[Stats]:
+    """Get the stats of the innermost `collect_stats` block, None outside of one."""
+    return _ACTIVE[-1] if _ACTIVE else None
+
+
+def stage(name: str) -> ContextManager:
+    """Time a block as the stage `name`, a no-op outside of a `collect_stats` block."""
+    if not _ACTIVE:
+        return _NULL_STAGE
+    return _Stage(_ACTIVE[-1], name)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Add `value` to the counter `name`, a no-op outside of a `collect_stats` block."""
+    if _ACTIVE:
+        _ACTIVE[-1].count(name, value)
+
+
+def log_stats(stats: Stats, logger: Optional[logging.Logger] = None) -> None:
+    """Log the stats as a single JSON line, can be used as a `collect_stats` hook."""
+    (logger or logging.getLogger(__name__)).info(stats.to_json(sort_keys=True))
+
+
+class _Stage:
+    def __init__(self, stats: Stats, name: str):
+        self._stats = stats
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> "_Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stats.add_time(self._name, time.perf_counter() - self._start)
@@ -0,0 +1,419 @@
+import argparse
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import rasterio
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from .box_utils import (
+    BoxIndex,
+    clip_polygons,
+    extract_rotated_vertices_batch,
+    polygon_areas,
+    vertices_to_boxes,
+    vertices_to_rotated_boxes,
+)
+from .convert_geojson import GeoConverter
+from .pascal_voc import PascalVOCStreamWriter
+from .s3 import gdal_path, open_url
+
+_DRIVERS = {
+    "png": "PNG",
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "tif": "GTiff",
+    "tiff": "GTiff",
+}
+
+
+class Tile(NamedTuple):
+    """The annotations of one chip of an ortho.
+
+    Attributes:
+        name (str): The name of the chip, `{ortho stem}_{row offset}_{col offset}`.
+        window (Window): The window of the chip in the ortho.
+        names (List): The class name of every box.
+        boxes (np.ndarray): The boxes in chip coordinates, Nx4 or Nx5 if rotated.
+        truncated (np.ndarray): The truncated flag of every box.
+    """
+
+    name: str
+    window: Window
+    names: List
+    boxes: np.ndarray
+    truncated: np.ndarray
+
+
+def geo_to_voc_tiles(
+    ortho_path: str,
+    geo_path: str,
+    save_path: str,
+    tile_size: int = 1024,
+    stride: Optional[int] = None,
+    class_attribute: Optional[str] = None,
+    class_mapping: Optional[Dict[int, str]] = None,
+    default_class: str = "panel",
+    skip_classes: List[int] = [],
+    rotated: bool = False,
+    min_visibility: float = 0.5,
+    image_format: str = "png",
+    skip_empty: bool = False,
+    prefix: str = "",
+    workers: int = 1,
+) -> List[str]:
+    """Convert data on geojson format to pascal voc data on chips of the ortho.
+
+    The ortho is sliced in windows of `tile_size` pixels every `stride` pixels, the last
+    row and column of windows are aligned on the ortho edges. Every chip is saved in
+    `save_path/images` and its annotation in `save_path/annotations`.
+
+    Boxes crossing the edge of a chip are kept if at least `min_visibility` of their area
+    is inside the chip, and flagged as truncated. Axis aligned boxes are clipped to the
+    chip, rotated boxes are kept whole.
+
+    Args:
+        ortho_path (str): Path to the ortho. Can be a local/s3 location.
+        geo_path (str): Path to the geojson. Can be a local/s3 location.
+        save_path (str): The directory the chips and annotations are saved to. Can be a
+            local/s3 location.
+        tile_size (int, optional): The size of the chips. Defaults to 1024.
+        stride (Optional[int], optional): The distance between chips, chips overlap when
+            it is smaller than the tile size. Defaults to the tile size.
+        class_attribute (Optional[str], optional): The geojson attribute to be used as the
+            class. Defaults to None.
+        class_mapping (Optional[Dict[int, str]], optional): The class mapping to use.
+            Defaults to None.
+        default_class (str, optional): The class of all boxes when no class attribute is
+            specified. Defaults to "panel".
+        skip_classes (List[int], optional): The class attribute values to skip.
+            Defaults to [].
+        rotated (bool, optional): Use rotated bounding boxes. Defaults to False.
+        min_visibility (float, optional): The fraction of the area of a box that must be
+            inside a chip for it to be annotated. Defaults to 0.5.
+        image_format (str, optional): The chip image format, png, jpg or tif. Tif chips are
+            georeferenced. Defaults to "png".
+        skip_empty (bool, optional): Don't save chips without boxes. Defaults to False.
+        prefix (str, optional): Specify a prefix to use for the chip paths in the
+            annotations. Defaults to "".
+        workers (int, optional): Number of worker processes writing chips. Defaults to 1.
+
+    Returns:
+        List[str]: The names of the saved chips.
+    """
+    image_format = image_format.lower()
+    if image_format not in _DRIVERS:
+        raise ValueError(
+            f"Unsupported image format {image_format}, use one of {sorted(_DRIVERS)}."
+        )
+    stride = stride or tile_size
+
+    # The ortho is read in place, workers only fetch the windows they write
+    with GeoConverter(ortho_path, geo_path) as converter:
+        vertices, names = converter.annotations(
+            class_attribute, class_mapping, default_class, skip_classes
+        )
+        ortho = converter.ortho
+        windows = tile_windows(ortho.width, ortho.height, tile_size, stride)
+
+    stem = Path(ortho_path).stem
+    tiles = assign_tiles(vertices, names, windows, rotated, min_visibility)
+    tiles = [
+        tile._replace(name=f"{stem}_{tile.window.row_off}_{tile.window.col_off}")
+        for tile in tiles
+        if len(tile.boxes) or not skip_empty
+    ]
+
+    image_dir = os.path.join(save_path, "images")
+    annotation_dir = os.path.join(save_path, "annotations")
+    if "s3://" not in save_path:
+        os.makedirs(image_dir, exist_ok=True)
+        os.makedirs(annotation_dir, exist_ok=True)
+
+    options = (ortho_path, image_dir, annotation_dir, image_format, prefix)
+    # Chunks of tiles are written together so that the ortho is opened once per chunk
+    chunk_size = max(1, min(256, -(-len(tiles) // (workers * 4))))
+    chunks = [tiles[i : i + chunk_size] for i in range(0, len(tiles), chunk_size)]
+    progress = tqdm(total=len(tiles), desc="Writing chips", unit="chip")
+    if workers <= 1:
+        for chunk in chunks:
+            _write_tiles(chunk, *options)
+            progress.update(len(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_write_tiles, chunk, *options): len(chunk)
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                future.result()
+                progress.update(futures[future])
+    progress.close()
+
+    return [tile.name for tile in tiles]
+
+
+def tile_windows(
+    width: int, height: int, tile_size: int, stride: Optional[int] = None
+) -> np.ndarray:
+    """Slice an image into a regular grid of windows.
+
+    Windows are `tile_size` pixels wide and start every `stride` pixels, the last row and
+    column of windows are aligned on the image edges so the whole image is covered.
+    Images smaller than the tile size are a single window.
+
+    Args:
+        width (int): The image width.
+        height (int): The image height.
+        tile_size (int): The size of the windows.
+        stride (Optional[int], optional): The distance between windows. Defaults to the
+            tile size.
+
+    Returns:
+        np.ndarray: A Tx4 matrix of [col_off, row_off, width, height] windows.
+    """
+    stride = stride or tile_size
+    if stride <= 0 or tile_size <= 0:
+        raise ValueError("The tile size and stride must be positive.")
+
+    def offsets(size: int) -> np.ndarray:
+        if size <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        starts = np.arange(0, size - tile_size + 1, stride, dtype=np.int64)
+        if starts[-1] != size - tile_size:
+            starts = np.append(starts, size - tile_size)
+        return starts
+
+    rows, cols = np.meshgrid(offsets(height), offsets(width), indexing="ij")
+    rows = rows.ravel()
+    cols = cols.ravel()
+    return np.stack(
+        (
+            cols,
+            rows,
+            np.minimum(tile_size, width - cols),
+            np.minimum(tile_size, height - rows),
+        ),
+        axis=1,
+    )
+
+
+def assign_tiles(
+    vertices: np.ndarray,
+    names: List,
+    windows: np.ndarray,
+    rotated: bool = False,
+    min_visibility: float = 0.5,
+) -> List[Tile]:
+    """Assign boxes to the windows they are visible in.
+
+    Args:
+        vertices (np.ndarray): A Nx4x2 matrix of box vertices in image coordinates.
+        names (List): The class name of every box.
+        windows (np.ndarray): A Tx4 matrix of [col_off, row_off, width, height] windows.
+        rotated (bool, optional): Use rotated boxes. Defaults to False.
+        min_visibility (float, optional): The fraction of the area of a box that must be
+            inside a window for it to be assigned. Defaults to 0.5.
+
+    Returns:
+        List[Tile]: The boxes of every window, in window coordinates.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 4, 2)
+    if rotated:
+        boxes = vertices_to_rotated_boxes(vertices)
+        # Visibility is measured on the rotated box that is written, not the raw polygon
+        polygons = extract_rotated_vertices_batch(boxes, box_mode="XYXYA_ABS")
+    else:
+        boxes = vertices_to_boxes(vertices)
+        polygons = None
+    bounds = vertices_to_boxes(polygons if rotated else vertices)
+    names = np.asarray(names, dtype=object)
+
+    window_bounds = np.concatenate((windows[:, :2], windows[:, :2] + windows[:, 2:]), 1)
+    window_ids, box_ids = BoxIndex(bounds).query_batch(window_bounds)
+    splits = np.searchsorted(window_ids, np.arange(len(windows) + 1))
+
+    tiles = []
+    for t, (col_off, row_off, w, h) in enumerate(windows.tolist()):
+        candidates = box_ids[splits[t] : splits[t + 1]]
+        x0, y0, x1, y1 = col_off, row_off, col_off + w, row_off + h
+        b = bounds[candidates]
+        inside = (b[:, 0] >= x0) & (b[:, 1] >= y0) & (b[:, 2] <= x1) & (b[:, 3] <= y1)
+
+        if rotated:
+            window_polygon = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+            clipped, _ = clip_polygons(polygons[candidates], window_polygon)
+            visible_area = polygon_areas(clipped)
+            area = polygon_areas(polygons[candidates])
+            tile_boxes = boxes[candidates] - (x0, y0, x0, y0, 0)
+        else:
+            ab = boxes[candidates]
+            clipped = np.stack(
+                (
+                    np.maximum(ab[:, 0], x0),
+                    np.maximum(ab[:, 1], y0),
+                    np.minimum(ab[:, 2], x1),
+                    np.minimum(ab[:, 3], y1),
+                ),
+                axis=1,
+            )
+            visible_area = np.clip(clipped[:, 2] - clipped[:, 0], 0, None) * np.clip(
+                clipped[:, 3] - clipped[:, 1], 0, None
+            )
+            area = (ab[:, 2] - ab[:, 0]) * (ab[:, 3] - ab[:, 1])
+            tile_boxes = clipped - (x0, y0, x0, y0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            visibility = np.where(area > 0, visible_area / area, 0.0)
+        visibility[inside] = 1.0
+        keep = (visibility > 0) & (visibility >= min_visibility)
+
+        tiles.append(
+            Tile(
+                name="",
+                window=Window(col_off, row_off, w, h),
+                names=names[candidates[keep]].tolist(),
+                boxes=tile_boxes[keep],
+                truncated=(~inside[keep]).astype(np.int64),
+            )
+        )
+    return tiles
+
+
+def _write_tiles(
+    tiles: List[Tile],
+    ortho_path: str,
+    image_dir: str,
+    annotation_dir: str,
+    image_format: str,
+    prefix: str = "",
+) -> None:
+    """Save the chips and annotations of a batch of tiles, opening the ortho once.
+
+    Chips are encoded in memory and streamed to their destination, so local and S3
+    outputs are written the same way.
+    """
+    with rasterio.open(gdal_path(ortho_path)) as ortho:
+        for tile in tiles:
+            data = ortho.read(window=tile.window)
+            image_path = os.path.join(image_dir, f"{tile.name}.{image_format}")
+            profile = {
+                "driver": _DRIVERS[image_format],
+                "width": int(tile.window.width),
+                "height": int(tile.window.height),
+                "count": ortho.count,
+                "dtype": data.dtype,
+            }
+            if profile["driver"] == "GTiff":
+                profile["crs"] = ortho.crs
+                profile["transform"] = ortho.window_transform(tile.window)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", NotGeoreferencedWarning)
+                with MemoryFile() as memfile:
+                    with memfile.open(**profile) as chip:
+                        chip.write(data)
+                    with open_url(image_path, "wb") as file:
+                        file.write(memfile.read())
+
+            annotation_path = os.path.join(annotation_dir, f"{tile.name}.xml")
+            with PascalVOCStreamWriter(
+                annotation_path,
+                image_path,
+                int(tile.window.width),
+                int(tile.window.height),
+                depth=ortho.count,
+                prefix=prefix,
+            ) as writer:
+                if len(tile.boxes):
+                    writer.addObjects(tile.names, tile.boxes, truncated=tile.truncated)
+
+
+def tile_geojson_cli():
+    from .convert_geojson_cli import read_class_mapping
+
+    parser = argparse.ArgumentParser(
+        description="Convert geojson to voc format data on chips of the ortho"
+    )
+    parser.add_argument(
+        "--ortho-path", required=True, help="The ortho path, can be local/s3"
+    )
+    parser.add_argument("--geojson", required=True, help="The geojson path")
+    parser.add_argument(
+        "--save-path",
+        required=True,
+        help="The directory to save the chips and annotations to, can be local/s3",
+    )
+    parser.add_argument(
+        "--tile-size", type=int, default=1024, help="The size of the chips"
+    )
+    parser.add_argument(
+        "--stride",
+        type=int,
+        default=None,
+        help="The distance between chips, defaults to the tile size",
+    )
+    parser.add_argument(
+        "--class-attribute",
+        type=str,
+        help="The class attribute to use from the geojson for class labels",
+    )
+    parser.add_argument(
+        "--class-mapping", help="A plain txt file containing class mappings"
+    )
+    parser.add_argument(
+        "--skip-classes", type=int, nargs="+", help="Classes to skip, specify multiple"
+    )
+    parser.add_argument(
+        "--rotated",
+        action="store_true",
+        default=False,
+        help="Use rotated bounding box, defaults to false",
+    )
+    parser.add_argument(
+        "--min-visibility",
+        type=float,
+        default=0.5,
+        help="The fraction of a box that must be inside a chip to be annotated",
+    )
+    parser.add_argument(
+        "--image-format",
+        default="png",
+        choices=sorted(_DRIVERS),
+        help="The chip image format",
+    )
+    parser.add_argument(
+        "--skip-empty",
+        action="store_true",
+        default=False,
+        help="Don't save chips without boxes",
+    )
+    parser.add_argument(
+        "--prefix", default="", help="The prefix to use for the chip paths"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to write chips in parallel",
+    )
+
+    args = vars(parser.parse_args())
+    if args["class_mapping"] is not None:
+        args["class_mapping"] = read_class_mapping(args["class_mapping"])
+    args["skip_classes"] = args["skip_classes"] or []
+    args["geo_path"] = args.pop("geojson")
+
+    chips = geo_to_voc_tiles(**args)
+    print(f"Saved {len(chips)} chips to {args['save_path']}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    tile_geojson_cli()
@@ -1,9 +1,15 @@
+import os
 from typing import List, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image, ImageDraw
 
-from .box_utils import rotated_boxes_to_vertices
+from .box_utils import (
+    assign_boxes_to_tiles,
+    rotated_boxes_to_vertices,
+    vertices_to_boxes,
+)
+from .s3 import gdal_path, open_url
 
 
 def draw_boxes(
@@ -44,10 +50,212 @@ def draw_rotated_boxes(
     if not isinstance(image, Image.Image):
         image = Image.fromarray(image)
 
-    draw_classes = False
-    if len(classes) > 0:
-        draw_classes = True
+    _draw_polygons(image, polygons, classes, outline, width)
+    return image
+
+
+def draw_rotated_boxes_tiled(
+    raster_path: str,
+    boxes: Optional[Union[np.ndarray, List[List[float]]]],
+    save_path: str,
+    classes: List[str] = [],
+    box_mode: str = "XYWHA_ABS",
+    outline: str = "red",
+    width: int = 3,
+    tile_size: int = 2048,
+    overview_size: int = 4096,
+) -> None:
+    """Draw rotated boxes on a raster that is too large to be loaded in memory.
+
+    The raster is read one window at a time, windows are aligned with its internal blocks,
+    and only the boxes intersecting a window are drawn on it. If `save_path` is a GeoTIFF
+    the full resolution image is written window by window, with the georeferencing of the
+    raster. Otherwise a downsampled overview is saved.
+
+    Args:
+        raster_path (str): The path or S3 url to the raster, e.g. an ortho.
+        boxes (Optional[Union[np.ndarray, List[List[float]]]]): The rotated boxes in pixels.
+        save_path (str): The output path or S3 url, a `.tif`/`.tiff` path or any image
+            format supported by PIL.
+        classes (List[str], optional): The class names to draw. Defaults to [].
+        box_mode (str, optional): The rotated box format. Defaults to "XYWHA_ABS".
+        outline (str, optional): The box color. Defaults to "red".
+        width (int, optional): The box line width. Defaults to 3.
+        tile_size (int, optional): The size of the windows. Defaults to 2048.
+        overview_size (int, optional): The size of the longest side of the overview.
+            Defaults to 4096.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    polygons, classes = _to_polygons(boxes, classes, box_mode)
+    bounds = _drawing_bounds(polygons, classes, width)
+
+    # GDAL writes GeoTIFFs to S3 through a temporary file, as the format needs random writes
+    with rasterio.Env(CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE="YES"), rasterio.open(
+        gdal_path(raster_path)
+    ) as src:
+        tile_h, tile_w = tile_size, tile_size
+        if src.profile.get("tiled", False):
+            block_h, block_w = src.block_shapes[0]
+            tile_h = -(-tile_size // block_h) * block_h
+            tile_w = -(-tile_size // block_w) * block_w
+        offsets, indices = assign_boxes_to_tiles(
+            bounds, (tile_h, tile_w), (src.height, src.width)
+        )
+        bands = [1, 2, 3] if src.count >= 3 else [1, 1, 1]
+        n_cols = -(-src.width // tile_w)
+
+        dst = None
+        overview = None
+        if os.path.splitext(save_path)[1].lower() in (".tif", ".tiff"):
+            dst = rasterio.open(
+                gdal_path(save_path),
+                "w",
+                driver="GTiff",
+                width=src.width,
+                height=src.height,
+                count=3,
+                dtype="uint8",
+                crs=src.crs,
+                transform=src.transform,
+                tiled=True,
+                blockxsize=256,
+                blockysize=256,
+                compress="deflate",
+                photometric="RGB",
+                BIGTIFF="IF_SAFER",
+            )
+        else:
+            scale = min(1.0, overview_size / max(src.height, src.width))
+            overview = Image.new(
+                "RGB",
+                (max(1, round(src.width * scale)), max(1, round(src.height * scale))),
+            )
+
+        try:
+            for tile in range(len(offsets) - 1):
+                row, col = divmod(tile, n_cols)
+                window = Window(
+                    col * tile_w,
+                    row * tile_h,
+                    min(tile_w, src.width - col * tile_w),
+                    min(tile_h, src.height - row * tile_h),
+                )
+                image = Image.fromarray(_to_rgb8(src.read(bands, window=window)))
+                ids = indices[offsets[tile] : offsets[tile + 1]]
+                if len(ids):
+                    _draw_polygons(
+                        image,
+                        polygons[ids] - (window.col_off, window.row_off),
+                        [classes[i] for i in ids] if len(classes) else [],
+                        outline,
+                        width,
+                    )
+
+                if dst is not None:
+                    dst.write(np.moveaxis(np.asarray(image), -1, 0), window=window)
+                else:
+                    x0 = round(window.col_off * scale)
+                    y0 = round(window.row_off * scale)
+                    x1 = round((window.col_off + window.width) * scale)
+                    y1 = round((window.row_off + window.height) * scale)
+                    if x1 > x0 and y1 > y0:
+                        overview.paste(
+                            image.resize((x1 - x0, y1 - y0), Image.BILINEAR), (x0, y0)
+                        )
+        finally:
+            if dst is not None:
+                dst.close()
+
+    if overview is not None:
+        save_image(overview, save_path)
+
+
+def draw_rotated_boxes_preview(
+    raster_path: str,
+    boxes: Optional[Union[np.ndarray, List[List[float]]]],
+    save_path: Optional[str] = None,
+    classes: List[str] = [],
+    box_mode: str = "XYWHA_ABS",
+    max_size: int = 1024,
+    outline: str = "red",
+    width: int = 2,
+) -> Image.Image:
+    """Draw rotated boxes on a low resolution preview of a raster.
+
+    The raster is read at a decimated resolution, with its longest side at most `max_size`
+    pixels. GDAL reads from the internal overviews of the raster when it has some, which
+    makes previews of large orthos fast. The boxes are scaled to the preview resolution.
+
+    Args:
+        raster_path (str): The path or S3 url to the raster, e.g. an ortho.
+        boxes (Optional[Union[np.ndarray, List[List[float]]]]): The rotated boxes in pixels
+            of the full resolution raster.
+        save_path (Optional[str], optional): The path or S3 url to save the preview to.
+            Defaults to None.
+        classes (List[str], optional): The class names to draw. Defaults to [].
+        box_mode (str, optional): The rotated box format. Defaults to "XYWHA_ABS".
+        max_size (int, optional): The size of the longest side of the preview.
+            Defaults to 1024.
+        outline (str, optional): The box color. Defaults to "red".
+        width (int, optional): The box line width. Defaults to 2.
+
+    Returns:
+        Image.Image: The preview.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(gdal_path(raster_path)) as src:
+        scale = min(1.0, max_size / max(src.height, src.width))
+        out_height = max(1, round(src.height * scale))
+        out_width = max(1, round(src.width * scale))
+        bands = [1, 2, 3] if src.count >= 3 else [1, 1, 1]
+        data = src.read(
+            bands,
+            out_shape=(len(bands), out_height, out_width),
+            resampling=Resampling.average,
+        )
+        scale_xy = (out_width / src.width, out_height / src.height)
+
+    image = Image.fromarray(_to_rgb8(data))
+    polygons, classes = _to_polygons(boxes, classes, box_mode)
+    _draw_polygons(image, polygons * scale_xy, classes, outline, width)
+    if save_path is not None:
+        save_image(image, save_path)
+    return image
+
+
+def save_image(image: Image.Image, save_path: str) -> None:
+    """Save an image to a local path or an S3 url, in the format of its extension."""
+    extension = os.path.splitext(save_path)[1].lower()
+    image_format = Image.registered_extensions().get(extension)
+    if image_format is None:
+        raise ValueError(f"Unknown image extension {extension} of {save_path}")
+    with open_url(save_path, "wb") as file:
+        image.save(file, format=image_format)
 
+
+def _to_polygons(
+    boxes: Optional[Union[np.ndarray, List[List[float]]]],
+    classes: List[str],
+    box_mode: str,
+) -> Tuple[np.ndarray, List[str]]:
+    if boxes is None or not len(boxes):
+        return np.zeros((0, 4, 2)), []
+    if len(classes):
+        return rotated_boxes_to_vertices(boxes, box_mode, classes)
+    return rotated_boxes_to_vertices(boxes, box_mode), []
+
+
+def _draw_polygons(
+    image: Image.Image,
+    polygons: np.ndarray,
+    classes: List[str],
+    outline: str,
+    width: int,
+) -> None:
     draw = ImageDraw.Draw(image)
     for idx, poly in enumerate(polygons):
         draw.polygon(
@@ -61,9 +269,36 @@ def draw_rotated_boxes(
             outline=outline,
             width=width,
         )
-        if draw_classes:
+        if len(classes) > 0:
             draw.text((poly[0, 0], poly[0, 1]), str(classes[idx]))
-    return image
+
+
+def _drawing_bounds(polygons: np.ndarray, classes: List[str], width: int) -> np.ndarray:
+    """The pixel bounds touched when drawing every polygon and its label."""
+    bounds = vertices_to_boxes(polygons)
+    bounds[:, :2] -= width
+    bounds[:, 2:] += width
+    if len(classes):
+        draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        text_sizes = {}
+        for idx, name in enumerate(classes):
+            name = str(name)
+            if name not in text_sizes:
+                text_sizes[name] = draw.textbbox((0, 0), name)
+            x, y = polygons[idx, 0]
+            left, top, right, bottom = text_sizes[name]
+            bounds[idx, 0] = min(bounds[idx, 0], x + left)
+            bounds[idx, 1] = min(bounds[idx, 1], y + top)
+            bounds[idx, 2] = max(bounds[idx, 2], x + right)
+            bounds[idx, 3] = max(bounds[idx, 3], y + bottom)
+    return bounds
+
+
+def _to_rgb8(data: np.ndarray) -> np.ndarray:
+    """Convert a 3xHxW raster read to a HxWx3 uint8 image."""
+    if data.dtype != np.uint8:
+        data = np.clip(data, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(np.moveaxis(data, 0, -1))
 
 
 def draw_lines(
@@ -1,13 +1,16 @@
 import argparse
-import os
-import tempfile
 from pathlib import Path
-from xml.dom import minidom
 
 from PIL import Image
 
-from ml_dronebase_data_utils.s3 import download_file, list_prefix, upload_file
-from ml_dronebase_data_utils.visualize import draw_rotated_boxes
+from ml_dronebase_data_utils.pascal_voc import read_voc
+from ml_dronebase_data_utils.s3 import list_prefix, open_url
+from ml_dronebase_data_utils.visualize import (
+    draw_rotated_boxes,
+    draw_rotated_boxes_preview,
+    draw_rotated_boxes_tiled,
+    save_image,
+)
 
 
 def visualize(**kwargs):
@@ -19,32 +22,52 @@ def visualize(**kwargs):
     anno_path -> The path to the annotation
     save_path -> The save path
     draw_labels -> Draw the labels or not, defaults to False
+    tiled -> Read and draw the ortho one window at a time, defaults to False. Orthos too
+        large for PIL are always rendered this way. Saves a full resolution GeoTIFF if
+        save_path is a .tif, otherwise a downsampled overview.
+    tile_size -> The window size of the tiled rendering, defaults to 2048
+    overview_size -> The longest side of the tiled rendering overview, defaults to 4096
+    preview_size -> Draw a low resolution preview with this longest side instead, read
+        from the ortho overviews.
+    list_cache_ttl -> Reuse S3 listings of batch inputs cached for at most this many seconds
+
+    S3 orthos and annotations are read in place and outputs streamed to S3, nothing is
+    downloaded to a temporary directory.
 
     """
     ortho_path = kwargs.get("ortho_path", None)
     anno_path = kwargs.get("anno_path", None)
     save_path = kwargs.get("save_path", None)
     draw_labels = kwargs.get("draw_labels", False)
+    tiled = kwargs.get("tiled", False)
+    tile_size = kwargs.get("tile_size", 2048)
+    overview_size = kwargs.get("overview_size", 4096)
+    preview_size = kwargs.get("preview_size", None)
 
     if ortho_path is None or anno_path is None or save_path is None:
         print("You must specify ortho_path, anno_path and save_path")
         return 1
 
     batch = kwargs.get("batch", False)
+    list_cache_ttl = kwargs.get("list_cache_ttl", None)
 
     orthos = []
     anno_paths = []
     save_paths = []
     if batch:
         if "s3://" in ortho_path:
-            for prefix in list_prefix(ortho_path, filter_files=True):
+            for prefix in list_prefix(
+                ortho_path, filter_files=True, cache_ttl=list_cache_ttl
+            ):
                 orthos.append(prefix)
         else:
             for path in Path(ortho_path).iterdir():
                 if path.is_file():
                     orthos.append(str(path))
         if "s3://" in anno_path:
-            for prefix in list_prefix(anno_path, filter_files=True):
+            for prefix in list_prefix(
+                anno_path, filter_files=True, cache_ttl=list_cache_ttl
+            ):
                 anno_paths.append(prefix)
         else:
             for path in Path(anno_path).iterdir():
@@ -67,67 +90,50 @@ def visualize(**kwargs):
     total_count = len(orthos)
     for idx, (op, ap, sp) in enumerate(zip(orthos, anno_paths, save_paths)):
         print(f"Processing file {idx+1}/{total_count}, {op}", end="\r")
-        # Create a temporary directory which is cleaned up after use
-        with tempfile.TemporaryDirectory() as tmpdir:
-            if "s3://" in op:
-                # Download
-                path = os.path.join(tmpdir, os.path.basename(op))
-                download_file(op, path)
-                op = path
-
-            if "s3://" in anno_path:
-                # Download
-                path = os.path.join(tmpdir, os.path.basename(ap))
-                download_file(ap, path)
-                ap = path
-
-            # Ideally find size height and width and use that limit for reading in PIL, see https://github.com/python-pillow/Pillow/issues/515
-            # But currently skip if we encounter error
+        # S3 orthos, annotations and outputs are streamed, nothing is staged on disk
+        annotation = read_voc(ap, rotated=True)
+        boxes = annotation.boxes
+        classes = annotation.names if draw_labels else []
+
+        if preview_size is not None:
+            draw_rotated_boxes_preview(
+                op,
+                boxes,
+                sp,
+                classes=classes,
+                box_mode="XYXYA_ABS",
+                max_size=preview_size,
+            )
+            continue
+
+        img = None
+        if not tiled:
             try:
-                img = Image.open(op)
+                with open_url(op, "rb") as file:
+                    img = Image.open(file)
+                    img.load()
             except Image.DecompressionBombError:
-                print(f"Skipping {op} as it exceeds {Image.MAX_IMAGE_PIXELS} pixels")
-                continue
-
-            parser = minidom.parse(ap)
-
-            annotations = parser.getElementsByTagName("object")
-
-            boxes = []
-            classes = []
-
-            for a in annotations:
-                xmin = float(a.getElementsByTagName("xmin")[0].firstChild.data)
-                xmax = float(a.getElementsByTagName("xmax")[0].firstChild.data)
-                ymin = float(a.getElementsByTagName("ymin")[0].firstChild.data)
-                ymax = float(a.getElementsByTagName("ymax")[0].firstChild.data)
-                try:
-                    angle = float(a.getElementsByTagName("angle")[0].firstChild.data)
-                except ValueError:
-                    angle = 0.0
-                boxes.append([xmin, ymin, xmax, ymax, angle])
-                if draw_labels:
-                    class_name = a.getElementsByTagName("name")[0].firstChild.data
-                    classes.append(class_name)
+                print(
+                    f"{op} exceeds {Image.MAX_IMAGE_PIXELS} pixels, "
+                    "rendering it tile by tile"
+                )
 
+        if img is None:
+            draw_rotated_boxes_tiled(
+                op,
+                boxes,
+                sp,
+                classes=classes,
+                box_mode="XYXYA_ABS",
+                tile_size=tile_size,
+                overview_size=overview_size,
+            )
+        else:
             if len(boxes):
-                # img_drawn = draw_ (img,boxes,classes)
-                img_drawn = draw_rotated_boxes(
+                img = draw_rotated_boxes(
                     img, boxes, classes=classes, box_mode="XYXYA_ABS"
                 )
-            else:
-                img_drawn = img
-
-            upload = False
-            if "s3://" in sp:
-                orig_save_path = sp
-                sp = os.path.join(tmpdir, os.path.basename(sp))
-                upload = True
-
-            img_drawn.save(sp)
-
-            if upload:
-                upload_file(sp, orig_save_path, exist_ok=False)
+            save_image(img, sp)
 
 
 def visualize_converted_geojson():
@@ -151,6 +157,38 @@ def visualize_converted_geojson():
         default=False,
         help="Draw the class labels",
     )
+    parser.add_argument(
+        "--tiled",
+        "-t",
+        action="store_true",
+        default=False,
+        help="Render the ortho tile by tile, for orthos too large to fit in memory",
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=2048,
+        help="The tile size of the tiled rendering",
+    )
+    parser.add_argument(
+        "--overview-size",
+        type=int,
+        default=4096,
+        help="The longest side of the tiled rendering output, unless it is a .tif",
+    )
+    parser.add_argument(
+        "--preview-size",
+        "-p",
+        type=int,
+        default=None,
+        help="Draw a low resolution preview with this longest side instead",
+    )
+    parser.add_argument(
+        "--list-cache-ttl",
+        type=float,
+        default=None,
+        help="Reuse S3 listings of batch inputs cached for at most this many seconds",
+    )
     parser.add_argument(
         "--batch", "-b", action="store_true", default=False, help="Run in batched mode"
     )
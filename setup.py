@@ -40,9 +40,9 @@ if __name__ == "__main__":
             "boto3>=1.19.2",
             "tqdm>=4.62.3",
             "scikit-learn==1.0.2",
-            "Shapely==1.8.1.post1",
+            "Shapely>=1.8.1.post1",
             "rasterio==1.2.10",
-            "geopandas==0.9.0",
+            "geopandas>=0.9.0",
             "Pillow==9.0.0",
             "jinja2>=2.0.1",
             "black>=21.11b1",
@@ -51,10 +51,16 @@ if __name__ == "__main__":
             "flake8==4.0.1",
             "pytest",
         ],
+        extras_require={
+            "test": ["moto[s3]", "pytest-benchmark"],
+            # Read geojsons from GDAL as WKB, see convert_geojson.read_geo_arrays
+            "fast": ["pyogrio>=0.8", "pyarrow>=8.0", "Shapely>=2.0", "geopandas>=0.12"],
+        },
         entry_points={
             "console_scripts": [
                 "convert_geojson = ml_dronebase_data_utils.convert_geojson_cli:convert_geojson_cli",
                 "visualize_converted_geojson = ml_dronebase_data_utils.visualize_converted_geojson:visualize_converted_geojson",
+                "tile_geojson = ml_dronebase_data_utils.tile_geojson:tile_geojson_cli",
             ]
         },
     )
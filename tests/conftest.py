@@ -0,0 +1,102 @@
+import boto3
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon
+
+from ml_dronebase_data_utils import s3
+from ml_dronebase_data_utils.box_utils import extract_rotated_vertices_batch
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto < 5
+    from moto import mock_s3 as mock_aws
+
+ORTHO_CRS = "EPSG:32618"
+ORTHO_ORIGIN = (500000.0, 4400000.0)
+ORTHO_RESOLUTION = 0.05
+ORTHO_SIZE = 512
+TEST_BUCKET = "ml-dronebase-data-utils-test"
+
+
+def make_ortho(path: str, size: int = ORTHO_SIZE) -> str:
+    """Write a small RGB GeoTIFF with a real CRS and geotransform."""
+    transform = from_origin(*ORTHO_ORIGIN, ORTHO_RESOLUTION, ORTHO_RESOLUTION)
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 255, (3, size, size), dtype=np.uint8)
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=3,
+        dtype="uint8",
+        crs=ORTHO_CRS,
+        transform=transform,
+        tiled=True,
+        blockxsize=128,
+        blockysize=128,
+    ) as dst:
+        dst.write(data)
+    return path
+
+
+def make_panels(
+    num_features: int, size: int = ORTHO_SIZE, seed: int = 0
+) -> gpd.GeoDataFrame:
+    """Create rotated panel polygons inside the synthetic ortho, in geographic
+    coordinates, with a `class_id` attribute.
+    """
+    rng = np.random.default_rng(seed)
+    boxes = np.stack(
+        (
+            rng.uniform(20, size - 20, num_features),
+            rng.uniform(20, size - 20, num_features),
+            rng.uniform(4, 8, num_features),
+            rng.uniform(10, 16, num_features),
+            rng.uniform(-90, 90, num_features),
+        ),
+        axis=1,
+    )
+    pixel_vertices = extract_rotated_vertices_batch(boxes)
+    x = ORTHO_ORIGIN[0] + pixel_vertices[..., 0] * ORTHO_RESOLUTION
+    y = ORTHO_ORIGIN[1] - pixel_vertices[..., 1] * ORTHO_RESOLUTION
+    polygons = [Polygon(np.stack((px, py), axis=1)) for px, py in zip(x, y)]
+    gdf = gpd.GeoDataFrame(
+        {"class_id": rng.integers(0, 4, num_features)}, geometry=polygons, crs=ORTHO_CRS
+    )
+    return gdf.to_crs("EPSG:4326")
+
+
+@pytest.fixture
+def synthetic_ortho(tmp_path) -> str:
+    return make_ortho(str(tmp_path / "ortho.tif"))
+
+
+@pytest.fixture
+def synthetic_gdf() -> gpd.GeoDataFrame:
+    return make_panels(200)
+
+
+@pytest.fixture
+def synthetic_geojson(tmp_path, synthetic_gdf: gpd.GeoDataFrame) -> str:
+    path = str(tmp_path / "panels.geojson")
+    synthetic_gdf.to_file(path, driver="GeoJSON")
+    return path
+
+
+@pytest.fixture
+def mock_s3(monkeypatch):
+    """A local S3 stand-in with an empty test bucket."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3._get_client.cache_clear()
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=TEST_BUCKET)
+        yield client
+    s3._get_client.cache_clear()
@@ -0,0 +1,387 @@
+import numpy as np
+import pytest
+from shapely.geometry import Polygon, box
+
+from ml_dronebase_data_utils.box_utils import (
+    BoxIndex,
+    assign_boxes_to_tiles,
+    box_iou,
+    box_iou_pairs,
+    boxes_to_vertices,
+    calculate_angle,
+    calculate_angle_batch,
+    clip_polygons,
+    deduplicate_boxes,
+    extract_rotated_vertices,
+    extract_rotated_vertices_batch,
+    extract_vertices,
+    nms,
+    polygon_areas,
+    polygon_centroids,
+    rotated_box_dims,
+    rotated_box_dims_batch,
+    rotated_box_iou,
+    rotated_boxes_to_vertices,
+    sort_points,
+    sort_points_batch,
+    vertices_to_boxes,
+    vertices_to_rotated_boxes,
+)
+
+
+def _reference_vertices_to_boxes(vertices: np.ndarray) -> np.ndarray:
+    return np.asarray([list(Polygon(v).bounds) for v in vertices])
+
+
+def _reference_vertices_to_rotated_boxes(vertices: np.ndarray) -> np.ndarray:
+    boxes = []
+    for v in vertices:
+        xc, yc = Polygon(v).centroid.xy
+        xc, yc = xc[0], yc[0]
+        pxl_points_sorted = sort_points(v)
+        tl, tr, bl = pxl_points_sorted[0], pxl_points_sorted[1], pxl_points_sorted[3]
+        angle, h, w = rotated_box_dims(tl, tr, bl)
+        boxes.append([xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2, angle])
+    return np.asarray(boxes)
+
+
+def _reference_rotated_boxes_to_vertices(
+    boxes: np.ndarray, box_mode: str
+) -> np.ndarray:
+    areas = boxes[:, 2] * boxes[:, 3]
+    sorted_idxs = np.argsort(-areas).tolist()
+    return np.asarray(
+        [extract_rotated_vertices(b, box_mode) for b in boxes[sorted_idxs]]
+    )
+
+
+@pytest.fixture
+def rotated_vertices() -> np.ndarray:
+    """Returns a batch of shuffled rotated rectangles, rounded to whole pixels like
+    the output of `get_pixel_vertices`, plus the hand crafted edge cases from
+    `test_convert_geojson.py` (equal center x coordinates, upright and 90 degree boxes).
+
+    Returns:
+        np.ndarray: A Nx4x2 matrix of vertices.
+    """
+    rng = np.random.default_rng(0)
+    n = 2000
+    boxes = np.stack(
+        (
+            rng.uniform(100, 10000, n),
+            rng.uniform(100, 10000, n),
+            rng.uniform(5, 40, n),
+            rng.uniform(45, 120, n),
+            rng.uniform(-180, 180, n),
+        ),
+        axis=1,
+    )
+    vertices = np.round(np.asarray([extract_rotated_vertices(b) for b in boxes]))
+    edge_cases = np.array(
+        [
+            [[70, 84], [130, 84], [130, 114], [70, 114]],
+            [[81, 71], [133, 101], [118, 127], [66, 97]],
+            [[72, 79], [99, 66], [126, 119], [99, 132]],
+            [[84, 69], [114, 69], [114, 129], [84, 129]],
+            [[99, 66], [126, 79], [99, 132], [72, 119]],
+            [[66, 101], [118, 71], [132, 97], [81, 127]],
+        ],
+        dtype=np.float64,
+    )
+    vertices = np.concatenate((vertices, edge_cases))
+    for v in vertices:
+        rng.shuffle(v)
+    return vertices
+
+
+def test_vertices_to_boxes_parity(rotated_vertices: np.ndarray):
+    boxes = vertices_to_boxes(rotated_vertices)
+    assert boxes.shape == (len(rotated_vertices), 4)
+    assert np.array_equal(boxes, _reference_vertices_to_boxes(rotated_vertices))
+
+
+def test_vertices_to_boxes_int_vertices_are_floats():
+    vertices = np.array([[[70, 84], [130, 84], [130, 114], [70, 114]]])
+    boxes = vertices_to_boxes(vertices)
+    assert boxes.dtype == np.float64
+    assert boxes.tolist() == [[70.0, 84.0, 130.0, 114.0]]
+
+
+def test_sort_points_parity(rotated_vertices: np.ndarray):
+    sorted_batch = sort_points_batch(rotated_vertices)
+    sorted_reference = np.asarray([sort_points(v) for v in rotated_vertices])
+    assert np.array_equal(sorted_batch, sorted_reference)
+
+
+def test_sort_points_center_tie():
+    points = np.array([[[99, 132], [72, 119], [126, 79], [99, 66]]])
+    target = np.array([[[72, 119], [99, 66], [126, 79], [99, 132]]])
+    assert np.array_equal(sort_points_batch(points), target)
+
+
+def test_polygon_centroids_parity(rotated_vertices: np.ndarray):
+    centroids = polygon_centroids(rotated_vertices)
+    reference = np.asarray(
+        [np.asarray(Polygon(v).centroid.coords)[0] for v in rotated_vertices]
+    )
+    assert np.allclose(centroids, reference, rtol=0, atol=1e-9)
+
+
+def test_polygon_centroids_degenerate():
+    vertices = np.array(
+        [[[0, 0], [10, 0], [10, 0], [0, 0]], [[5, 5], [5, 5], [5, 5], [5, 5]]],
+        dtype=np.float64,
+    )
+    centroids = polygon_centroids(vertices)
+    assert np.allclose(centroids, [[5, 0], [5, 5]])
+
+
+def test_calculate_angle_parity():
+    rng = np.random.default_rng(1)
+    point1 = rng.uniform(-100, 100, (1000, 2))
+    point2 = rng.uniform(-100, 100, (1000, 2))
+    angles = calculate_angle_batch(point1, point2)
+    reference = np.asarray([calculate_angle(p1, p2) for p1, p2 in zip(point1, point2)])
+    assert np.array_equal(angles, reference)
+    assert ((-90 < angles) & (angles <= 90)).all()
+
+
+def test_rotated_box_dims_parity(rotated_vertices: np.ndarray):
+    sorted_points = sort_points_batch(rotated_vertices)
+    tl, tr, bl = sorted_points[:, 0], sorted_points[:, 1], sorted_points[:, 3]
+    angle, h, w = rotated_box_dims_batch(tl, tr, bl)
+    reference = np.asarray([rotated_box_dims(p[0], p[1], p[3]) for p in sorted_points])
+    assert np.allclose(angle, reference[:, 0], rtol=0, atol=1e-9)
+    assert np.allclose(h, reference[:, 1], rtol=0, atol=1e-9)
+    assert np.allclose(w, reference[:, 2], rtol=0, atol=1e-9)
+
+
+def test_vertices_to_rotated_boxes_parity(rotated_vertices: np.ndarray):
+    boxes = vertices_to_rotated_boxes(rotated_vertices)
+    reference = _reference_vertices_to_rotated_boxes(rotated_vertices)
+    assert boxes.shape == (len(rotated_vertices), 5)
+    assert np.allclose(boxes, reference, rtol=0, atol=1e-9)
+    angles = boxes[:, -1]
+    assert ((-90 < angles) & (angles <= 90)).all()
+
+
+def test_boxes_to_vertices_parity(rotated_vertices: np.ndarray):
+    boxes = vertices_to_boxes(rotated_vertices)
+    vertices = boxes_to_vertices(boxes)
+    reference = np.asarray([extract_vertices(b) for b in boxes])
+    assert np.array_equal(vertices, reference)
+
+
+@pytest.mark.parametrize("box_mode", ["XYWHA_ABS", "XYXYA_ABS"])
+def test_rotated_boxes_to_vertices_parity(rotated_vertices: np.ndarray, box_mode: str):
+    boxes = vertices_to_rotated_boxes(rotated_vertices)
+    vertices = rotated_boxes_to_vertices(boxes, box_mode=box_mode)
+    reference = _reference_rotated_boxes_to_vertices(boxes, box_mode)
+    assert vertices.shape == (len(boxes), 4, 2)
+    assert np.allclose(vertices, reference, rtol=0, atol=1e-9)
+
+
+def test_rotated_boxes_to_vertices_classes():
+    boxes = np.array([[0, 0, 2, 2, 0], [0, 0, 10, 10, 45]], dtype=np.float64)
+    vertices, classes = rotated_boxes_to_vertices(boxes, classes=["small", "large"])
+    assert classes == ["large", "small"]
+    assert np.allclose(vertices[0], extract_rotated_vertices(boxes[1]))
+
+
+def test_rotated_boxes_to_vertices_invalid_mode():
+    with pytest.raises(ValueError):
+        rotated_boxes_to_vertices(np.zeros((1, 5)), box_mode="XYWH")
+
+
+def test_assign_boxes_to_tiles():
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(-50, 1050, (500, 2))
+    boxes = np.concatenate((xy, xy + rng.uniform(0, 300, (500, 2))), axis=1)
+    height, width, tile_h, tile_w = 1000, 900, 100, 128
+    offsets, indices = assign_boxes_to_tiles(boxes, (tile_h, tile_w), (height, width))
+
+    n_cols = -(-width // tile_w)
+    assert len(offsets) == n_cols * (height // tile_h) + 1
+    for tile in range(len(offsets) - 1):
+        y0, x0 = tile // n_cols * tile_h, tile % n_cols * tile_w
+        expected = np.flatnonzero(
+            (boxes[:, 0] < min(x0 + tile_w, width))
+            & (boxes[:, 2] >= x0)
+            & (boxes[:, 1] < min(y0 + tile_h, height))
+            & (boxes[:, 3] >= y0)
+        )
+        assert np.array_equal(indices[offsets[tile] : offsets[tile + 1]], expected)
+
+
+def test_clip_polygons():
+    rng = np.random.default_rng(0)
+    n = 2000
+    boxes = np.stack(
+        (
+            rng.uniform(0, 100, n),
+            rng.uniform(0, 100, n),
+            rng.uniform(1, 40, n),
+            rng.uniform(1, 40, n),
+            rng.uniform(-90, 90, n),
+        ),
+        axis=1,
+    )
+    subjects = extract_rotated_vertices_batch(boxes)
+    window = np.array([[20, 20], [80, 20], [80, 70], [20, 70]], dtype=np.float64)
+
+    clipped, counts = clip_polygons(subjects, window)
+    reference = [Polygon(s).intersection(Polygon(window)) for s in subjects]
+    assert np.allclose(
+        polygon_areas(clipped), [r.area for r in reference], rtol=0, atol=1e-9
+    )
+    assert np.array_equal(counts == 0, [r.is_empty for r in reference])
+
+    # Convex clipping polygons of either orientation, one per subject
+    clips = extract_rotated_vertices_batch(boxes[::-1])
+    clips[::2] = clips[::2, ::-1]
+    clipped, _ = clip_polygons(subjects, clips)
+    reference = [
+        Polygon(s).intersection(Polygon(c)).area for s, c in zip(subjects, clips)
+    ]
+    assert np.allclose(polygon_areas(clipped), reference, rtol=0, atol=1e-9)
+
+
+def test_polygon_areas():
+    vertices = np.array(
+        [[[0, 0], [4, 0], [4, 3], [0, 3]], [[0, 0], [4, 0], [0, 3], [0, 3]]],
+        dtype=np.float64,
+    )
+    assert polygon_areas(vertices).tolist() == [12.0, 6.0]
+
+
+def _brute_force_query(bounds: np.ndarray, windows: np.ndarray):
+    hits = (
+        (bounds[None, :, 0] <= windows[:, None, 2])
+        & (bounds[None, :, 2] >= windows[:, None, 0])
+        & (bounds[None, :, 1] <= windows[:, None, 3])
+        & (bounds[None, :, 3] >= windows[:, None, 1])
+    )
+    return np.nonzero(hits)
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_box_index(rotated: bool):
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 5000, (3000, 2))
+    boxes = np.concatenate((xy, xy + rng.uniform(5, 80, (3000, 2))), axis=1)
+    # A few large boxes spanning many cells
+    boxes[:5, 2:] += 2000
+    if rotated:
+        boxes = np.concatenate((boxes, rng.uniform(-90, 90, (3000, 1))), axis=1)
+        bounds = vertices_to_boxes(
+            extract_rotated_vertices_batch(boxes, box_mode="XYXYA_ABS")
+        )
+    else:
+        bounds = boxes
+
+    corners = rng.uniform(-500, 5500, (300, 2))
+    windows = np.concatenate((corners, corners + rng.uniform(1, 600, (300, 2))), 1)
+    index = BoxIndex(boxes)
+    window_ids, box_ids = index.query_batch(windows)
+    expected_windows, expected_boxes = _brute_force_query(bounds, windows)
+    assert np.array_equal(window_ids, expected_windows)
+    assert np.array_equal(box_ids, expected_boxes)
+    assert np.array_equal(index.query(windows[3]), box_ids[window_ids == 3])
+
+
+def test_box_index_serialization(tmp_path):
+    rng = np.random.default_rng(1)
+    xy = rng.uniform(0, 1000, (500, 2))
+    boxes = np.concatenate((xy, xy + 20, rng.uniform(-90, 90, (500, 1))), axis=1)
+    index = BoxIndex(boxes, cell_size=50)
+    index.save(tmp_path / "ortho.index.npz")
+
+    loaded = BoxIndex.load(tmp_path / "ortho.index.npz")
+    assert len(loaded) == 500
+    assert np.array_equal(loaded.boxes, boxes)
+    windows = np.array([[0, 0, 100, 100], [500, 500, 900, 700]])
+    for expected, result in zip(
+        index.query_batch(windows), loaded.query_batch(windows)
+    ):
+        assert np.array_equal(expected, result)
+
+
+def test_box_index_empty():
+    index = BoxIndex(np.zeros((0, 4)))
+    assert len(index) == 0
+    assert len(index.query([0, 0, 10, 10])) == 0
+    with pytest.raises(ValueError):
+        BoxIndex(np.zeros((3, 3)))
+
+
+def _random_boxes(n: int, extent: float, rotated: bool, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, extent, (n, 2))
+    boxes = np.concatenate((xy, xy + rng.uniform(5, 40, (n, 2))), axis=1)
+    if rotated:
+        boxes = np.concatenate((boxes, rng.uniform(-90, 90, (n, 1))), axis=1)
+    return boxes
+
+
+def _shapely_iou(polygons1, polygons2) -> np.ndarray:
+    return np.asarray(
+        [
+            [p.intersection(q).area / p.union(q).area for q in polygons2]
+            for p in polygons1
+        ]
+    )
+
+
+def test_box_iou():
+    boxes1 = _random_boxes(150, 200, rotated=False, seed=0)
+    boxes2 = _random_boxes(100, 200, rotated=False, seed=1)
+    reference = _shapely_iou([box(*b) for b in boxes1], [box(*b) for b in boxes2])
+    assert np.allclose(box_iou(boxes1, boxes2), reference, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("box_mode", ["XYWHA_ABS", "XYXYA_ABS"])
+def test_rotated_box_iou(box_mode: str):
+    boxes1 = _random_boxes(150, 200, rotated=True, seed=0)
+    boxes2 = _random_boxes(100, 200, rotated=True, seed=1)
+    reference = _shapely_iou(
+        [Polygon(v) for v in extract_rotated_vertices_batch(boxes1, box_mode)],
+        [Polygon(v) for v in extract_rotated_vertices_batch(boxes2, box_mode)],
+    )
+    iou = rotated_box_iou(boxes1, boxes2, box_mode=box_mode)
+    assert np.allclose(iou, reference, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_box_iou_pairs(rotated: bool):
+    boxes = _random_boxes(400, 300, rotated=rotated)
+    dense = rotated_box_iou(boxes, boxes) if rotated else box_iou(boxes, boxes)
+    i, j, iou = box_iou_pairs(boxes, min_iou=0.1, chunk_size=50)
+    expected_i, expected_j = np.nonzero(np.triu(dense > 0.1, k=1))
+    assert np.array_equal(i, expected_i)
+    assert np.array_equal(j, expected_j)
+    assert np.allclose(iou, dense[i, j], rtol=0, atol=1e-12)
+
+
+def _reference_nms(dense_iou: np.ndarray, scores: np.ndarray, threshold: float):
+    keep = []
+    for idx in np.argsort(-scores, kind="stable"):
+        if all(dense_iou[idx, k] <= threshold for k in keep):
+            keep.append(idx)
+    return keep
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_nms(rotated: bool):
+    boxes = _random_boxes(500, 250, rotated=rotated)
+    scores = np.random.default_rng(2).uniform(size=len(boxes))
+    dense = rotated_box_iou(boxes, boxes) if rotated else box_iou(boxes, boxes)
+    keep = nms(boxes, scores, iou_threshold=0.3)
+    assert keep.tolist() == _reference_nms(dense, scores, 0.3)
+
+
+def test_deduplicate_boxes():
+    boxes = _random_boxes(300, 5000, rotated=True)
+    duplicates = boxes[::3].copy()
+    duplicates[:, :4] += 0.5
+    keep = deduplicate_boxes(np.concatenate((boxes, duplicates)), iou_threshold=0.5)
+    assert keep.tolist() == list(range(len(boxes)))
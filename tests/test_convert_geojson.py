@@ -1,9 +1,13 @@
+import os
+import sys
+
 import geopandas as gpd
 import numpy as np
 import pytest
 import rasterio
-from shapely.geometry import Polygon, box
+from shapely.geometry import MultiPolygon, Polygon, box
 
+from ml_dronebase_data_utils import convert_geojson
 from ml_dronebase_data_utils.box_utils import (
     boxes_to_vertices,
     rotated_box_dims,
@@ -12,7 +16,23 @@ from ml_dronebase_data_utils.box_utils import (
     vertices_to_boxes,
     vertices_to_rotated_boxes,
 )
-from ml_dronebase_data_utils.convert_geojson import get_pixel_vertices
+from ml_dronebase_data_utils.convert_geojson import (
+    GeoConverter,
+    _resolve_class,
+    geo_to_pixel,
+    geo_to_voc,
+    geo_to_voc_chunked,
+    get_annotations,
+    get_array_pixel_vertices,
+    get_exterior_coords,
+    get_pixel_vertices,
+    iter_geo_arrays,
+    read_geo_arrays,
+    resolve_classes,
+)
+from ml_dronebase_data_utils.pascal_voc import npz_to_voc, read_voc, read_voc_npz
+
+from .conftest import ORTHO_SIZE, TEST_BUCKET, make_panels
 
 
 @pytest.fixture
@@ -279,3 +299,326 @@ def test_get_rotated_boxes(ortho_path, geo_path):
     assert (
         in_bounds.all()
     ), "Reconstructed vertices does not match the original vertices."
+
+
+def test_get_pixel_vertices_matches_index(synthetic_ortho, synthetic_gdf):
+    with rasterio.open(synthetic_ortho) as ortho:
+        vertices = get_pixel_vertices(ortho, synthetic_gdf)
+
+        polys = synthetic_gdf.to_crs(ortho.crs).geometry.explode().tolist()
+        expected = []
+        for p in polys:
+            pxl_v = np.asarray([ortho.index(c[0], c[1]) for c in p.exterior.coords])
+            expected.append(pxl_v[:4, ::-1])
+
+    assert vertices.shape == (len(synthetic_gdf), 4, 2)
+    assert np.array_equal(vertices, np.asarray(expected))
+
+
+def test_geo_to_pixel(synthetic_ortho):
+    with rasterio.open(synthetic_ortho) as ortho:
+        x, y = ortho.xy(10, 20)
+        pxl = geo_to_pixel(ortho.transform, np.array([[x, y]]))
+    assert pxl.tolist() == [[20, 10]]
+
+
+def test_get_pixel_vertices_irregular_polygons(synthetic_ortho, synthetic_gdf):
+    gdf = synthetic_gdf.iloc[:2].copy()
+    # A pentagon, more vertices than a box
+    coords = list(gdf.geometry.iloc[0].exterior.coords)
+    midpoint = tuple(np.mean(coords[:2], axis=0))
+    pentagon = Polygon(coords[:1] + [midpoint] + coords[1:])
+    gdf.loc[gdf.index[0], "geometry"] = pentagon
+
+    _, offsets = get_exterior_coords(gdf.geometry)
+    assert np.diff(offsets).tolist() == [6, 5]
+
+    with rasterio.open(synthetic_ortho) as ortho:
+        vertices = get_pixel_vertices(ortho, gdf)
+        assert vertices.shape == (2, 4, 2)
+        with pytest.raises(ValueError):
+            get_pixel_vertices(ortho, gdf, strict=True)
+
+
+def test_geo_converter(tmp_path, monkeypatch, synthetic_ortho, synthetic_geojson):
+    configs = [
+        dict(rotated=True),
+        dict(rotated=False, class_attribute="class_id"),
+        dict(rotated=True, class_attribute="class_id", skip_classes=[0, 3]),
+    ]
+    expected = []
+    for i, config in enumerate(configs):
+        path = str(tmp_path / f"expected_{i}.xml")
+        geo_to_voc(synthetic_ortho, synthetic_geojson, path, **config)
+        expected.append(read_voc(path))
+
+    reads = []
+    monkeypatch.setattr(
+        convert_geojson,
+        "read_geo_arrays",
+        lambda *args: reads.append(args) or read_geo_arrays(*args),
+    )
+    with GeoConverter(synthetic_ortho, synthetic_geojson) as converter:
+        for i, config in enumerate(configs):
+            path = str(tmp_path / f"converted_{i}.xml")
+            converter.to_voc(path, **config)
+            annotation = read_voc(path)
+            assert np.array_equal(annotation.boxes, expected[i].boxes)
+            assert annotation.names == expected[i].names
+        ortho = converter.ortho
+    assert len(reads) == 1
+    assert ortho.closed
+
+
+@pytest.fixture
+def mixed_geojson(tmp_path) -> str:
+    gdf = make_panels(300)
+    geometries = gdf.geometry.tolist()
+    for i in range(0, 60, 6):
+        geometries[i] = MultiPolygon([geometries[i], geometries[i + 1]])
+    gdf = gdf.set_geometry(geometries)
+    # Nulls in a numeric column are read as NaN
+    gdf["score"] = np.where(np.arange(len(gdf)) % 7 == 0, np.nan, gdf["class_id"])
+    path = str(tmp_path / "mixed.geojson")
+    gdf.to_file(path, driver="GeoJSON")
+    return path
+
+
+def test_read_geo_arrays(synthetic_ortho, mixed_geojson):
+    gdf = gpd.read_file(mixed_geojson)
+    arrays = read_geo_arrays(mixed_geojson)
+    assert sorted(arrays.columns) == ["class_id", "score"]
+    assert np.array_equal(arrays.parts, convert_geojson.get_num_parts(gdf.geometry))
+    coords, offsets = get_exterior_coords(gdf.geometry.explode())
+    assert np.array_equal(arrays.coords, coords)
+    assert np.array_equal(arrays.offsets, offsets)
+    assert np.array_equal(arrays.columns["class_id"], gdf["class_id"])
+    # Without pyogrio the GeoDataFrame is converted
+    converted = convert_geojson._gdf_to_arrays(gdf, None)
+    assert np.array_equal(converted.coords, arrays.coords)
+    assert np.array_equal(converted.parts, arrays.parts)
+    assert converted.crs == arrays.crs
+
+    with rasterio.open(synthetic_ortho) as ortho:
+        vertices = get_array_pixel_vertices(ortho, arrays)
+        assert np.array_equal(vertices, get_pixel_vertices(ortho, gdf))
+
+        for options in (
+            (None, None, "panel", []),
+            ("class_id", {0: "Normal"}, "panel", [1, 3]),
+            ("score", {2: "Hot"}, "panel", [0]),
+        ):
+            with GeoConverter(synthetic_ortho, mixed_geojson) as converter:
+                converter_vertices, names = converter.annotations(*options)
+            expected_vertices, expected_names = get_annotations(ortho, gdf, *options)
+            assert np.array_equal(converter_vertices, expected_vertices)
+            assert [str(n) for n in names] == [str(n) for n in expected_names]
+
+    assert list(read_geo_arrays(mixed_geojson, ["score"]).columns) == ["score"]
+    with pytest.raises(KeyError):
+        read_geo_arrays(mixed_geojson, ["missing"])
+
+
+@pytest.mark.parametrize("reader", ["arrow", "read", "gdf"])
+def test_geo_to_voc_chunked(
+    tmp_path, monkeypatch, synthetic_ortho, mixed_geojson, reader
+):
+    if reader == "arrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+    if reader == "gdf":
+        monkeypatch.setattr(convert_geojson, "_import_pyogrio", lambda: None)
+
+    chunks = list(iter_geo_arrays(mixed_geojson, ["class_id"], chunk_size=64))
+    assert [len(c.parts) for c in chunks] == [64, 64, 64, 64, 44]
+    assert list(chunks[0].columns) == ["class_id"]
+
+    for i, options in enumerate(
+        [
+            dict(rotated=True),
+            dict(class_attribute="class_id", class_mapping={0: "Normal"}),
+            dict(class_attribute="score", skip_classes=[0], rotated=True),
+        ]
+    ):
+        expected = tmp_path / f"expected_{i}.xml"
+        geo_to_voc(synthetic_ortho, mixed_geojson, str(expected), **options)
+        for chunk_size in (3, 1000):
+            converted = tmp_path / f"chunked_{i}_{chunk_size}.xml"
+            geo_to_voc(
+                synthetic_ortho,
+                mixed_geojson,
+                str(converted),
+                chunk_size=chunk_size,
+                **options,
+            )
+            assert converted.read_bytes() == expected.read_bytes()
+
+    with pytest.raises(ValueError):
+        geo_to_voc_chunked(
+            synthetic_ortho, mixed_geojson, str(tmp_path / "x.xml"), chunk_size=0
+        )
+    assert not (tmp_path / "x.xml").exists()
+
+
+@pytest.mark.parametrize(
+    "skip_classes, class_mapping",
+    [([], None), ([0, 3, "abc"], {1: "Diode", 2: "Offline", "x": "Other"})],
+)
+def test_resolve_classes(skip_classes, class_mapping):
+    values = [None, "", 0, 1, "1", 2.0, 2.7, "abc", "x", np.nan, 3, True, None, "2"]
+    values = values * 3
+    keep, names = resolve_classes(values, skip_classes, class_mapping)
+
+    expected = [_resolve_class(v, skip_classes, class_mapping) for v in values]
+    assert keep.tolist() == [name is not None for name in expected]
+    assert [str(n) for n in names] == [str(n) for n in expected]
+    assert [type(n) for n in names] == [type(n) for n in expected]
+
+
+@pytest.mark.parametrize("class_attribute", [None, "class_id"])
+def test_get_annotations(synthetic_ortho, mixed_geojson, class_attribute):
+    gdf = gpd.read_file(mixed_geojson)
+    options = (class_attribute, {0: "Normal"}, "panel", [1, 3])
+    with rasterio.open(synthetic_ortho) as ortho:
+        vertices, names = get_annotations(ortho, gdf, *options)
+        all_vertices = get_pixel_vertices(ortho, gdf)
+        keep, all_names = convert_geojson._resolve_rows(
+            None if class_attribute is None else gdf[class_attribute],
+            len(all_vertices),
+            *options[1:],
+        )
+        # The same polygons from flat arrays
+        arrays = read_geo_arrays(mixed_geojson)
+        assert np.array_equal(get_annotations(ortho, arrays, *options)[0], vertices)
+        empty = get_annotations(ortho, gdf.iloc[:0], *options)
+
+    assert np.array_equal(vertices, all_vertices[: len(keep)][keep])
+    assert names == all_names[keep].tolist()
+    assert empty[0].shape == (0, 4, 2) and empty[1] == []
+
+
+@pytest.mark.parametrize("chunk_size", [None, 10])
+def test_geo_to_voc_empty(tmp_path, synthetic_ortho, chunk_size):
+    geo_path = tmp_path / "empty.geojson"
+    geo_path.write_text('{"type": "FeatureCollection", "features": []}')
+    path = str(tmp_path / "ortho.xml")
+    geo_to_voc(
+        synthetic_ortho,
+        str(geo_path),
+        path,
+        class_attribute="class_id",
+        chunk_size=chunk_size,
+    )
+    annotation = read_voc(path)
+    assert annotation.boxes.shape == (0, 4)
+    assert annotation.header["width"] == ORTHO_SIZE
+
+
+@pytest.mark.parametrize("chunk_size", [None, 64])
+def test_geo_to_voc_prefilter(
+    tmp_path, monkeypatch, synthetic_ortho, mixed_geojson, chunk_size
+):
+    arrays = read_geo_arrays(mixed_geojson)
+    values = arrays.columns["class_id"]
+    # Multipolygons explode to several polygons that are paired with the rows in order
+    num_pairs = min(len(arrays.offsets) - 1, len(values))
+    kept = np.flatnonzero(values[:num_pairs] == 0)
+    ring_sizes = np.diff(arrays.offsets)
+
+    projected = []
+    transform_coords = convert_geojson.transform_coords
+    monkeypatch.setattr(
+        convert_geojson,
+        "transform_coords",
+        lambda coords, *args: projected.append(len(coords))
+        or transform_coords(coords, *args),
+    )
+    path = str(tmp_path / "ortho.xml")
+    geo_to_voc(
+        synthetic_ortho,
+        mixed_geojson,
+        path,
+        class_attribute="class_id",
+        skip_classes=[1, 2, 3],
+        chunk_size=chunk_size,
+    )
+    assert 0 < sum(projected) == ring_sizes[kept].sum() < 0.5 * len(arrays.coords)
+    assert read_voc(path).names == ["0"] * len(kept)
+
+
+def test_geo_to_voc_s3(
+    tmp_path, monkeypatch, mock_s3, synthetic_ortho, synthetic_geojson
+):
+    local_path = str(tmp_path / "local.xml")
+    geo_to_voc(synthetic_ortho, synthetic_geojson, local_path, rotated=True)
+
+    monkeypatch.chdir(tmp_path)
+    geo_to_voc(
+        synthetic_ortho,
+        synthetic_geojson,
+        f"s3://{TEST_BUCKET}/labels/ortho.xml",
+        rotated=True,
+    )
+    body = mock_s3.get_object(Bucket=TEST_BUCKET, Key="labels/ortho.xml")["Body"]
+    with open(local_path, "rb") as f:
+        assert body.read() == f.read()
+    assert sorted(os.listdir(tmp_path)) == ["local.xml", "ortho.tif", "panels.geojson"]
+
+
+@pytest.mark.parametrize("chunk_size", [None, 64])
+def test_geo_to_voc_npz(
+    tmp_path, monkeypatch, mock_s3, synthetic_ortho, mixed_geojson, chunk_size
+):
+    options = dict(
+        class_attribute="class_id", class_mapping={0: "Normal"}, rotated=True
+    )
+    expected = tmp_path / "expected.xml"
+    geo_to_voc(synthetic_ortho, mixed_geojson, str(expected), **options)
+
+    npz_path = str(tmp_path / "ortho.npz")
+    geo_to_voc(
+        synthetic_ortho,
+        mixed_geojson,
+        npz_path,
+        chunk_size=chunk_size,
+        annotation_format="npz",
+        **options,
+    )
+    annotation = read_voc_npz(npz_path)
+    assert np.array_equal(annotation.boxes, read_voc(str(expected)).boxes)
+    npz_to_voc(npz_path, str(tmp_path / "converted.xml"))
+    assert (tmp_path / "converted.xml").read_bytes() == expected.read_bytes()
+
+    # The `.npz` suffix replaces the suffix of local paths too
+    xml_path = tmp_path / "named.xml"
+    geo_to_voc(
+        synthetic_ortho,
+        mixed_geojson,
+        str(xml_path),
+        chunk_size=chunk_size,
+        annotation_format="npz",
+        **options,
+    )
+    assert not xml_path.exists()
+    assert (tmp_path / "named.npz").read_bytes() == (
+        tmp_path / "ortho.npz"
+    ).read_bytes()
+
+    monkeypatch.chdir(tmp_path)
+    geo_to_voc(
+        synthetic_ortho,
+        mixed_geojson,
+        f"s3://{TEST_BUCKET}/labels/ortho.xml",
+        chunk_size=chunk_size,
+        annotation_format="npz",
+        **options,
+    )
+    body = mock_s3.get_object(Bucket=TEST_BUCKET, Key="labels/ortho.npz")["Body"]
+    with open(npz_path, "rb") as f:
+        assert body.read() == f.read()
+
+    with pytest.raises(ValueError):
+        geo_to_voc(
+            synthetic_ortho, mixed_geojson, npz_path, annotation_format="parquet"
+        )
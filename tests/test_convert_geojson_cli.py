@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from ml_dronebase_data_utils.convert_geojson_cli import run_geojson_conversion
+
+from .conftest import make_ortho, make_panels
+
+
+@pytest.fixture
+def batch_dirs(tmp_path):
+    ortho_dir = tmp_path / "orthos"
+    geojson_dir = tmp_path / "geojsons"
+    save_dir = tmp_path / "annotations"
+    for d in (ortho_dir, geojson_dir, save_dir):
+        d.mkdir()
+    for idx in range(3):
+        make_ortho(str(ortho_dir / f"site_{idx}.tif"))
+        make_panels(20, seed=idx).to_file(
+            str(geojson_dir / f"site_{idx}.geojson"), driver="GeoJSON"
+        )
+    return ortho_dir, geojson_dir, save_dir
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_conversion(batch_dirs, workers):
+    ortho_dir, geojson_dir, save_dir = batch_dirs
+    result = run_geojson_conversion(
+        ortho_path=str(ortho_dir),
+        geojson=str(geojson_dir),
+        save_path=str(save_dir),
+        batch=True,
+        workers=workers,
+    )
+    assert result == 0
+    assert sorted(os.listdir(save_dir)) == [f"site_{idx}.xml" for idx in range(3)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_conversion_failures(batch_dirs, workers):
+    ortho_dir, geojson_dir, save_dir = batch_dirs
+    (geojson_dir / "site_1.geojson").write_text("not a geojson")
+    result = run_geojson_conversion(
+        ortho_path=str(ortho_dir),
+        geojson=str(geojson_dir),
+        save_path=str(save_dir),
+        batch=True,
+        workers=workers,
+    )
+    assert result == 3
+    assert sorted(os.listdir(save_dir)) == ["site_0.xml", "site_2.xml"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_conversion_stats(tmp_path, batch_dirs, workers):
+    ortho_dir, geojson_dir, save_dir = batch_dirs
+    stats_path = tmp_path / "stats.json"
+    result = run_geojson_conversion(
+        ortho_path=str(ortho_dir),
+        geojson=str(geojson_dir),
+        save_path=str(save_dir),
+        batch=True,
+        workers=workers,
+        stats=str(stats_path),
+    )
+    assert result == 0
+    report = json.loads(stats_path.read_text())
+    assert sorted(report["files"]) == [
+        str(ortho_dir / f"site_{idx}.tif") for idx in range(3)
+    ]
+    assert report["total"]["counts"]["files"] == 3
+    assert report["total"]["counts"]["features"] == 60
+    assert report["total"]["timings"]["geojson.read"] == pytest.approx(
+        sum(f["timings"]["geojson.read"] for f in report["files"].values())
+    )
@@ -0,0 +1,70 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Generous upper bound, importing box_utils should only cost about as much as numpy
+BOX_UTILS_IMPORT_SECONDS = 1.0
+HEAVY_MODULES = [
+    "boto3",
+    "geopandas",
+    "jinja2",
+    "PIL",
+    "rasterio",
+    "shapely",
+    "sklearn",
+]
+
+_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def _import_in_fresh_interpreter(module: str) -> dict:
+    script = _SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)
+
+
+def test_box_utils_import_time():
+    # Best of a few runs so a busy machine doesn't make the test flaky
+    results = [
+        _import_in_fresh_interpreter("ml_dronebase_data_utils.box_utils")
+        for _ in range(3)
+    ]
+    assert results[0]["loaded"] == []
+    assert min(r["elapsed"] for r in results) < BOX_UTILS_IMPORT_SECONDS
+
+
+@pytest.mark.parametrize(
+    "module, allowed",
+    [
+        ("ml_dronebase_data_utils", []),
+        ("ml_dronebase_data_utils.s3", []),
+        ("ml_dronebase_data_utils.pascal_voc", []),
+        ("ml_dronebase_data_utils.visualize", ["PIL"]),
+    ],
+)
+def test_lazy_imports(module, allowed):
+    loaded = _import_in_fresh_interpreter(module)["loaded"]
+    assert loaded == allowed
+
+
+def test_submodule_attribute_access():
+    import ml_dronebase_data_utils
+
+    assert ml_dronebase_data_utils.box_utils.vertices_to_boxes is not None
+    assert "pascal_voc" in dir(ml_dronebase_data_utils)
+    with pytest.raises(AttributeError):
+        ml_dronebase_data_utils.not_a_module
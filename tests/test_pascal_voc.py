@@ -1,6 +1,64 @@
+import io
+from pathlib import Path
 from tempfile import NamedTemporaryFile
 
-from ml_dronebase_data_utils.pascal_voc import PascalVOCWriter
+import boto3
+import numpy as np
+import pytest
+from moto import mock_aws
+
+from ml_dronebase_data_utils import s3
+from ml_dronebase_data_utils.pascal_voc import (
+    PascalVOCStreamWriter,
+    PascalVOCWriter,
+    _get_template,
+    npz_to_voc,
+    read_voc,
+    read_voc_dir,
+    read_voc_npz,
+    voc_to_npz,
+    write_voc_npz,
+)
+
+EXPECTED = """<annotation>
+    <folder>images</folder>
+    <filename>ortho.tif</filename>
+    <path>/data/images/ortho.tif</path>
+    <source>
+        <database>Unknown</database>
+    </source>
+    <size>
+        <width>128</width>
+        <height>64</height>
+        <depth>3</depth>
+    </size>
+    <segmented>0</segmented>
+    <object>
+        <name>test</name>
+        <pose>Unspecified</pose>
+        <truncated>0</truncated>
+        <difficult>0</difficult>
+        <bndbox>
+            <xmin>0</xmin>
+            <ymin>0</ymin>
+            <xmax>10</xmax>
+            <ymax>10</ymax>
+            <angle>Unspecified</angle>
+        </bndbox>
+    </object>    <object>
+        <name>3</name>
+        <pose>Unspecified</pose>
+        <truncated>1</truncated>
+        <difficult>0</difficult>
+        <bndbox>
+            <xmin>1.5</xmin>
+            <ymin>2.25</ymin>
+            <xmax>3.0</xmax>
+            <ymax>4.0</ymax>
+            <angle>-45.5</angle>
+        </bndbox>
+    </object>
+</annotation>"""
 
 
 def test_writer():
@@ -8,3 +66,282 @@ def test_writer():
         writer = PascalVOCWriter(path=f.name, width=128, height=128)
         writer.addObject(name="test", xmin=0, ymin=0, xmax=10, ymax=10)
         writer.save(annotation_path=f.name)
+
+
+def test_writer_output():
+    writer = PascalVOCWriter(path="/data/images/ortho.tif", width=128, height=64)
+    writer.addObject(name="test", xmin=0, ymin=0, xmax=10, ymax=10)
+    writer.addObjects([3], np.array([[1.5, 2.25, 3.0, 4.0, -45.5]]), truncated=[1])
+    buffer = io.StringIO()
+    writer.save(buffer)
+    assert buffer.getvalue() == EXPECTED
+
+    stream = io.StringIO()
+    with PascalVOCStreamWriter(
+        stream, path="/data/images/ortho.tif", width=128, height=64
+    ) as stream_writer:
+        stream_writer.addObject(name="test", xmin=0, ymin=0, xmax=10, ymax=10)
+        stream_writer.addObjects(
+            np.array([3]), np.array([[1.5, 2.25, 3.0, 4.0, -45.5]]), truncated=1
+        )
+    assert stream.getvalue() == EXPECTED
+
+
+def test_writer_matches_template(tmp_path):
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 1000, (5000, 5))
+    names = rng.choice(["panel", "Hot Cell", "Diode"], 5000)
+
+    objects = [
+        {
+            "name": name,
+            "xmin": box[0],
+            "ymin": box[1],
+            "xmax": box[2],
+            "ymax": box[3],
+            "angle": box[4],
+            "pose": "Unspecified",
+            "truncated": 0,
+            "difficult": 0,
+        }
+        for name, box in zip(names, boxes)
+    ]
+    writer = PascalVOCWriter(path="ortho.tif", width=1000, height=1000)
+    expected = _get_template().render(
+        **{**writer.template_parameters, "objects": objects}
+    )
+
+    writer.addObjects(names, boxes)
+    writer.save(str(tmp_path / "batch.xml"))
+    with open(tmp_path / "batch.xml") as f:
+        assert f.read() == expected
+
+    with PascalVOCStreamWriter(
+        str(tmp_path / "stream.xml"), path="ortho.tif", width=1000, height=1000
+    ) as stream_writer:
+        for i in range(0, 5000, 1000):
+            stream_writer.addObjects(names[i : i + 1000], boxes[i : i + 1000])
+    with open(tmp_path / "stream.xml") as f:
+        assert f.read() == expected
+
+
+def test_stream_writer_abort(tmp_path, monkeypatch):
+    def write_and_fail(destination):
+        with PascalVOCStreamWriter(
+            destination, path="ortho.tif", width=10, height=10
+        ) as writer:
+            writer.addObjects("panel", np.ones((3, 4)))
+            raise RuntimeError("conversion failed")
+
+    path = tmp_path / "ortho.xml"
+    with pytest.raises(RuntimeError):
+        write_and_fail(str(path))
+    assert not path.exists()
+
+    stream = io.StringIO()
+    with pytest.raises(RuntimeError):
+        write_and_fail(stream)
+    assert "<object>" in stream.getvalue()
+    assert "</annotation>" not in stream.getvalue()
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3._get_client.cache_clear()
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="annotations")
+        with pytest.raises(RuntimeError):
+            write_and_fail("s3://annotations/ortho.xml")
+        assert "Contents" not in client.list_objects_v2(Bucket="annotations")
+    s3._get_client.cache_clear()
+
+
+def test_writer_axis_aligned_boxes():
+    writer = PascalVOCWriter(path="ortho.tif", width=10, height=10)
+    writer.addObjects("panel", np.array([[1, 2, 3, 4]]))
+    buffer = io.StringIO()
+    writer.save(buffer)
+    assert "<xmin>1</xmin>" in buffer.getvalue()
+    assert "<angle>Unspecified</angle>" in buffer.getvalue()
+
+
+def test_writer_mixed_names():
+    writer = PascalVOCWriter(path="ortho.tif", width=10, height=10)
+    writer.addObjects([1, float("nan"), "panel"], np.zeros((3, 4)))
+    buffer = io.StringIO()
+    writer.save(buffer)
+    assert read_voc(io.StringIO(buffer.getvalue())).names == ["1", "nan", "panel"]
+
+
+def test_read_voc():
+    annotation = read_voc(io.BytesIO(EXPECTED.encode()))
+    assert annotation.header == {
+        "folder": "images",
+        "filename": "ortho.tif",
+        "path": "/data/images/ortho.tif",
+        "database": "Unknown",
+        "width": 128,
+        "height": 64,
+        "depth": 3,
+        "segmented": 0,
+    }
+    assert annotation.boxes.tolist() == [
+        [0, 0, 10, 10, 0],
+        [1.5, 2.25, 3.0, 4.0, -45.5],
+    ]
+    assert annotation.classes == ["test", "3"]
+    assert annotation.names == ["test", "3"]
+    assert annotation.truncated.tolist() == [0, 1]
+    assert annotation.difficult.tolist() == [0, 0]
+
+    axis_aligned = read_voc(io.BytesIO(EXPECTED.encode()), rotated=False)
+    assert axis_aligned.boxes.shape == (2, 4)
+
+
+def test_read_voc_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 1000, (5000, 5))
+    names = rng.choice(["panel", "Hot Cell", "Diode"], 5000)
+    writer = PascalVOCWriter(path="ortho.tif", width=1000, height=1000)
+    difficult = rng.integers(0, 2, 5000)
+    writer.addObjects(names, boxes, difficult=difficult)
+    writer.save(str(tmp_path / "batch.xml"))
+
+    annotation = read_voc(str(tmp_path / "batch.xml"), classes=["Diode"])
+    assert np.array_equal(annotation.boxes, boxes)
+    assert annotation.classes[0] == "Diode"
+    assert annotation.names == names.tolist()
+    assert np.array_equal(annotation.difficult, difficult)
+
+
+def test_read_voc_empty():
+    writer = PascalVOCWriter(path="ortho.tif", width=10, height=10)
+    buffer = io.StringIO()
+    writer.save(buffer)
+    annotation = read_voc(io.BytesIO(buffer.getvalue().encode()))
+    assert annotation.boxes.shape == (0, 4)
+    assert annotation.class_ids.shape == (0,)
+    assert annotation.classes == []
+
+
+def _write_annotations(directory):
+    paths = []
+    for idx, names in enumerate([["b", "a"], ["c"], ["a", "c"]]):
+        writer = PascalVOCWriter(path=f"{idx}.tif", width=10, height=10)
+        writer.addObjects(names, np.ones((len(names), 4)))
+        paths.append(str(directory / f"{idx}.xml"))
+        writer.save(paths[-1])
+    return paths
+
+
+def test_read_voc_dir(tmp_path):
+    paths = _write_annotations(tmp_path)
+    (tmp_path / "notes.txt").write_text("not an annotation")
+
+    annotations = read_voc_dir(str(tmp_path), max_workers=2)
+    assert list(annotations) == paths
+    shared = annotations[paths[0]].classes
+    assert shared == ["b", "a", "c"]
+    for path, expected in zip(paths, [["b", "a"], ["c"], ["a", "c"]]):
+        assert annotations[path].classes is shared
+        assert annotations[path].names == expected
+
+
+def test_read_voc_s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3._get_client.cache_clear()
+    paths = _write_annotations(tmp_path)
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="annotations")
+        for path in paths:
+            client.upload_file(path, "annotations", f"labels/{Path(path).name}")
+
+        annotation = read_voc("s3://annotations/labels/0.xml")
+        assert annotation.names == ["b", "a"]
+        annotations = read_voc_dir("s3://annotations/labels/", classes=["c"])
+        assert list(annotations) == [
+            "s3://annotations/labels/0.xml",
+            "s3://annotations/labels/1.xml",
+            "s3://annotations/labels/2.xml",
+        ]
+        assert annotations["s3://annotations/labels/0.xml"].classes == ["c", "b", "a"]
+    s3._get_client.cache_clear()
+
+
+def test_voc_npz_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    writer = PascalVOCWriter(path="images/ortho.tif", width=1000, height=800)
+    writer.addObjects(
+        rng.choice(["panel", "Hot Cell"], 500),
+        rng.uniform(0, 1000, (500, 5)),
+        truncated=rng.integers(0, 2, 500),
+    )
+    writer.addObject("Diode", 1, 2, 3, 4, difficult=1)
+    xml_path = str(tmp_path / "ortho.xml")
+    writer.save(xml_path)
+
+    assert voc_to_npz(xml_path) == str(tmp_path / "ortho.npz")
+    expected = read_voc(xml_path)
+    annotation = read_voc_npz(str(tmp_path / "ortho.npz"))
+    assert annotation.header == expected.header
+    assert annotation.classes == expected.classes
+    assert sorted(annotation.classes) == ["Diode", "Hot Cell", "panel"]
+    assert annotation.class_ids.dtype == np.int32
+    assert annotation.truncated.dtype == annotation.difficult.dtype == np.uint8
+    for field in ("boxes", "class_ids", "truncated", "difficult"):
+        assert np.array_equal(getattr(annotation, field), getattr(expected, field))
+
+    # Columns are read-only views of the file
+    assert isinstance(annotation.boxes, np.memmap)
+    assert not annotation.boxes.flags.writeable
+    in_memory = read_voc_npz(str(tmp_path / "ortho.npz"), mmap=False)
+    assert np.array_equal(in_memory.boxes, annotation.boxes)
+    with np.load(str(tmp_path / "ortho.npz")) as npz:
+        assert np.array_equal(npz["boxes"], expected.boxes)
+
+    npz_to_voc(str(tmp_path / "ortho.npz"), str(tmp_path / "converted.xml"))
+    converted = read_voc(str(tmp_path / "converted.xml"))
+    assert converted.header == expected.header
+    assert np.array_equal(converted.boxes, expected.boxes)
+    assert converted.names == expected.names
+
+
+def test_writer_to_annotation(tmp_path):
+    writer = PascalVOCWriter(path="ortho.tif", width=10, height=10)
+    buffer = io.BytesIO()
+    write_voc_npz(writer.to_annotation(), buffer)
+    buffer.seek(0)
+    empty = read_voc_npz(buffer)
+    assert empty.boxes.shape == (0, 4)
+    assert empty.classes == []
+
+    writer.addObjects([1, 2, 1], np.arange(12).reshape(3, 4))
+    writer.save(str(tmp_path / "expected.xml"))
+    write_voc_npz(writer.to_annotation(), str(tmp_path / "ints.npz"))
+    assert read_voc_npz(str(tmp_path / "ints.npz")).classes == ["1", "2"]
+    # Integer boxes are kept as is, the xml written back is the same
+    npz_to_voc(str(tmp_path / "ints.npz"))
+    assert (tmp_path / "ints.xml").read_text() == (
+        tmp_path / "expected.xml"
+    ).read_text()
+
+
+def test_read_voc_npz_s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3._get_client.cache_clear()
+    paths = _write_annotations(tmp_path)
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="annotations")
+        assert (
+            voc_to_npz(paths[0], "s3://annotations/0.npz") == "s3://annotations/0.npz"
+        )
+        annotation = read_voc_npz("s3://annotations/0.npz")
+        assert annotation.names == ["b", "a"]
+        assert annotation.boxes.shape == (2, 4)
+    s3._get_client.cache_clear()
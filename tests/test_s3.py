@@ -1,8 +1,36 @@
 import glob
+import io
 import os
 import shutil
 
-from ml_dronebase_data_utils.s3 import list_prefix, sync_dir
+import pytest
+
+from ml_dronebase_data_utils import s3
+from ml_dronebase_data_utils.s3 import (
+    SyncResult,
+    delete_missing_pairs,
+    download_dir,
+    gdal_path,
+    iter_objects,
+    iter_prefixes,
+    list_prefix,
+    move_files,
+    open_url,
+    pair_files,
+    split_dataset,
+    sync_dir,
+    upload_dir,
+    upload_file,
+)
+
+from .conftest import TEST_BUCKET
+
+
+def _write_files(directory, count: int, size: int = 16):
+    os.makedirs(directory, exist_ok=True)
+    for idx in range(count):
+        with open(os.path.join(directory, f"image_{idx:03d}.png"), "wb") as f:
+            f.write(bytes([idx % 256]) * size)
 
 
 def test_imports():
@@ -41,3 +69,370 @@ def test_sync():
 
     # Remove synced dir locally
     shutil.rmtree("solar-panel-dataset-v2")
+
+
+def test_upload_download_dir(mock_s3, tmp_path):
+    _write_files(tmp_path / "upload", 50)
+    upload_dir(str(tmp_path / "upload"), f"s3://{TEST_BUCKET}/images", max_workers=4)
+
+    keys = [
+        obj["Key"] for obj in mock_s3.list_objects_v2(Bucket=TEST_BUCKET)["Contents"]
+    ]
+    assert len(keys) == 50
+    assert all(k.startswith("images/") for k in keys)
+
+    download_dir(
+        f"s3://{TEST_BUCKET}/images/", str(tmp_path / "download"), max_workers=4
+    )
+    downloaded = sorted(os.listdir(tmp_path / "download"))
+    assert downloaded == sorted(os.listdir(tmp_path / "upload"))
+    with open(tmp_path / "download" / "image_007.png", "rb") as f:
+        assert f.read() == bytes([7]) * 16
+
+
+def test_upload_dir_exist_ok(mock_s3, tmp_path):
+    _write_files(tmp_path / "upload", 3)
+    mock_s3.put_object(Bucket=TEST_BUCKET, Key="images/image_000.png", Body=b"old")
+    upload_dir(str(tmp_path / "upload"), f"s3://{TEST_BUCKET}/images", exist_ok=True)
+    body = mock_s3.get_object(Bucket=TEST_BUCKET, Key="images/image_000.png")["Body"]
+    assert body.read() == b"old"
+
+    upload_dir(str(tmp_path / "upload"), f"s3://{TEST_BUCKET}/images", exist_ok=False)
+    body = mock_s3.get_object(Bucket=TEST_BUCKET, Key="images/image_000.png")["Body"]
+    assert body.read() == bytes([0]) * 16
+
+
+def test_download_dir_size_limit_multipart(mock_s3, tmp_path):
+    _write_files(tmp_path / "upload", 2, size=6 * 1024 * 1024)
+    _write_files(tmp_path / "upload" / "small", 2)
+    for filename in os.listdir(tmp_path / "upload"):
+        path = tmp_path / "upload" / filename
+        if path.is_file():
+            upload_file(str(path), f"s3://{TEST_BUCKET}/large/{filename}")
+    upload_dir(str(tmp_path / "upload" / "small"), f"s3://{TEST_BUCKET}/large/small")
+
+    download_dir(
+        f"s3://{TEST_BUCKET}/large",
+        str(tmp_path / "download"),
+        size_limit=1024,
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024,
+    )
+    assert os.listdir(tmp_path / "download") == ["small"]
+    assert len(os.listdir(tmp_path / "download" / "small")) == 2
+
+    download_dir(
+        f"s3://{TEST_BUCKET}/large",
+        str(tmp_path / "download"),
+        multipart_threshold=5 * 1024 * 1024,
+        multipart_chunksize=5 * 1024 * 1024,
+    )
+    assert os.path.getsize(tmp_path / "download" / "image_001.png") == 6 * 1024 * 1024
+
+
+def test_download_dir_errors_are_raised(mock_s3, tmp_path):
+    mock_s3.put_object(Bucket=TEST_BUCKET, Key="images/a.png", Body=b"a")
+    with pytest.raises(Exception):
+        download_dir(f"s3://{TEST_BUCKET}/images", "/dev/null/not-a-dir")
+
+
+def test_sync_dir_local_to_s3_to_local(mock_s3, tmp_path):
+    _write_files(tmp_path / "local" / "nested", 3)
+    _write_files(tmp_path / "local", 2)
+    url = f"s3://{TEST_BUCKET}/synced"
+
+    dry_run = sync_dir(str(tmp_path / "local"), url, dry_run=True)
+    assert isinstance(dry_run, SyncResult)
+    assert dry_run.files_transferred == 5
+    assert mock_s3.list_objects_v2(Bucket=TEST_BUCKET)["KeyCount"] == 0
+
+    uploaded = sync_dir(str(tmp_path / "local"), url)
+    assert uploaded.files_transferred == 5
+    assert uploaded.bytes_transferred == 5 * 16
+    assert "nested/image_002.png" in uploaded.transferred
+
+    # Nothing changed, nothing to transfer
+    assert sync_dir(str(tmp_path / "local"), url).files_transferred == 0
+
+    downloaded = sync_dir(url, str(tmp_path / "copy"))
+    assert downloaded.files_transferred == 5
+    assert sorted(os.listdir(tmp_path / "copy" / "nested")) == sorted(
+        os.listdir(tmp_path / "local" / "nested")
+    )
+    second = sync_dir(url, str(tmp_path / "copy"))
+    assert second.files_transferred == 0
+    assert second.skipped == 5
+
+    # A changed size is picked up
+    with open(tmp_path / "local" / "image_000.png", "wb") as f:
+        f.write(b"changed")
+    assert sync_dir(str(tmp_path / "local"), url).transferred == ["image_000.png"]
+    assert sync_dir(url, str(tmp_path / "copy")).transferred == ["image_000.png"]
+    with open(tmp_path / "copy" / "image_000.png", "rb") as f:
+        assert f.read() == b"changed"
+
+
+def test_sync_dir_s3_to_s3(mock_s3):
+    for idx in range(3):
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=f"src/{idx}.txt", Body=b"x" * idx)
+    mock_s3.put_object(Bucket=TEST_BUCKET, Key="dst/0.txt", Body=b"")
+    mock_s3.put_object(Bucket=TEST_BUCKET, Key="dst/1.txt", Body=b"y")
+
+    result = sync_dir(f"s3://{TEST_BUCKET}/src", f"s3://{TEST_BUCKET}/dst/")
+    assert result.transferred == ["1.txt", "2.txt"]
+    assert result.skipped == 1
+    body = mock_s3.get_object(Bucket=TEST_BUCKET, Key="dst/1.txt")["Body"]
+    assert body.read() == b"x"
+
+
+def test_sync_dir_s3_to_s3_large_objects(mock_s3):
+    from boto3.s3.transfer import TransferConfig
+
+    size = 10 * 1024 * 1024
+    mock_s3.put_object(Bucket=TEST_BUCKET, Key="src/big.bin", Body=b"b" * size)
+    # Uploaded in parts, its ETag isn't the MD5 of the data
+    mock_s3.upload_fileobj(
+        io.BytesIO(b"m" * size),
+        TEST_BUCKET,
+        "src/multipart.bin",
+        Config=TransferConfig(multipart_threshold=5 * 1024 * 1024),
+    )
+
+    first = sync_dir(f"s3://{TEST_BUCKET}/src", f"s3://{TEST_BUCKET}/dst")
+    assert first.transferred == ["big.bin", "multipart.bin"]
+    second = sync_dir(f"s3://{TEST_BUCKET}/src", f"s3://{TEST_BUCKET}/dst")
+    assert second.transferred == []
+    assert second.skipped == 2
+
+
+def test_sync_dir_local_to_local(tmp_path):
+    with pytest.raises(ValueError):
+        sync_dir(str(tmp_path / "a"), str(tmp_path / "b"))
+
+
+def _keys(client, prefix: str):
+    paginator = client.get_paginator("list_objects_v2")
+    return sorted(
+        obj["Key"]
+        for page in paginator.paginate(Bucket=TEST_BUCKET, Prefix=prefix)
+        for obj in page.get("Contents", [])
+    )
+
+
+def test_move_files(mock_s3):
+    for idx in range(5):
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=f"a/{idx}.png", Body=b"x")
+    move_files(TEST_BUCKET, "b", [f"a/{idx}.png" for idx in range(3)])
+    assert _keys(mock_s3, "a/") == ["a/3.png", "a/4.png"]
+    assert _keys(mock_s3, "b/") == ["b/0.png", "b/1.png", "b/2.png"]
+
+
+def test_move_files_journal(mock_s3, tmp_path):
+    for idx in range(5):
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=f"a/{idx}.png", Body=b"x")
+    journal_path = str(tmp_path / "move.journal")
+    files = [f"a/{idx}.png" for idx in range(3)]
+    move_files(TEST_BUCKET, "b", files, journal_path=journal_path)
+    # Running the same move again is a no-op
+    move_files(TEST_BUCKET, "b", files, journal_path=journal_path)
+    assert _keys(mock_s3, "b/") == ["b/0.png", "b/1.png", "b/2.png"]
+
+    with pytest.raises(ValueError, match="different move"):
+        move_files(TEST_BUCKET, "b", ["a/3.png"], journal_path=journal_path)
+    assert _keys(mock_s3, "a/") == ["a/3.png", "a/4.png"]
+
+
+def test_move_files_duplicate_names(mock_s3):
+    keys = ["a/img.png", "a/nested/img.png", "a/other.png"]
+    for key in keys:
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=key, Body=key.encode())
+    with pytest.raises(ValueError, match="img.png"):
+        move_files(TEST_BUCKET, "b", keys)
+    assert _keys(mock_s3, "a/") == keys
+    assert _keys(mock_s3, "b/") == []
+
+
+def test_split_dataset_resume(mock_s3, tmp_path, monkeypatch):
+    for idx in range(40):
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=f"ds/images/{idx}.png", Body=b"i")
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=f"ds/labels/{idx}.xml", Body=b"l")
+    journal_path = str(tmp_path / "split.journal")
+
+    # Interrupt the split after a few copies
+    client = s3.get_client()
+    copy_object = client.copy_object
+    calls = []
+
+    def flaky_copy_object(**kwargs):
+        calls.append(kwargs)
+        if len(calls) > 10:
+            raise KeyboardInterrupt()
+        return copy_object(**kwargs)
+
+    monkeypatch.setattr(client, "copy_object", flaky_copy_object)
+    with pytest.raises(KeyboardInterrupt):
+        split_dataset(
+            f"s3://{TEST_BUCKET}/ds/images/",
+            labels_url=f"s3://{TEST_BUCKET}/ds/labels/",
+            train_split=0.5,
+            val_split=0.5,
+            journal_path=journal_path,
+            max_workers=1,
+        )
+    monkeypatch.setattr(client, "copy_object", copy_object)
+    assert len(_keys(mock_s3, "ds/images/")) == 40
+
+    split_dataset(
+        f"s3://{TEST_BUCKET}/ds/images/",
+        labels_url=f"s3://{TEST_BUCKET}/ds/labels/",
+        train_split=0.5,
+        val_split=0.5,
+        journal_path=journal_path,
+    )
+    assert _keys(mock_s3, "ds/images/") == []
+    assert _keys(mock_s3, "ds/labels/") == []
+
+    images = {}
+    labels = {}
+    for split, count in (("train", 20), ("val", 10), ("test", 10)):
+        images[split] = _keys(mock_s3, f"ds/{split}/images/")
+        labels[split] = _keys(mock_s3, f"ds/{split}/labels/")
+        assert len(images[split]) == count
+        assert len(labels[split]) == count
+    all_images = sorted(os.path.basename(k) for v in images.values() for k in v)
+    assert all_images == sorted(f"{idx}.png" for idx in range(40))
+
+
+def test_pair_files():
+    images = ["data/img_1.png", "data/img_10.png", "data/img_2.png", "data/img_3.png"]
+    labels = ["labels/img_10.xml", "labels/img_2.xml", "labels/img_4.xml"]
+    result = pair_files(images, labels)
+    assert result.pairs == [
+        ("data/img_10.png", "labels/img_10.xml"),
+        ("data/img_2.png", "labels/img_2.xml"),
+    ]
+    # img_1 is a prefix of img_10 but has no label of its own
+    assert result.input_orphans == ["data/img_1.png", "data/img_3.png"]
+    assert result.pair_orphans == ["labels/img_4.xml"]
+
+
+def test_pair_files_key_pattern():
+    images = ["a/0001.png", "a/0002.png"]
+    labels = ["b/0002_label.xml", "b/0001_label.xml"]
+    result = pair_files(images, labels, key_pattern=r"_label$")
+    assert result.pairs == [
+        ("a/0001.png", "b/0001_label.xml"),
+        ("a/0002.png", "b/0002_label.xml"),
+    ]
+    assert result.input_orphans == result.pair_orphans == []
+
+
+def test_delete_missing_pairs():
+    images = ["img_1.png", "img_10.png", "img_2.png"]
+    labels = ["img_10.xml", "img_2.xml"]
+    assert delete_missing_pairs(images, labels) == ["img_10.png", "img_2.png"]
+    assert images == ["img_10.png", "img_2.png"]
+
+
+def test_open_url(mock_s3):
+    data = os.urandom(11 * 1024 * 1024 + 7)
+    url = f"s3://{TEST_BUCKET}/streams/data.bin"
+    with open_url(url, "wb", part_size=5 * 1024 * 1024) as f:
+        for start in range(0, len(data), 1000000):
+            f.write(data[start : start + 1000000])
+
+    with open_url(url) as f:
+        assert f.read(100) == data[:100]
+        f.seek(6 * 1024 * 1024)
+        assert f.read(10) == data[6 * 1024 * 1024 : 6 * 1024 * 1024 + 10]
+        f.seek(-5, os.SEEK_END)
+        assert f.read() == data[-5:]
+        f.seek(10)
+        assert f.read(3) == data[10:13]
+
+    with open_url(f"s3://{TEST_BUCKET}/streams/text.txt", "w") as f:
+        f.write("héllo\n")
+    with open_url(f"s3://{TEST_BUCKET}/streams/text.txt", "r") as f:
+        assert f.read() == "héllo\n"
+
+
+@pytest.mark.parametrize("size", [10, 6 * 1024 * 1024])
+def test_open_url_abort(mock_s3, size: int):
+    with pytest.raises(RuntimeError):
+        with open_url(
+            f"s3://{TEST_BUCKET}/aborted", "wb", part_size=5 * 1024 * 1024
+        ) as f:
+            f.write(b"x" * size)
+            raise RuntimeError()
+    assert "Contents" not in mock_s3.list_objects_v2(Bucket=TEST_BUCKET)
+    assert "Uploads" not in mock_s3.list_multipart_uploads(Bucket=TEST_BUCKET)
+
+
+def test_gdal_path():
+    assert gdal_path("s3://bucket/orthos/a.tif") == "/vsis3/bucket/orthos/a.tif"
+    assert gdal_path("/data/a.tif") == "/data/a.tif"
+
+
+def test_iter_objects(mock_s3):
+    for key in ["data/a.png", "data/sub/b.png", "data/sub/c.png", "other/d.png"]:
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=key, Body=b"abc")
+
+    objects = list(iter_objects(f"s3://{TEST_BUCKET}/data/"))
+    assert [obj.key for obj in objects] == [
+        "data/a.png",
+        "data/sub/b.png",
+        "data/sub/c.png",
+    ]
+    assert all(obj.size == 3 and obj.etag and obj.last_modified > 0 for obj in objects)
+    assert list(iter_prefixes(f"s3://{TEST_BUCKET}/data/")) == ["data/sub/"]
+
+    # Empty listings don't have Contents or CommonPrefixes
+    assert list(iter_objects(f"s3://{TEST_BUCKET}/missing/")) == []
+    assert list_prefix(f"s3://{TEST_BUCKET}/missing/", filter_files=True) == []
+    assert list_prefix(f"s3://{TEST_BUCKET}/missing/", filter_prefixes=True) == []
+    assert list_prefix(f"s3://{TEST_BUCKET}/data/") == [
+        f"s3://{TEST_BUCKET}/data/a.png",
+        f"s3://{TEST_BUCKET}/data/sub/b.png",
+        f"s3://{TEST_BUCKET}/data/sub/c.png",
+        f"s3://{TEST_BUCKET}/data/sub/",
+    ]
+
+
+@pytest.mark.parametrize("prefix", ["data/", "data/" + "long" * 100 + "/"])
+def test_listing_cache(tmp_path, mock_s3, prefix: str):
+    url = f"s3://{TEST_BUCKET}/{prefix}"
+    for name in ["a.png", "b.png", "sub/c.png"]:
+        mock_s3.put_object(Bucket=TEST_BUCKET, Key=prefix + name, Body=b"abc")
+    options = dict(cache_ttl=3600, cache_dir=str(tmp_path))
+    expected = list(iter_objects(url))
+    assert list(iter_objects(url, **options)) == expected
+    assert list_prefix(url, filter_prefixes=True, **options) == [url + "sub/"]
+
+    # Changes made outside of this module are only seen once the cache expires
+    mock_s3.delete_object(Bucket=TEST_BUCKET, Key=prefix + "a.png")
+    assert list(iter_objects(url, **options)) == expected
+    assert list(iter_objects(url, cache_ttl=0, cache_dir=str(tmp_path))) == expected[1:]
+
+    # Writes made with this module invalidate the cached listings
+    with open_url(url + "sub/d.png", "wb") as f:
+        f.write(b"abcd")
+    assert list_prefix(url, filter_files=True, **options) == [
+        url + name for name in ["b.png", "sub/c.png", "sub/d.png"]
+    ]
+    assert len(os.listdir(tmp_path)) == 1
+    s3.invalidate_listings(f"s3://{TEST_BUCKET}/other/", cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    s3.invalidate_listings(f"s3://{TEST_BUCKET}/", cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_listing_cache_invalidated_by_writes(tmp_path, mock_s3):
+    # Listings cached in a custom directory are invalidated too
+    options = dict(filter_files=True, cache_ttl=3600, cache_dir=str(tmp_path))
+    url = f"s3://{TEST_BUCKET}/data/"
+    assert list_prefix(url, **options) == []
+    with open_url(url + "a.txt", "w") as f:
+        f.write("a")
+    assert list_prefix(url, **options) == [url + "a.txt"]
+    move_files(TEST_BUCKET, "data/moved", ["data/a.txt"])
+    assert list_prefix(url, **options) == [url + "moved/a.txt"]
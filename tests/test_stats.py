@@ -0,0 +1,84 @@
+import json
+import logging
+
+from ml_dronebase_data_utils import stats
+from ml_dronebase_data_utils.convert_geojson import geo_to_voc
+from ml_dronebase_data_utils.pascal_voc import read_voc
+from ml_dronebase_data_utils.s3 import open_url
+
+from .conftest import TEST_BUCKET
+
+
+def test_disabled():
+    assert stats.current_stats() is None
+    assert stats.stage("stage") is stats.stage("other")
+    stats.count("ignored")
+    with stats.collect_stats() as collected:
+        pass
+    assert collected.as_dict() == {"timings": {}, "counts": {}}
+
+
+def test_nested_collectors(caplog):
+    reports = []
+    with stats.collect_stats() as total:
+        for idx in range(3):
+            with stats.collect_stats(hook=reports.append) as file_stats:
+                with stats.stage("work"):
+                    stats.count("items", idx + 1)
+            assert file_stats.counts == {"items": idx + 1}
+        stats.count("files", 3)
+    assert [r.counts["items"] for r in reports] == [1, 2, 3]
+    assert total.counts == {"items": 6, "files": 3}
+    assert total.timings["work"] == sum(r.timings["work"] for r in reports)
+
+    with caplog.at_level(logging.INFO):
+        stats.log_stats(total)
+    assert json.loads(caplog.records[-1].getMessage()) == json.loads(total.to_json())
+
+
+def test_geo_to_voc_stats(tmp_path, synthetic_ortho, synthetic_geojson, synthetic_gdf):
+    save_path = str(tmp_path / "ortho.xml")
+    with stats.collect_stats() as collected:
+        geo_to_voc(
+            synthetic_ortho,
+            synthetic_geojson,
+            save_path,
+            class_attribute="class_id",
+            skip_classes=[3],
+        )
+        read_voc(save_path)
+
+    expected_boxes = int((synthetic_gdf["class_id"] != 3).sum())
+    assert collected.counts["files"] == 1
+    assert collected.counts["features"] == len(synthetic_gdf)
+    assert collected.counts["boxes"] == expected_boxes
+    assert collected.counts["voc.objects_written"] == expected_boxes
+    assert collected.counts["voc.objects_read"] == expected_boxes
+    assert set(collected.timings) == {
+        "geo_to_voc",
+        "ortho.open",
+        "geojson.read",
+        "geojson.to_crs",
+        "geojson.pixel_index",
+        "classes.resolve",
+        "boxes.fit",
+        "voc.write",
+        "voc.save",
+        "voc.read",
+    }
+    assert collected.timings["geo_to_voc"] >= collected.timings["geojson.read"]
+
+
+def test_s3_stats(mock_s3):
+    url = f"s3://{TEST_BUCKET}/data.bin"
+    with stats.collect_stats() as collected:
+        with open_url(url, "wb", part_size=5 * 1024 * 1024) as file:
+            file.write(b"x" * (6 * 1024 * 1024))
+        with open_url(url, "rb") as file:
+            file.read()
+    assert collected.counts["s3.bytes_written"] == 6 * 1024 * 1024
+    assert collected.counts["s3.bytes_read"] == 6 * 1024 * 1024
+    assert collected.counts["s3.requests.UploadPart"] == 2
+    assert collected.counts["s3.requests.CompleteMultipartUpload"] == 1
+    assert collected.counts["s3.requests.GetObject"] == 1
+    assert collected.counts["s3.requests"] == 5
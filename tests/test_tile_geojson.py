@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import pytest
+from shapely.geometry import Polygon, box
+
+from ml_dronebase_data_utils.box_utils import (
+    extract_rotated_vertices_batch,
+    vertices_to_rotated_boxes,
+)
+from ml_dronebase_data_utils.pascal_voc import read_voc
+from ml_dronebase_data_utils.tile_geojson import (
+    assign_tiles,
+    geo_to_voc_tiles,
+    tile_windows,
+)
+
+from .conftest import ORTHO_SIZE, TEST_BUCKET
+
+
+def test_tile_windows():
+    windows = tile_windows(1000, 600, 256, 200)
+    assert sorted(set(windows[:, 0].tolist())) == [0, 200, 400, 600, 744]
+    assert sorted(set(windows[:, 1].tolist())) == [0, 200, 344]
+    assert (windows[:, 2:] == 256).all()
+
+    coverage = np.zeros((600, 1000), dtype=bool)
+    for col, row, w, h in windows:
+        coverage[row : row + h, col : col + w] = True
+    assert coverage.all()
+
+    assert tile_windows(100, 50, 256).tolist() == [[0, 0, 100, 50]]
+    with pytest.raises(ValueError):
+        tile_windows(100, 100, 0)
+
+
+def _random_vertices(n: int = 400, size: int = 512) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    boxes = np.stack(
+        (
+            rng.uniform(0, size, n),
+            rng.uniform(0, size, n),
+            rng.uniform(4, 30, n),
+            rng.uniform(10, 60, n),
+            rng.uniform(-90, 90, n),
+        ),
+        axis=1,
+    )
+    return np.round(extract_rotated_vertices_batch(boxes))
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_assign_tiles(rotated: bool):
+    vertices = _random_vertices()
+    names = [f"class {i}" for i in range(len(vertices))]
+    windows = tile_windows(512, 512, 128, 96)
+    tiles = assign_tiles(vertices, names, windows, rotated, min_visibility=0.4)
+    assert len(tiles) == len(windows)
+
+    if rotated:
+        polygons = extract_rotated_vertices_batch(
+            vertices_to_rotated_boxes(vertices), box_mode="XYXYA_ABS"
+        )
+        shapes = [Polygon(p) for p in polygons]
+    else:
+        shapes = [box(*v.min(axis=0), *v.max(axis=0)) for v in vertices]
+
+    for tile, (col, row, w, h) in zip(tiles, windows):
+        window = box(col, row, col + w, row + h)
+        expected = [
+            i
+            for i, shape in enumerate(shapes)
+            if shape.intersects(window)
+            and (
+                window.contains(shape)
+                or (
+                    shape.area > 0
+                    and shape.intersection(window).area / shape.area >= 0.4
+                    and shape.intersection(window).area > 0
+                )
+            )
+        ]
+        assert tile.names == [names[i] for i in expected]
+        truncated = [int(not window.contains(shapes[i])) for i in expected]
+        assert tile.truncated.tolist() == truncated
+        if not rotated and len(expected):
+            clipped = [
+                np.asarray(shapes[i].intersection(window).bounds) for i in expected
+            ]
+            assert np.allclose(tile.boxes, np.asarray(clipped) - (col, row, col, row))
+
+
+@pytest.mark.parametrize("rotated", [False, True])
+def test_geo_to_voc_tiles(tmp_path, synthetic_ortho, synthetic_geojson, rotated: bool):
+    outputs = []
+    for workers in (1, 2):
+        save_path = str(tmp_path / f"tiles_{workers}")
+        chips = geo_to_voc_tiles(
+            synthetic_ortho,
+            synthetic_geojson,
+            save_path,
+            tile_size=200,
+            stride=160,
+            class_attribute="class_id",
+            class_mapping={0: "Normal"},
+            skip_classes=[3],
+            rotated=rotated,
+            workers=workers,
+        )
+        assert len(chips) == len(tile_windows(ORTHO_SIZE, ORTHO_SIZE, 200, 160))
+        annotations = {}
+        for chip in chips:
+            assert os.path.exists(os.path.join(save_path, "images", f"{chip}.png"))
+            annotation = read_voc(os.path.join(save_path, "annotations", f"{chip}.xml"))
+            assert annotation.header["width"] == 200
+            assert annotation.header["filename"] == f"{chip}.png"
+            assert annotation.boxes.shape[1] == (5 if rotated else 4)
+            assert "3" not in annotation.classes
+            annotations[chip] = (annotation.boxes.tolist(), annotation.names)
+        outputs.append(annotations)
+    assert outputs[0] == outputs[1]
+    assert any("Normal" in names for _, names in outputs[0].values())
+
+
+def test_geo_to_voc_tiles_skip_empty(tmp_path, synthetic_ortho, synthetic_geojson):
+    save_path = str(tmp_path / "tiles")
+    chips = geo_to_voc_tiles(
+        synthetic_ortho,
+        synthetic_geojson,
+        save_path,
+        tile_size=64,
+        image_format="tif",
+        skip_empty=True,
+    )
+    assert 0 < len(chips) < len(tile_windows(ORTHO_SIZE, ORTHO_SIZE, 64))
+    for chip in chips:
+        assert len(
+            read_voc(os.path.join(save_path, "annotations", f"{chip}.xml")).boxes
+        )
+    assert sorted(os.listdir(os.path.join(save_path, "images"))) == sorted(
+        f"{chip}.tif" for chip in chips
+    )
+
+
+def test_geo_to_voc_tiles_s3(
+    tmp_path, monkeypatch, mock_s3, synthetic_ortho, synthetic_geojson
+):
+    monkeypatch.chdir(tmp_path)
+    save_path = f"s3://{TEST_BUCKET}/tiles"
+    chips = geo_to_voc_tiles(
+        synthetic_ortho, synthetic_geojson, save_path, tile_size=256
+    )
+    keys = [
+        obj["Key"]
+        for obj in mock_s3.list_objects_v2(Bucket=TEST_BUCKET, Prefix="tiles/")[
+            "Contents"
+        ]
+    ]
+    assert sorted(keys) == sorted(
+        [f"tiles/images/{chip}.png" for chip in chips]
+        + [f"tiles/annotations/{chip}.xml" for chip in chips]
+    )
+    annotation = read_voc(f"{save_path}/annotations/{chips[0]}.xml")
+    assert annotation.header["path"] == f"{save_path}/images/{chips[0]}.png"
+    assert sorted(os.listdir(tmp_path)) == ["ortho.tif", "panels.geojson"]
@@ -1,5 +1,18 @@
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.enums import Resampling
+
+from ml_dronebase_data_utils.pascal_voc import PascalVOCWriter
+from ml_dronebase_data_utils.visualize import (
+    draw_rotated_boxes,
+    draw_rotated_boxes_preview,
+    draw_rotated_boxes_tiled,
+)
 from ml_dronebase_data_utils.visualize_converted_geojson import visualize
 
+from .conftest import ORTHO_SIZE
+
 
 def test_visualization():
     visualize(
@@ -7,3 +20,103 @@ def test_visualization():
         annotation_path="s3://ml-solar-ortho-fault-detection/orthos/annotations/PA140004_Thermal.xml",
         save_path="s3://ml-solar-ortho-fault-detection/orthos/visual_validation/PA140004_Thermal_drawn.png",
     )
+
+
+def _rotated_boxes(n: int = 150, size: int = ORTHO_SIZE) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(-20, size, (n, 2))
+    wh = rng.uniform(5, 60, (n, 2))
+    return np.concatenate((xy, xy + wh, rng.uniform(-90, 90, (n, 1))), axis=1)
+
+
+def test_draw_rotated_boxes_tiled_matches_full_image(tmp_path, synthetic_ortho):
+    boxes = _rotated_boxes()
+    with rasterio.open(synthetic_ortho) as src:
+        image = Image.fromarray(np.moveaxis(src.read(), 0, -1))
+    expected = draw_rotated_boxes(image, boxes, box_mode="XYXYA_ABS")
+
+    save_path = str(tmp_path / "drawn.tif")
+    draw_rotated_boxes_tiled(
+        synthetic_ortho, boxes, save_path, box_mode="XYXYA_ABS", tile_size=100
+    )
+    with rasterio.open(save_path) as drawn, rasterio.open(synthetic_ortho) as src:
+        assert drawn.transform == src.transform
+        assert drawn.crs == src.crs
+        tiled = np.moveaxis(drawn.read(), 0, -1)
+
+    # PIL rasterizes the outlines of boxes crossing a tile edge slightly differently,
+    # the tiles can only differ from the full image right next to an outline.
+    expected = np.asarray(expected)
+    mismatch = (tiled != expected).any(axis=-1)
+    outline = np.pad((expected == (255, 0, 0)).all(axis=-1), 2)
+    near_outline = np.zeros_like(mismatch)
+    for dy in range(5):
+        for dx in range(5):
+            near_outline |= outline[dy : dy + ORTHO_SIZE, dx : dx + ORTHO_SIZE]
+    assert not (mismatch & ~near_outline).any()
+    assert mismatch.mean() < 0.01
+
+
+def test_draw_rotated_boxes_tiled_overview(tmp_path, synthetic_ortho):
+    save_path = str(tmp_path / "drawn.png")
+    boxes = _rotated_boxes()
+    draw_rotated_boxes_tiled(
+        synthetic_ortho,
+        boxes,
+        save_path,
+        classes=[f"class {i % 3}" for i in range(len(boxes))],
+        box_mode="XYXYA_ABS",
+        tile_size=128,
+        overview_size=200,
+    )
+    overview = Image.open(save_path)
+    assert overview.size == (200, 200)
+
+
+def test_visualize_falls_back_to_tiles(tmp_path, synthetic_ortho, monkeypatch):
+    writer = PascalVOCWriter(path=synthetic_ortho, width=ORTHO_SIZE, height=ORTHO_SIZE)
+    writer.addObjects("panel", _rotated_boxes())
+    anno_path = str(tmp_path / "ortho.xml")
+    writer.save(anno_path)
+
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    save_path = str(tmp_path / "ortho_annotated.png")
+    visualize(
+        ortho_path=synthetic_ortho,
+        anno_path=anno_path,
+        save_path=save_path,
+        overview_size=256,
+    )
+    monkeypatch.undo()
+    assert Image.open(save_path).size == (256, 256)
+
+
+def test_draw_rotated_boxes_preview(synthetic_ortho):
+    with rasterio.open(synthetic_ortho, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.average)
+
+    boxes = np.array([[100, 200, 300, 260, 0]], dtype=np.float64)
+    preview = draw_rotated_boxes_preview(
+        synthetic_ortho, boxes, box_mode="XYXYA_ABS", max_size=128, width=1
+    )
+    assert preview.size == (128, 128)
+    red = np.argwhere((np.asarray(preview) == (255, 0, 0)).all(axis=-1))
+    assert red[:, 1].min() == 25 and red[:, 1].max() == 75
+    assert red[:, 0].min() == 50 and red[:, 0].max() == 65
+
+
+def test_visualize_preview(tmp_path, synthetic_ortho):
+    writer = PascalVOCWriter(path=synthetic_ortho, width=ORTHO_SIZE, height=ORTHO_SIZE)
+    writer.addObjects("panel", _rotated_boxes())
+    anno_path = str(tmp_path / "ortho.xml")
+    writer.save(anno_path)
+
+    save_path = str(tmp_path / "ortho_preview.png")
+    visualize(
+        ortho_path=synthetic_ortho,
+        anno_path=anno_path,
+        save_path=save_path,
+        draw_labels=True,
+        preview_size=300,
+    )
+    assert Image.open(save_path).size == (300, 300)